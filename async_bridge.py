@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from config import *
+
+
+class AsyncBridge(QObject):
+    # runs an asyncio loop on a worker thread, results come back to the GUI thread as a signal
+    done_signal = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super(AsyncBridge, self).__init__(parent)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run_loop, daemon=True)
+        self.thread.start()
+
+        self.done_signal.connect(self.dispatch)
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, callback=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if callback is not None:
+            future.add_done_callback(lambda f: self.done_signal.emit(callback, f))
+        return future
+
+    @staticmethod
+    def dispatch(callback, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = SYSTEM_HEADER + f"5 {e}"
+        callback(result)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        self.loop.close()
@@ -0,0 +1,331 @@
+import asyncio
+import re
+import time
+
+from config import *
+from listing import LineSplitter, parse_lines
+from metrics import metrics
+from model import ClientModel
+
+
+class AsyncClientModel(object):
+    # asyncio counterpart of ClientModel, one instance per control connection;
+    # any number of instances can share a single event loop
+    def __init__(self):
+        self.command_reader = None
+        self.command_writer = None
+        self.command_lock = None
+
+        self.status = ClientStatus.DISCONNECT
+
+        self.file_server = None
+        self.file_conn = None
+        self.file_ip = None
+        self.file_port = None
+
+        self.last_response = ''
+
+    # help functions to communicate with server
+    async def push_command(self, command, argu):
+        msg = command
+        if argu is not None:
+            msg += " " + str(argu)
+        msg += CRLF
+        self.command_writer.write(msg.encode())
+        await self.command_writer.drain()
+
+    async def getline(self):
+        line = await self.command_reader.readline()
+        if not line:
+            raise EOFError
+        line = line.decode()
+        if line[-2:] == CRLF:
+            line = line[:-2]
+        elif line[-1:] in CRLF:
+            line = line[:-1]
+        return line
+
+    async def recv_response(self):
+        line = await self.getline()
+        if line[3:4] == '-':
+            code = line[:3]
+            while 1:
+                nextline = await self.getline()
+                line = line + ('\n' + nextline)
+                if nextline[:3] == code and \
+                        nextline[3:4] != '-':
+                    break
+        return line
+
+    async def send_command(self, command, argu=None):
+        async with self.command_lock:
+            start = time.perf_counter()
+            await self.push_command(command, argu)
+            response = SERVER_HEADER + await self.recv_response()
+            if metrics.enabled:
+                metrics.command(command, time.perf_counter() - start, response)
+            return response
+
+    # standard command of FTP
+    async def connect(self, ip, port):
+        if not ClientModel.is_valid_ipv4_by_ip_and_port(ip, port):
+            return SYSTEM_HEADER + "5 invalid ip address."
+
+        try:
+            self.command_reader, self.command_writer = await asyncio.open_connection(ip, int(port))
+        except ConnectionRefusedError:
+            return SYSTEM_HEADER + "5 fail to connect target computer."
+        self.command_lock = asyncio.Lock()
+        self.status = ClientStatus.CONNECT
+
+        response = await self.recv_response()
+        return SERVER_HEADER + response
+
+    async def user(self, username):
+        self.status = ClientStatus.USER
+        return await self.send_command("USER", username)
+
+    async def password(self, password):
+        self.status = ClientStatus.PASS
+        return await self.send_command("PASS", password)
+
+    async def type(self, data_type):
+        return await self.send_command("TYPE", data_type)
+
+    async def mkd(self, dir_name):
+        return await self.send_command("MKD", dir_name)
+
+    async def rnfr(self, old_name):
+        return await self.send_command("RNFR", old_name)
+
+    async def rnto(self, new_name):
+        return await self.send_command("RNTO", new_name)
+
+    async def rmd(self, dir_name):
+        return await self.send_command("RMD", dir_name)
+
+    async def dele(self, file_name):
+        return await self.send_command("DELE", file_name)
+
+    async def size(self, file_name):
+        response = await self.send_command("SIZE", file_name)
+        try:
+            size = int(response.split(' ')[-1])
+        except:
+            size = 0
+        return response, size
+
+    async def pwd(self):
+        response = await self.send_command("PWD")
+        try:
+            path = re.search(r"\".*\"", response).group()[1:-1]
+        except:
+            path = ""
+        return response, path
+
+    async def cwd(self, dir_name):
+        return await self.send_command("CWD", dir_name)
+
+    async def syst(self):
+        return await self.send_command("SYST")
+
+    async def noop(self):
+        return await self.send_command("NOOP")
+
+    async def rest(self, offset):
+        return await self.send_command("REST", offset)
+
+    async def quit(self):
+        response = await self.send_command("QUIT")
+        self.close()
+        return response
+
+    def close(self):
+        # drops the control connection without QUIT
+        self.status = ClientStatus.DISCONNECT
+        if self.command_writer is not None:
+            self.command_writer.close()
+
+    async def port(self):
+        loop = asyncio.get_running_loop()
+        self.file_conn = loop.create_future()
+
+        def on_connect(reader, writer):
+            if self.file_conn is not None and not self.file_conn.done():
+                self.file_conn.set_result((reader, writer))
+            else:
+                writer.close()
+
+        ip = self.command_writer.get_extra_info('sockname')[0]  # Get proper ip
+        try:
+            self.file_server = await asyncio.start_server(on_connect, ip, 0, backlog=1)
+        except OSError:
+            return SERVER_HEADER + "fail to bind socket."
+        port = self.file_server.sockets[0].getsockname()[1]  # Get proper port
+
+        addr = ClientModel.ip_and_port_to_addr(ip, port)
+        response = await self.send_command("PORT", addr)
+        self.status = ClientStatus.PORT
+        return response
+
+    async def pasv(self):
+        response = await self.send_command("PASV")
+        if ClientModel.get_status_code(response)[0] == '5':
+            return response
+        addr = re.search(r"\d{1,3},\d{1,3},\d{1,3},\d{1,3},\d{1,3},\d{1,3}", response).group()
+        if not ClientModel.is_valid_ipv4_by_addr(addr):
+            return SYSTEM_HEADER + "5 invalid ip address."
+        self.file_ip, self.file_port = ClientModel.addr_to_ip_and_port(addr)
+        self.status = ClientStatus.PASV
+        return response
+
+    async def build_transfer_conn(self, msg):
+        self.command_writer.write(msg.encode())
+        await self.command_writer.drain()
+        if self.status == ClientStatus.PORT:
+            try:
+                reader, writer = await self.file_conn
+            finally:
+                self.file_server.close()
+                self.file_server = None
+                self.file_conn = None
+        elif self.status == ClientStatus.PASV:
+            reader, writer = await asyncio.open_connection(self.file_ip, self.file_port)
+        else:
+            raise RuntimeError
+        response = SERVER_HEADER + await self.recv_response()
+        return reader, writer, response
+
+    async def recv_stream(self, command):
+        # async generator over the data connection of RETR/LIST,
+        # the combined server response is left in self.last_response
+        if self.status != ClientStatus.PASV and self.status != ClientStatus.PORT:
+            self.last_response = SYSTEM_HEADER + f"5 {command.split(' ')[0]} require PORT/PASV mode."
+            return
+
+        async with self.command_lock:
+            reader, writer, response = await self.build_transfer_conn(command + CRLF)
+            try:
+                if ClientModel.get_status_code(response)[0] != '5':
+                    while True:
+                        buf = await reader.read(BUF_SIZE)
+                        if not buf:
+                            break
+                        yield buf
+            finally:
+                writer.close()
+                if ClientModel.get_status_code(response)[0] != '5':
+                    response += "\n" + SERVER_HEADER + await self.recv_response()
+                self.last_response = response
+                self.status = ClientStatus.PASS
+
+    def retr(self, filename):
+        return self.recv_stream("RETR " + filename)
+
+    async def list(self, path=None):
+        chunks = []
+        async for buf in self.recv_stream("LIST" + ("" if path is None else " " + path)):
+            chunks.append(buf)
+        return self.last_response, b''.join(chunks).decode()
+
+    async def iter_listing(self, path=None, mlsd=False):
+        # FileEntry records parsed while the listing is still arriving
+        splitter = LineSplitter()
+        command = ("MLSD" if mlsd else "LIST") + ("" if path is None else " " + path)
+        async for buf in self.recv_stream(command):
+            for entry in parse_lines(splitter.feed(buf), mlsd):
+                yield entry
+        for entry in parse_lines(splitter.close(), mlsd):
+            yield entry
+
+    async def send_stream(self, command, source):
+        if self.status != ClientStatus.PASV and self.status != ClientStatus.PORT:
+            return SYSTEM_HEADER + f"5 {command.split(' ')[0]} require PORT/PASV mode."
+
+        async with self.command_lock:
+            reader, writer, response = await self.build_transfer_conn(command + CRLF)
+            try:
+                if ClientModel.get_status_code(response)[0] != '5':
+                    async for buf in self.iter_source(source):
+                        writer.write(buf)
+                        await writer.drain()
+            finally:
+                writer.close()
+                if ClientModel.get_status_code(response)[0] != '5':
+                    response += "\n" + SERVER_HEADER + await self.recv_response()
+                self.status = ClientStatus.PASS
+        return response
+
+    async def stor(self, filename, source):
+        return await self.send_stream("STOR " + filename, source)
+
+    async def appe(self, filename, source):
+        return await self.send_stream("APPE " + filename, source)
+
+    @staticmethod
+    async def iter_source(source):
+        # accept bytes, a binary file object, an async iterable or a plain iterable of bytes
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            yield source
+        elif hasattr(source, 'read'):
+            loop = asyncio.get_running_loop()
+            while True:
+                buf = await loop.run_in_executor(None, source.read, BUF_SIZE)
+                if not buf:
+                    break
+                yield buf
+        elif hasattr(source, '__aiter__'):
+            async for buf in source:
+                yield buf
+        else:
+            for buf in source:
+                yield buf
+
+
+
+class AsyncSessionPool(object):
+    # logged-in AsyncClientModel sessions of one server. They belong to the event
+    # loop that opened them; close() may be called from any thread
+    def __init__(self, login_info, max_size=POOL_MAX_SIZE):
+        self.login_info = login_info
+        self.max_size = max_size
+        self.idle = []
+        self.loop = None
+        self.closed = False
+
+    async def acquire(self):
+        # a session, None when the server refuses one
+        self.loop = asyncio.get_running_loop()
+        while self.idle:
+            session = self.idle.pop()
+            if session.status != ClientStatus.DISCONNECT:
+                return session
+
+        host, port, username, password = self.login_info
+        session = AsyncClientModel()
+        try:
+            response = await session.connect(host, port)
+            if ClientModel.get_status_code(response)[0] == '5':
+                return None
+            for command, argu in ((session.user, username), (session.password, password)):
+                response = await command(argu)
+                if ClientModel.get_status_code(response)[0] == '5':
+                    session.close()
+                    return None
+        except (OSError, EOFError):
+            session.close()
+            return None
+        return session
+
+    def release(self, session, discard=False):
+        if discard or self.closed or len(self.idle) >= self.max_size:
+            session.close()
+        else:
+            self.idle.append(session)
+
+    def close(self):
+        self.closed = True
+        idle, self.idle = self.idle, []
+        if self.loop is None or self.loop.is_closed() or not idle:
+            return
+        self.loop.call_soon_threadsafe(lambda: [session.close() for session in idle])
@@ -0,0 +1,556 @@
+import calendar
+import hashlib
+import os
+import posixpath
+import socket
+import socketserver
+import threading
+import time
+import zlib
+
+# A loopback FTP server stand-in for benchmarks and manual testing. Real files live
+# under `root`; paths under /synthetic are generated on the fly so that huge files
+# and directories cost no disk:
+#   /synthetic/file/<size>           RETR streams <size> bytes, SIZE/MDTM answer for it
+#   /synthetic/text/<size>           the same with log-like text, for MODE Z
+#   /synthetic/dir/<count>[-<size>]  LIST/MLSD show <count> files f0000000... of <size> bytes
+#                                    (1024 by default), each of them can be RETR'd
+#   /synthetic/null/...              STOR/APPE read and discard, MKD/DELE/RMD/MFMT always succeed
+
+SYNTHETIC = '/synthetic'
+SYNTHETIC_FILE_SIZE = 1024
+SYNTHETIC_MTIME = 1600000000
+DATA_CHUNK = 256 * 1024
+LIST_BATCH = 4096
+HASH_ALGORITHMS = {'SHA-256': 'sha256', 'SHA-1': 'sha1', 'MD5': 'md5', 'CRC32': None}
+
+
+def synthetic_entry(path):
+    # ('file', size), ('dir', (count, size)), ('null', None) or None for real paths
+    if not (path == SYNTHETIC or path.startswith(SYNTHETIC + '/')):
+        return None
+
+    parts = path[len(SYNTHETIC) + 1:].split('/')
+    try:
+        if parts[0] in ('file', 'text') and len(parts) == 2:
+            return 'file', int(parts[1])
+        if parts[0] == 'dir' and len(parts) in (2, 3):
+            count, _, size = parts[1].partition('-')
+            count, size = int(count), int(size or SYNTHETIC_FILE_SIZE)
+            if len(parts) == 2:
+                return 'dir', (count, size)
+            if parts[2].startswith('f') and int(parts[2][1:]) < count:
+                return 'file', size
+            return 'missing', None
+        if parts[0] == 'null':
+            return 'null', None
+    except ValueError:
+        pass
+    return 'missing', None
+
+
+def synthetic_text(size):
+    # access log lines, they compress about as well as the real thing
+    lines = []
+    n = 0
+    while n < size:
+        i = len(lines)
+        address = '10.%d.%d.%d' % (i * 7 % 256, i * 13 % 256, i * 31 % 256)
+        status = (200, 200, 200, 304, 404)[i % 5]
+        line = f'{address} - - [13/Sep/2020:12:{i // 60 % 60:02d}:{i % 60:02d} +0000] ' \
+               f'"GET /api/v1/items/{i * 7919 % 100000}?page={i % 17} HTTP/1.1" {status} {i * 104729 % 65536} ' \
+               f'"-" "client/{i % 3}.{i % 10}"\n'
+        lines.append(line)
+        n += len(line)
+    return ''.join(lines).encode()[:size]
+
+
+def synthetic_chunks(pattern, offset, size):
+    # bytes offset to offset + size of a synthetic file, `pattern` repeated from byte 0,
+    # so that a REST lands where the whole file has the same byte
+    chunk = memoryview(pattern)
+    start = offset % len(pattern)
+    while size > 0:
+        n = min(size, len(chunk) - start)
+        yield chunk[start:start + n]
+        size -= n
+        start = 0
+
+
+class Crc32(object):
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return '%08x' % self.value
+
+
+class FTPHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super(FTPHandler, self).setup()
+        # replies of pipelined commands must not wait on Nagle
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+        self.wfile.flush()
+
+    def handle(self):
+        self.cwd = '/'
+        self.rest = 0
+        self.rnfr = None
+        self.pasv_sock = None
+        self.port_addr = None
+        self.mode = 'S'
+        self.level = zlib.Z_DEFAULT_COMPRESSION
+        self.hash = 'SHA-256'
+        self.reply('220 loopback FTP server ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode(errors='replace').rstrip('\r\n')
+            command, _, argu = line.partition(' ')
+            self.server.commands += 1
+            handler = getattr(self, 'ftp_' + command.upper(), None)
+            if handler is None:
+                self.reply('502 command not implemented')
+                continue
+            try:
+                if handler(argu) is False:
+                    return
+            except OSError as e:
+                self.reply(f'550 {e.strerror or e}')
+
+    # paths
+    def virtual_path(self, argu):
+        return posixpath.normpath(posixpath.join(self.cwd, argu or '.'))
+
+    def real_path(self, path):
+        return os.path.join(self.server.root, path.lstrip('/'))
+
+    # session
+    def ftp_USER(self, argu):
+        self.reply('331 password required')
+
+    def ftp_PASS(self, argu):
+        self.reply('230 logged in')
+
+    def ftp_SYST(self, argu):
+        self.reply('215 UNIX Type: L8')
+
+    def ftp_FEAT(self, argu):
+        self.reply('211-Features:')
+        for feature in self.server.features:
+            self.reply(' ' + feature)
+        self.reply('211 End')
+
+    def ftp_OPTS(self, argu):
+        words = argu.upper().split()
+        if words[:1] == ['HASH']:
+            if len(words) == 1:
+                self.reply(f'200 {self.hash}')
+            elif words[1] in HASH_ALGORITHMS:
+                self.hash = words[1]
+                self.reply(f'200 {self.hash}')
+            else:
+                self.reply('501 unknown algorithm')
+            return
+        if words[:2] == ['MODE', 'Z']:
+            if words[2:3] != ['LEVEL'] or len(words) != 4 or not words[3].isdigit() or int(words[3]) > 9:
+                self.reply('501 use OPTS MODE Z LEVEL 0-9')
+                return
+            self.level = int(words[3])
+        self.reply('200 ok')
+
+    def ftp_MODE(self, argu):
+        if argu.upper() not in ('S', 'Z') or (argu.upper() == 'Z' and 'MODE Z' not in self.server.features):
+            self.reply('504 mode not supported')
+            return
+        self.mode = argu.upper()
+        self.reply(f'200 mode set to {self.mode}')
+
+    def ftp_TYPE(self, argu):
+        self.reply('200 type set')
+
+    def ftp_NOOP(self, argu):
+        self.reply('200 ok')
+
+    def ftp_PWD(self, argu):
+        self.reply(f'257 "{self.cwd}"')
+
+    def ftp_CWD(self, argu):
+        path = self.virtual_path(argu)
+        entry = synthetic_entry(path)
+        if (entry is not None and entry[0] in ('dir', 'null')) or path == SYNTHETIC or \
+                (entry is None and os.path.isdir(self.real_path(path))):
+            self.cwd = path
+            self.reply('250 directory changed')
+        else:
+            self.reply('550 no such directory')
+
+    def ftp_QUIT(self, argu):
+        self.reply('221 bye')
+        return False
+
+    # file information
+    def stat_path(self, argu):
+        # (size, mtime) of a file, None when there is none
+        path = self.virtual_path(argu)
+        entry = synthetic_entry(path)
+        if entry is not None:
+            return (entry[1], SYNTHETIC_MTIME) if entry[0] == 'file' else None
+        real = self.real_path(path)
+        if not os.path.isfile(real):
+            return None
+        st = os.stat(real)
+        return st.st_size, st.st_mtime
+
+    def ftp_SIZE(self, argu):
+        info = self.stat_path(argu)
+        self.reply('550 no such file' if info is None else f'213 {info[0]}')
+
+    def ftp_MDTM(self, argu):
+        info = self.stat_path(argu)
+        if info is None:
+            self.reply('550 no such file')
+        else:
+            self.reply('213 ' + time.strftime('%Y%m%d%H%M%S', time.gmtime(info[1])))
+
+    def ftp_MFMT(self, argu):
+        value, _, name = argu.partition(' ')
+        path = self.virtual_path(name)
+        entry = synthetic_entry(path)
+        if entry is None and os.path.isfile(self.real_path(path)):
+            mtime = calendar.timegm(time.strptime(value[:14], '%Y%m%d%H%M%S'))
+            os.utime(self.real_path(path), (mtime, mtime))
+        elif entry is None or entry[0] in ('dir', 'missing'):
+            self.reply('550 no such file')
+            return
+        self.reply(f'213 Modify={value}; {path}')
+
+    # checksums, HASH (draft-bryan-ftpext-hash) and the older X commands
+    def file_digest(self, argu, algorithm):
+        # hex digest of a whole file, None when there is none
+        path = self.virtual_path(argu)
+        entry = synthetic_entry(path)
+        digest = Crc32() if algorithm == 'CRC32' else hashlib.new(HASH_ALGORITHMS[algorithm])
+        if entry is not None:
+            if entry[0] != 'file':
+                return None
+            pattern = self.server.text if path.startswith(SYNTHETIC + '/text/') else self.server.pattern
+            for data in synthetic_chunks(pattern, 0, entry[1]):
+                digest.update(data)
+        else:
+            real = self.real_path(path)
+            if not os.path.isfile(real):
+                return None
+            with open(real, 'rb') as fp:
+                for data in iter(lambda: fp.read(DATA_CHUNK), b''):
+                    digest.update(data)
+        return digest.hexdigest()
+
+    def ftp_HASH(self, argu):
+        info = self.stat_path(argu)
+        digest = self.file_digest(argu, self.hash)
+        if digest is None:
+            self.reply('550 no such file')
+            return
+        self.reply(f'213 {self.hash} 0-{info[0]} {digest} {argu}')
+
+    def ftp_XSHA256(self, argu):
+        self.x_digest(argu, 'SHA-256')
+
+    def ftp_XSHA1(self, argu):
+        self.x_digest(argu, 'SHA-1')
+
+    def ftp_XMD5(self, argu):
+        self.x_digest(argu, 'MD5')
+
+    def ftp_XCRC(self, argu):
+        self.x_digest(argu, 'CRC32')
+
+    def x_digest(self, argu, algorithm):
+        digest = self.file_digest(argu, algorithm)
+        self.reply('550 no such file' if digest is None else f'250 {digest.upper()}')
+
+    # file system changes, synthetic paths only pretend
+    def ftp_MKD(self, argu):
+        path = self.virtual_path(argu)
+        if synthetic_entry(path) is None:
+            os.mkdir(self.real_path(path))
+        self.reply(f'257 "{path}" created')
+
+    def ftp_RMD(self, argu):
+        path = self.virtual_path(argu)
+        if synthetic_entry(path) is None:
+            os.rmdir(self.real_path(path))
+        self.reply('250 directory removed')
+
+    def ftp_DELE(self, argu):
+        path = self.virtual_path(argu)
+        if synthetic_entry(path) is None:
+            os.remove(self.real_path(path))
+        self.reply('250 file removed')
+
+    def ftp_RNFR(self, argu):
+        path = self.virtual_path(argu)
+        if synthetic_entry(path) is None and not os.path.exists(self.real_path(path)):
+            self.reply('550 no such file')
+            return
+        self.rnfr = path
+        self.reply('350 ready for RNTO')
+
+    def ftp_RNTO(self, argu):
+        if self.rnfr is None:
+            self.reply('503 RNFR first')
+            return
+        path = self.virtual_path(argu)
+        if synthetic_entry(self.rnfr) is None and synthetic_entry(path) is None:
+            os.rename(self.real_path(self.rnfr), self.real_path(path))
+        self.rnfr = None
+        self.reply('250 renamed')
+
+    def ftp_REST(self, argu):
+        self.rest = int(argu)
+        self.reply(f'350 restarting at {self.rest}')
+
+    # data connections
+    def ftp_PASV(self, argu):
+        self.close_pasv()
+        self.pasv_sock = socket.socket()
+        self.pasv_sock.bind((self.request.getsockname()[0], 0))
+        self.pasv_sock.listen(1)
+        host, port = self.pasv_sock.getsockname()
+        self.port_addr = None
+        self.reply('227 Entering Passive Mode (%s,%d,%d)' % (host.replace('.', ','), port // 256, port % 256))
+
+    def ftp_PORT(self, argu):
+        numbers = argu.split(',')
+        self.close_pasv()
+        self.port_addr = ('.'.join(numbers[:4]), int(numbers[4]) * 256 + int(numbers[5]))
+        self.reply('200 PORT command successful')
+
+    def close_pasv(self):
+        if self.pasv_sock is not None:
+            self.pasv_sock.close()
+            self.pasv_sock = None
+
+    def open_data(self):
+        if self.pasv_sock is not None:
+            sock, _ = self.pasv_sock.accept()
+            self.close_pasv()
+        elif self.port_addr is not None:
+            sock = socket.create_connection(self.port_addr)
+        else:
+            return None
+        return sock
+
+    def data_writer(self, sock):
+        # (write, finish) on a data connection, compressing in MODE Z
+        if self.mode != 'Z':
+            return sock.sendall, lambda: None
+        compressor = zlib.compressobj(self.level)
+
+        def write(data):
+            data = compressor.compress(data)
+            if data:
+                sock.sendall(data)
+
+        return write, lambda: sock.sendall(compressor.flush())
+
+    def send_lines(self, lines):
+        sock = self.open_data()
+        if sock is None:
+            self.reply('425 use PORT or PASV first')
+            return
+        with sock:
+            write, finish = self.data_writer(sock)
+            batch = []
+            for line in lines:
+                batch.append(line)
+                if len(batch) >= LIST_BATCH:
+                    write(('\r\n'.join(batch) + '\r\n').encode())
+                    batch = []
+            if batch:
+                write(('\r\n'.join(batch) + '\r\n').encode())
+            finish()
+        self.reply('226 transfer complete')
+
+    def list_entries(self, path):
+        # (name, is_dir, size, mtime) of a directory, None when there is none
+        if path == SYNTHETIC:
+            return iter([(name, True, 4096, SYNTHETIC_MTIME) for name in ('dir', 'file', 'null')])
+        entry = synthetic_entry(path)
+        if entry is not None:
+            if entry[0] != 'dir':
+                return None if entry[0] != 'null' else iter(())
+            count, size = entry[1]
+            return (('f%07d' % i, False, size, SYNTHETIC_MTIME) for i in range(count))
+
+        real = self.real_path(path)
+        if not os.path.isdir(real):
+            return None
+        entries = []
+        with os.scandir(real) as it:
+            for item in it:
+                st = item.stat()
+                entries.append((item.name, item.is_dir(), st.st_size, st.st_mtime))
+        entries.sort()
+        if path == '/':
+            entries.insert(0, (SYNTHETIC[1:], True, 4096, SYNTHETIC_MTIME))
+        return iter(entries)
+
+    def ftp_LIST(self, argu):
+        entries = self.list_entries(self.virtual_path(argu))
+        if entries is None:
+            self.reply('550 no such directory')
+            return
+        self.reply('150 here comes the directory listing')
+        self.send_lines('%s 1 owner group %d %s %s' % ('drwxr-xr-x' if is_dir else '-rw-r--r--', size,
+                                                       time.strftime('%b %d %H:%M', time.gmtime(mtime)), name)
+                        for name, is_dir, size, mtime in entries)
+
+    def ftp_MLSD(self, argu):
+        entries = self.list_entries(self.virtual_path(argu))
+        if entries is None:
+            self.reply('550 no such directory')
+            return
+        self.reply('150 here comes the directory listing')
+        self.send_lines('type=%s;size=%d;modify=%s; %s' % ('dir' if is_dir else 'file', size,
+                                                           time.strftime('%Y%m%d%H%M%S', time.gmtime(mtime)), name)
+                        for name, is_dir, size, mtime in entries)
+
+    def ftp_RETR(self, argu):
+        path = self.virtual_path(argu)
+        entry = synthetic_entry(path)
+        offset, self.rest = self.rest, 0
+        if entry is not None:
+            if entry[0] != 'file':
+                self.reply('550 no such file')
+                return
+            self.reply('150 opening data connection')
+            pattern = self.server.text if path.startswith(SYNTHETIC + '/text/') else self.server.pattern
+            self.send_synthetic(offset, entry[1] - offset, pattern)
+            return
+
+        real = self.real_path(path)
+        if not os.path.isfile(real):
+            self.reply('550 no such file')
+            return
+        self.reply('150 opening data connection')
+        sock = self.open_data()
+        try:
+            with sock, open(real, 'rb') as fp:
+                if self.mode == 'Z':
+                    fp.seek(offset)
+                    write, finish = self.data_writer(sock)
+                    for data in iter(lambda: fp.read(DATA_CHUNK), b''):
+                        write(data)
+                    finish()
+                else:
+                    sock.sendfile(fp, offset)
+        except OSError:
+            self.reply('426 transfer aborted')
+            return
+        self.reply('226 transfer complete')
+
+    def send_synthetic(self, offset, size, pattern):
+        sock = self.open_data()
+        try:
+            with sock:
+                write, finish = self.data_writer(sock)
+                for data in synthetic_chunks(pattern, offset, size):
+                    write(data)
+                finish()
+        except OSError:
+            self.reply('426 transfer aborted')
+            return
+        self.reply('226 transfer complete')
+
+    def store(self, argu, mode):
+        path = self.virtual_path(argu)
+        entry = synthetic_entry(path)
+        self.reply('150 ok to send data')
+        sock = self.open_data()
+        buf = bytearray(DATA_CHUNK)
+        decompressor = zlib.decompressobj() if self.mode == 'Z' else None
+        with sock:
+            if entry is not None:
+                while True:
+                    n = sock.recv_into(buf)
+                    if not n:
+                        break
+                    if decompressor is not None:
+                        decompressor.decompress(memoryview(buf)[:n])
+            else:
+                with open(self.real_path(path), mode) as fp:
+                    while True:
+                        n = sock.recv_into(buf)
+                        if not n:
+                            break
+                        fp.write(memoryview(buf)[:n] if decompressor is None else
+                                 decompressor.decompress(memoryview(buf)[:n]))
+                    if decompressor is not None:
+                        fp.write(decompressor.flush())
+        self.reply('226 transfer complete')
+
+    def ftp_STOR(self, argu):
+        self.store(argu, 'wb')
+
+    def ftp_APPE(self, argu):
+        self.store(argu, 'ab')
+
+
+class LoopbackFTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, root, host='127.0.0.1', port=0,
+                 features=('MLSD', 'SIZE', 'MDTM', 'MFMT', 'REST STREAM', 'MODE Z', 'HASH SHA-256*;SHA-1;MD5;CRC32')):
+        super(LoopbackFTPServer, self).__init__((host, port), FTPHandler)
+        self.root = root
+        self.features = list(features)
+        self.commands = 0
+        self.pattern = bytes(range(256)) * (DATA_CHUNK // 256)
+        self.text = synthetic_text(DATA_CHUNK)
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Loopback FTP server for benchmarks and testing.")
+    parser.add_argument('root', nargs='?', default='.')
+    parser.add_argument('--port', type=int, default=20001)
+    args = parser.parse_args()
+
+    server = LoopbackFTPServer(os.path.abspath(args.root), port=args.port)
+    print(f"serving {server.root} on 127.0.0.1:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
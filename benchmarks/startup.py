@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child():
+    # one cold GUI start, timings in seconds since the parent spawned this process
+    launched = float(os.environ['STARTUP_LAUNCHED'])
+    marks = {'interpreter': time.time() - launched}
+
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from PyQt5.QtCore import QObject, QEvent, QTimer
+    from PyQt5.QtWidgets import QApplication
+    from view import ClientUI
+    from model import ClientModel
+    from controller import ClientCtrl
+    marks['imports'] = time.time() - launched
+
+    app = QApplication(sys.argv[:1])
+    view = ClientUI()
+    marks['ui'] = time.time() - launched
+    ClientCtrl(model=ClientModel(), view=view)
+    marks['controller'] = time.time() - launched
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and 'first_paint' not in marks:
+                marks['first_paint'] = time.time() - launched
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    watcher = PaintWatcher()
+    view.installEventFilter(watcher)
+    view.show()
+    QTimer.singleShot(10000, app.quit)
+    app.exec_()
+
+    marks['modules'] = sorted(name for name in ('humanize', 'PyQt5.uic') if name in sys.modules)
+    print(json.dumps(marks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI startup time, from process spawn to the first paint.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--platform', default='offscreen', help="QT_QPA_PLATFORM of the runs")
+    parser.add_argument('--output', help="write the results as JSON here")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    runs = []
+    with tempfile.TemporaryDirectory() as home:
+        # HOME keeps the transfer journal of the runs away from the real one
+        env = dict(os.environ, HOME=home, QT_QPA_PLATFORM=args.platform)
+        for _ in range(args.runs):
+            env['STARTUP_LAUNCHED'] = repr(time.time())
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], env=env,
+                                 stdout=subprocess.PIPE, check=True).stdout
+            runs.append(json.loads(out.decode().splitlines()[-1]))
+
+    result = {'benchmark': 'startup', 'runs': runs, 'median': {}}
+    for key in ('interpreter', 'imports', 'ui', 'controller', 'first_paint'):
+        result['median'][key] = statistics.median(run[key] for run in runs if key in run)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import *
+from ftpserver import LoopbackFTPServer
+from mirror import MirrorJob
+from model import ClientModel
+from pool import SessionPool
+
+UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip('B')
+    if text[-1:] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def parse_list(text, parse=int):
+    return [parse(item) for item in text.split(',') if item.strip()]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Suite(object):
+    # every measurement against one loopback server; each result is a flat dict
+    # with a unique `key` and one `metric`, the number regressions are judged by
+    def __init__(self, server, min_time):
+        self.server = server
+        self.min_time = min_time
+        self.results = []
+
+    def session(self, compress=False):
+        session = ClientModel()
+        session.connect('127.0.0.1', self.server.port)
+        session.user('bench')
+        session.password('bench')
+        session.type('I')
+        if compress:
+            session.feat()
+            session.select_mode('data.log')
+            if session.transfer_mode != 'Z':
+                raise RuntimeError("the server did not take MODE Z")
+        return session
+
+    @staticmethod
+    def close(session):
+        try:
+            session.quit()
+        except (OSError, EOFError):
+            session.command_socket.close()
+
+    @staticmethod
+    def open_data(session, mode):
+        return session.port() if mode == ClientMode.PORT else session.pasv()
+
+    def record(self, result, metric, higher_is_better):
+        result['metric'] = metric
+        result['higher_is_better'] = higher_is_better
+        self.results.append(result)
+        print(f"{result['key']:<40} {result[metric]:>14.3f} {metric}", file=sys.stderr)
+
+    def repeat(self, run):
+        # runs until min_time has passed, at least once; returns (runs, seconds)
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            run()
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.min_time:
+                return runs, elapsed
+
+    # command round trips
+    def bench_rtt(self, count):
+        session = self.session()
+        try:
+            latencies = []
+            for _ in range(count):
+                start = time.perf_counter()
+                session.noop()
+                latencies.append(time.perf_counter() - start)
+
+            names = ['/synthetic/file/%d' % i for i in range(count)]
+            start = time.perf_counter()
+            session.size_many(names)
+            pipelined = time.perf_counter() - start
+        finally:
+            self.close(session)
+
+        self.record({'key': 'rtt/noop', 'count': count,
+                     'mean_us': statistics.mean(latencies) * 1e6,
+                     'p50_us': percentile(latencies, 0.5) * 1e6,
+                     'p99_us': percentile(latencies, 0.99) * 1e6}, 'p50_us', False)
+        self.record({'key': 'rtt/size_pipelined', 'count': count,
+                     'per_command_us': pipelined / count * 1e6}, 'per_command_us', False)
+
+    # single file throughput, with MODE Z on log-like text
+    def bench_retr(self, mode, size, compress=False):
+        session = self.session(compress)
+        received = [0]
+        wire = [0]
+
+        def consume(view):
+            received[0] += len(view)
+            return True
+
+        def run():
+            self.open_data(session, mode)
+            response = session.retr('/synthetic/%s/%d' % ('text' if compress else 'file', size), consumer=consume)
+            if session.get_status_code(response.splitlines()[-1])[0] != '2':
+                raise RuntimeError(response)
+            wire[0] += session.wire_bytes if compress else size
+
+        try:
+            runs, elapsed = self.repeat(run)
+        finally:
+            self.close(session)
+        self.record({'key': f'retr/{mode.name}/{size}' + ('/Z' if compress else ''), 'mode': mode.name,
+                     'size': size, 'runs': runs, 'seconds': elapsed, 'wire_ratio': wire[0] / received[0],
+                     'mb_per_s': received[0] / elapsed / 1e6}, 'mb_per_s', True)
+
+    def bench_stor(self, mode, size, compress=False):
+        session = self.session(compress)
+        chunk = memoryview(self.server.text if compress else bytes(BUF_SIZE * 4))
+        sent = [0]
+        wire = [0]
+
+        def run():
+            remaining = [size]
+
+            def source(n):
+                # walk through the chunk, text repeated within zlib's window would compress too well
+                start = sent[0] % len(chunk)
+                n = min(n, len(chunk) - start, remaining[0])
+                remaining[0] -= n
+                sent[0] += n
+                return chunk[start:start + n]
+
+            self.open_data(session, mode)
+            response = session.stor('/synthetic/null/upload', source)
+            if session.get_status_code(response.splitlines()[-1])[0] != '2':
+                raise RuntimeError(response)
+            wire[0] += session.wire_bytes if compress else size
+
+        try:
+            runs, elapsed = self.repeat(run)
+        finally:
+            self.close(session)
+        self.record({'key': f'stor/{mode.name}/{size}' + ('/Z' if compress else ''), 'mode': mode.name,
+                     'size': size, 'runs': runs, 'seconds': elapsed, 'wire_ratio': wire[0] / sent[0],
+                     'mb_per_s': sent[0] / elapsed / 1e6}, 'mb_per_s', True)
+
+    # directory listings
+    def bench_list(self, mode, count, mlsd):
+        session = self.session()
+        path = '/synthetic/dir/%d' % count
+        first = []
+
+        def run():
+            start = time.perf_counter()
+            self.open_data(session, mode)
+            n = 0
+            for _ in session.iter_listing(path, mlsd):
+                if n == 0:
+                    first.append(time.perf_counter() - start)
+                n += 1
+            if n != count:
+                raise RuntimeError(f"listed {n} of {count} entries")
+
+        try:
+            runs, elapsed = self.repeat(run)
+        finally:
+            self.close(session)
+        command = 'MLSD' if mlsd else 'LIST'
+        self.record({'key': f'list/{command}/{mode.name}/{count}', 'mode': mode.name, 'command': command,
+                     'entries': count, 'runs': runs, 'seconds': elapsed / runs,
+                     'first_entry_ms': statistics.median(first) * 1e3 if first else None,
+                     'entries_per_s': count * runs / elapsed}, 'seconds', False)
+
+    # many small files over a pooled mirror job
+    def bench_small_files(self, mode, count, size, workers, download):
+        pool = SessionPool(self.session, self.close)
+        workdir = tempfile.mkdtemp(prefix='ftp-bench-')
+        try:
+            if download:
+                local_dir, remote_dir = os.path.join(workdir, 'out'), '/synthetic/dir/%d-%d' % (count, size)
+            else:
+                local_dir, remote_dir = workdir, '/synthetic/null/upload'
+                data = bytes(size)
+                for i in range(count):
+                    with open(os.path.join(workdir, 'f%07d' % i), 'wb') as fp:
+                        fp.write(data)
+
+            files = [0]
+            lock = threading.Lock()
+
+            def on_done():
+                with lock:
+                    files[0] += 1
+
+            errors = []
+            job = MirrorJob(pool.acquire, pool.release, local_dir, remote_dir, download, mode, False,
+                            is_running=lambda: True, on_found=lambda n: None, on_progress=lambda n: None,
+                            on_done=on_done, workers=workers,
+                            on_response=lambda r: errors.append(r) if r.startswith(SYSTEM_HEADER) else None)
+            start = time.perf_counter()
+            ok = job.run()
+            elapsed = time.perf_counter() - start
+            if not ok or files[0] != count:
+                raise RuntimeError(f"{files[0]} of {count} files copied: {errors[:3]}")
+        finally:
+            pool.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        direction = 'download' if download else 'upload'
+        self.record({'key': f'small_files/{direction}/{mode.name}/{count}x{size}', 'mode': mode.name,
+                     'direction': direction, 'files': count, 'size': size, 'workers': workers, 'seconds': elapsed,
+                     'files_per_s': count / elapsed}, 'files_per_s', True)
+
+
+def compare(results, baseline, tolerance):
+    # the keys whose metric got worse than the baseline by more than tolerance
+    old = dict((result['key'], result) for result in baseline['results'])
+    regressions = []
+    for result in results:
+        before = old.get(result['key'])
+        if before is None or not before[result['metric']]:
+            continue
+        ratio = result[result['metric']] / before[result['metric']]
+        if (ratio < 1 - tolerance) if result['higher_is_better'] else (ratio > 1 + tolerance):
+            regressions.append({'key': result['key'], 'metric': result['metric'],
+                                'baseline': before[result['metric']], 'current': result[result['metric']]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmarks against a loopback FTP server.")
+    parser.add_argument('--sizes', default='1K,64K,1M,16M,256M',
+                        help="RETR/STOR file sizes, up to 10G, the server makes the data up")
+    parser.add_argument('--list-counts', default='1000,10000,100000', help="LIST/MLSD directory sizes, up to 1M")
+    parser.add_argument('--rtt-count', type=int, default=1000)
+    parser.add_argument('--small-files', type=int, default=500)
+    parser.add_argument('--small-file-size', default='4K')
+    parser.add_argument('--workers', type=int, default=MIRROR_WORKERS)
+    parser.add_argument('--modes', default='PASV,PORT')
+    parser.add_argument('--min-time', type=float, default=0.5, help="repeat each measurement for this many seconds")
+    parser.add_argument('--only', help="comma separated groups: rtt,retr,stor,mode_z,list,small_files")
+    parser.add_argument('--output', help="write the results as JSON here")
+    parser.add_argument('--compare', help="baseline JSON; exit 1 when a metric regressed")
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args()
+
+    modes = [ClientMode[name.strip().upper()] for name in args.modes.split(',')]
+    groups = {'rtt', 'retr', 'stor', 'mode_z', 'list', 'small_files'}
+    if args.only:
+        groups = set(parse_list(args.only, str.strip))
+    small_size = parse_size(args.small_file_size)
+
+    root = tempfile.mkdtemp(prefix='ftp-bench-root-')
+    try:
+        with LoopbackFTPServer(root) as server:
+            suite = Suite(server, args.min_time)
+            if 'rtt' in groups:
+                suite.bench_rtt(args.rtt_count)
+            for mode in modes:
+                for size in parse_list(args.sizes, parse_size):
+                    if 'retr' in groups:
+                        suite.bench_retr(mode, size)
+                    if 'stor' in groups:
+                        suite.bench_stor(mode, size)
+                    if 'mode_z' in groups:
+                        suite.bench_retr(mode, size, compress=True)
+                        suite.bench_stor(mode, size, compress=True)
+                if 'list' in groups:
+                    for count in parse_list(args.list_counts):
+                        suite.bench_list(mode, count, mlsd=False)
+                        suite.bench_list(mode, count, mlsd=True)
+                if 'small_files' in groups:
+                    suite.bench_small_files(mode, args.small_files, small_size, args.workers, download=True)
+                    suite.bench_small_files(mode, args.small_files, small_size, args.workers, download=False)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = {'benchmark': 'suite',
+              'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': suite.results}
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as fp:
+            report['regressions'] = compare(suite.results, json.load(fp), args.tolerance)
+        for regression in report['regressions']:
+            print(f"regression: {regression['key']} {regression['metric']} "
+                  f"{regression['baseline']:.3f} -> {regression['current']:.3f}", file=sys.stderr)
+        status = 1 if report['regressions'] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(text + '\n')
+    else:
+        print(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+
+from config import *
+
+
+class ListingCache(object):
+    # remote listings keyed by (server, path), expired after `ttl` seconds and
+    # evicted least recently used; mutating commands patch entries in place
+    def __init__(self, ttl=LISTING_CACHE_TTL, max_entries=LISTING_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (server, path) -> (time stored, [FileEntry])
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(server, path):
+        return server, posixpath.normpath(path or '/')
+
+    def get(self, server, path):
+        key = self.key(server, path)
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return list(item[1])
+
+    def put(self, server, path, entries):
+        key = self.key(server, path)
+        with self.lock:
+            self.entries[key] = (time.monotonic(), list(entries))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, server, path, recursive=False):
+        server, path = self.key(server, path)
+        prefix = path.rstrip('/') + '/'
+        with self.lock:
+            for key in list(self.entries):
+                if key[0] == server and (key[1] == path or recursive and key[1].startswith(prefix)):
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    # local updates so that a mutating command does not need a new LIST
+    def add_entry(self, server, path, entry):
+        key = self.key(server, path)
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return
+            entries = [old for old in item[1] if old.name != entry.name]
+            entries.append(entry)
+            self.entries[key] = (item[0], entries)
+
+    def remove_entry(self, server, file_path):
+        directory, name = posixpath.split(posixpath.normpath(file_path))
+        key = self.key(server, directory)
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            removed = [entry for entry in item[1] if entry.name == name]
+            self.entries[key] = (item[0], [entry for entry in item[1] if entry.name != name])
+        if removed and removed[0].is_dir():
+            self.invalidate(server, file_path, recursive=True)
+        return removed[0] if removed else None
+
+    def rename_entry(self, server, old_path, new_path):
+        entry = self.remove_entry(server, old_path)
+        directory, name = posixpath.split(posixpath.normpath(new_path))
+        if entry is None:
+            self.invalidate(server, directory)
+            return
+
+        entry.name = name
+        self.add_entry(server, directory, entry)
+        if entry.is_dir():
+            self.invalidate(server, new_path, recursive=True)
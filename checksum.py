@@ -0,0 +1,140 @@
+import hashlib
+import os
+import queue
+import re
+import threading
+import zlib
+
+from config import *
+
+HASH_NAMES = {'sha256': 'SHA-256', 'sha1': 'SHA-1', 'md5': 'MD5', 'crc32': 'CRC32'}
+X_COMMANDS = {'sha256': 'XSHA256', 'sha1': 'XSHA1', 'md5': 'XMD5', 'crc32': 'XCRC'}
+DIGEST_LENGTHS = {'sha256': 64, 'sha1': 40, 'md5': 32, 'crc32': 8}
+
+
+class Crc32(object):
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return '%08x' % self.value
+
+
+def new_digest(algorithm):
+    if algorithm == 'crc32':
+        return Crc32()
+    return hashlib.new(algorithm)
+
+
+def server_method(features, preferred=CHECKSUM_ALGORITHMS):
+    # (algorithm, command) the server can hash a file with, HASH before the
+    # older XSHA256/XMD5/XCRC; None when FEAT lists none of them
+    features = features or ()
+    for feature in features:
+        if feature.startswith('HASH '):
+            names = [name.rstrip('*') for name in feature[5:].split(';')]
+            for algorithm in preferred:
+                if HASH_NAMES[algorithm] in names:
+                    return algorithm, 'HASH'
+    for algorithm in preferred:
+        if X_COMMANDS[algorithm] in features:
+            return algorithm, X_COMMANDS[algorithm]
+    return None
+
+
+def parse_digest(text, algorithm):
+    # the first hex string of the digest's length, lowercased; None when there is none
+    match = re.search(r'(?<![0-9A-Fa-f])[0-9A-Fa-f]{%d}(?![0-9A-Fa-f])' % DIGEST_LENGTHS[algorithm], text)
+    return None if match is None else match.group().lower()
+
+
+class StreamHasher(object):
+    # digest of the bytes of one transfer. The data loop only copies each chunk
+    # into a bounded queue, a worker thread hashes it (hashlib and zlib release
+    # the GIL on large buffers); file ranges, like the part of a file a resumed
+    # transfer already has, are read and hashed by the worker as well
+    def __init__(self, algorithm, queue_size=CHECKSUM_QUEUE_SIZE):
+        self.algorithm = algorithm
+        self.digest = new_digest(algorithm)
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def update(self, data):
+        self.queue.put(bytes(data))
+
+    def update_file(self, path, offset, length):
+        if length > 0:
+            self.queue.put((path, offset, length))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                if isinstance(item, tuple):
+                    self.hash_file(*item)
+                else:
+                    self.digest.update(item)
+            except OSError as e:
+                self.error = e
+
+    def hash_file(self, path, offset, length):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            while length > 0:
+                data = os.pread(fd, min(length, CHECKSUM_READ_SIZE), offset)
+                if not data:
+                    raise OSError(f"{path} is shorter than expected")
+                self.digest.update(data)
+                offset += len(data)
+                length -= len(data)
+        finally:
+            os.close(fd)
+
+    def hexdigest(self):
+        # waits for the worker; None when a file range could not be read
+        self.close()
+        return None if self.error is not None else self.digest.hexdigest()
+
+    def close(self):
+        if self.worker.is_alive():
+            self.queue.put(None)
+            self.worker.join()
+
+    # wrappers for the model's transfer functions
+    def consumer(self, consumer):
+        def consume(view):
+            self.update(view)
+            return consumer(view)
+
+        return consume
+
+    def callback(self, callback):
+        def produce(size):
+            buf = callback(size)
+            if buf:
+                self.update(buf)
+            return buf
+
+        return produce
+
+    def progress(self, progress, fp):
+        # sendfile() moves the data without us seeing it, the worker reads it back
+        # from the page cache it was just sent from
+        path = fp.name
+        position = [fp.tell()]
+
+        def on_progress(n):
+            self.update_file(path, position[0], n)
+            position[0] += n
+            return progress(n)
+
+        return on_progress
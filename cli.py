@@ -0,0 +1,239 @@
+import argparse
+import os
+import posixpath
+import shlex
+import sys
+
+from config import *
+from engine import TransferEngine
+from metrics import metrics
+from sync import SYNC_UPLOAD, SYNC_DOWNLOAD, SYNC_BOTH
+
+USAGE_COMMANDS = '''commands:
+  ls [REMOTE_DIR]
+  get REMOTE_FILE [LOCAL_FILE]
+  put LOCAL_FILE [REMOTE_FILE]
+  mirror get|put SOURCE_DIR [TARGET_DIR]
+  sync [--direction upload|download|both] [--delete] [--dry-run] LOCAL_DIR REMOTE_DIR
+  batch SCRIPT     one command per line, '#' starts a comment, '-' reads stdin
+  cd REMOTE_DIR    batch scripts only
+'''
+
+
+class CommandError(Exception):
+    pass
+
+
+class FTPCommandLine(object):
+    # runs get/put/mirror/ls/sync against one server on a TransferEngine, no GUI involved;
+    # transfers of a batch are queued and run side by side, other commands wait for them
+    def __init__(self, engine, verbose=False):
+        self.engine = engine
+        self.verbose = verbose
+        self.cwd = '/'
+        self.failed = 0
+
+    def on_response(self, response):
+        response = response.rstrip('\n')
+        if self.verbose or self.is_error(response):
+            print(response, file=sys.stderr)
+
+    @staticmethod
+    def is_error(response):
+        parts = response.split(' ')
+        return len(parts) > 1 and parts[1][:1] in ('4', '5')
+
+    def remote_path(self, path):
+        return posixpath.normpath(posixpath.join(self.cwd, path))
+
+    def run(self, argv):
+        if not argv:
+            raise CommandError("missing command")
+
+        command, args = argv[0], argv[1:]
+        handler = getattr(self, 'do_' + command, None)
+        if handler is None:
+            raise CommandError(f"unknown command {command}")
+        if command != 'batch':
+            self.engine.wait()
+        handler(args)
+
+    def finish(self):
+        self.engine.wait()
+        for proc in self.engine.finished_proc:
+            if proc.status != TransferStatus.Finished:
+                self.failed += 1
+            if self.verbose or proc.status != TransferStatus.Finished:
+                direction = '<-' if proc.download else '->'
+                print(f"{proc.status.value}: {proc.local_file} {direction} {proc.remote_file} "
+                      f"({proc.trans_size}/{proc.total_size} bytes)", file=sys.stderr)
+        self.engine.finished_proc = []
+
+    # commands
+    def do_ls(self, args):
+        path = self.remote_path(args[0] if args else '.')
+        entries = self.engine.list_remote_dir(path, force=True)
+        if entries is None:
+            self.failed += 1
+            return
+
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            kind = 'd' if entry.is_dir() else '-'
+            print(f"{kind} {entry.size:>12} {entry.last_modified:>12} {entry.name}")
+
+    def do_get(self, args):
+        if not 1 <= len(args) <= 2:
+            raise CommandError("usage: get REMOTE_FILE [LOCAL_FILE]")
+
+        remote_file = self.remote_path(args[0])
+        local_file = os.path.abspath(args[1] if len(args) > 1 else posixpath.basename(remote_file))
+        if os.path.isdir(local_file):
+            local_file = os.path.join(local_file, posixpath.basename(remote_file))
+
+        response, size = self.engine.model.size(remote_file)
+        self.on_response(response)
+        if self.engine.get_status_code(response)[0] != '2':
+            self.failed += 1
+            return
+        self.engine.download_file(local_file, remote_file, size)
+
+    def do_put(self, args):
+        if not 1 <= len(args) <= 2:
+            raise CommandError("usage: put LOCAL_FILE [REMOTE_FILE]")
+
+        local_file = os.path.abspath(args[0])
+        if not os.path.isfile(local_file):
+            raise CommandError(f"{args[0]} is not a file")
+        remote_file = self.remote_path(args[1] if len(args) > 1 else os.path.basename(local_file))
+        self.engine.upload_file(local_file, remote_file, os.path.getsize(local_file))
+
+    def do_mirror(self, args):
+        if len(args) not in (2, 3) or args[0] not in ('get', 'put'):
+            raise CommandError("usage: mirror get|put SOURCE_DIR [TARGET_DIR]")
+
+        if args[0] == 'get':
+            remote_dir = self.remote_path(args[1])
+            local_dir = os.path.abspath(args[2] if len(args) > 2 else posixpath.basename(remote_dir))
+            self.engine.mirror_dir(local_dir, remote_dir, download=True)
+        else:
+            local_dir = os.path.abspath(args[1])
+            if not os.path.isdir(local_dir):
+                raise CommandError(f"{args[1]} is not a directory")
+            remote_dir = self.remote_path(args[2] if len(args) > 2 else os.path.basename(local_dir))
+            self.engine.mirror_dir(local_dir, remote_dir, download=False)
+
+    def do_sync(self, args):
+        parser = argparse.ArgumentParser(prog='sync', add_help=False)
+        parser.add_argument('--direction', choices=(SYNC_UPLOAD, SYNC_DOWNLOAD, SYNC_BOTH), default=SYNC_UPLOAD)
+        parser.add_argument('--delete', action='store_true')
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('local_dir')
+        parser.add_argument('remote_dir')
+        try:
+            options = parser.parse_args(args)
+        except SystemExit:
+            raise CommandError("usage: sync [--direction upload|download|both] [--delete] [--dry-run] "
+                               "LOCAL_DIR REMOTE_DIR")
+
+        plan = self.engine.sync_dir(os.path.abspath(options.local_dir), self.remote_path(options.remote_dir),
+                                    options.direction, options.delete, options.dry_run)
+        if plan is None:
+            self.failed += 1
+            return
+        print(plan.report())
+
+    def do_cd(self, args):
+        if len(args) != 1:
+            raise CommandError("usage: cd REMOTE_DIR")
+        self.cwd = self.remote_path(args[0])
+
+    def do_batch(self, args):
+        if len(args) != 1:
+            raise CommandError("usage: batch SCRIPT")
+
+        fp = sys.stdin if args[0] == '-' else open(args[0])
+        with fp:
+            for number, line in enumerate(fp, 1):
+                argv = shlex.split(line, comments=True)
+                if not argv:
+                    continue
+                if argv[0] == 'batch':
+                    raise CommandError(f"line {number}: batch scripts do not nest")
+                try:
+                    self.run(argv)
+                except CommandError as e:
+                    raise CommandError(f"line {number}: {e}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='cli.py', description="Headless FTP client.", epilog=USAGE_COMMANDS,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-H', '--host', required=True)
+    parser.add_argument('-P', '--port', default='21')
+    parser.add_argument('-u', '--user', default='anonymous')
+    parser.add_argument('-p', '--password', default=os.environ.get('FTP_PASSWORD', 'anonymous@'))
+    parser.add_argument('--active', action='store_true', help="PORT mode instead of PASV")
+    parser.add_argument('--segments', type=int, default=SEGMENT_COUNT, help="connections per large download")
+    parser.add_argument('--limit', type=int, default=0, help="total rate limit in KiB/s, 0 is unlimited")
+    parser.add_argument('--mode-z-level', type=int, default=MODE_Z_LEVEL, choices=range(10), metavar='0-9',
+                        help="zlib level of MODE Z transfers")
+    parser.add_argument('--no-mode-z', action='store_true', help="never compress the data connection")
+    parser.add_argument('--no-checksum', action='store_true', help="do not verify transfers with checksums")
+    parser.add_argument('--fsync', default=WRITER_FSYNC, choices=('never', 'close', 'interval'),
+                        help="when downloads are flushed to disk")
+    parser.add_argument('--journal', default=':memory:',
+                        help="transfer journal to share with the GUI, by default nothing is kept")
+    parser.add_argument('--metrics-prom', metavar='PATH', help="write command and transfer metrics here on exit")
+    parser.add_argument('--metrics-json', metavar='PATH', help="the same metrics as JSON, with throughput timelines")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print every server response")
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    if not options.command:
+        print(USAGE_COMMANDS, file=sys.stderr)
+        return 2
+
+    cli = None
+    engine = TransferEngine(on_response=lambda response: cli.on_response(response), journal_path=options.journal)
+    cli = FTPCommandLine(engine, options.verbose)
+    if options.metrics_prom or options.metrics_json:
+        metrics.enabled = True
+    engine.mode = ClientMode.PORT if options.active else ClientMode.PASV
+    engine.segment_count = options.segments
+    engine.compression = not options.no_mode_z
+    engine.compression_level = options.mode_z_level
+    engine.checksum = not options.no_checksum
+    engine.fsync = options.fsync
+    engine.bandwidth.set_global_rate(options.limit * 1024)
+
+    try:
+        path = engine.login(options.host, options.port, options.user, options.password)
+        if path is None:
+            return 1
+        cli.cwd = path
+
+        try:
+            cli.run(options.command)
+        except CommandError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        except OSError as e:
+            print(f"error: {e}", file=sys.stderr)
+            cli.failed += 1
+        cli.finish()
+        return 1 if cli.failed else 0
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if engine.is_connected():
+            engine.logout()
+        engine.close()
+        if metrics.enabled:
+            metrics.export(options.metrics_prom, options.metrics_json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,134 @@
+import os
 from enum import Enum
 
 BUF_SIZE = 8192
 BACKLOG = 5
+RECV_BUF_SIZE = 256 * 1024
+SENDFILE_CHUNK = 4 * 1024 * 1024
+
+# data connection tuning, profile 'auto' adapts the chunk size and leaves the socket buffers
+# to the kernel, the others are fixed overrides
+TUNING_PROFILE = 'auto'
+TUNING_PROFILES = {
+    'auto': None,
+    'lan': {'chunk_size': 1024 * 1024, 'sock_buf': 4 * 1024 * 1024},
+    'wan': {'chunk_size': 256 * 1024, 'sock_buf': 2 * 1024 * 1024},
+    'high-latency': {'chunk_size': 1024 * 1024, 'sock_buf': 16 * 1024 * 1024},
+}
+TUNING_MIN_CHUNK = 16 * 1024
+TUNING_MAX_CHUNK = 4 * 1024 * 1024
+TUNING_INTERVAL = 0.5
+
+# progress reporting
+PROGRESS_RATE_HZ = 10
+PROGRESS_SMOOTHING = 0.3
+TRANSFER_TABLE_RESET = 64
+REMOTE_FETCH_BATCH = 1000
+REMOTE_STREAM_BATCH = 500
+REMOTE_STREAM_INTERVAL = 0.1
+
+# segmented download
+SEGMENT_COUNT = 4
+SEGMENT_MIN_SIZE = 16 * 1024 * 1024
+SEGMENT_RETRY = 3
+
+# bandwidth limits in bytes per second, 0 is unlimited
+RATE_LIMIT_GLOBAL = 0
+RATE_LIMIT_SERVER = 0
+RATE_LIMIT_IDLE = 1.0
+RATE_LIMIT_BURST = 0.25
+RATE_LIMIT_HZ = 10
+RATE_LIMIT_MIN_CHUNK = 4096
+RATE_LIMIT_PRIORITY_WEIGHT = 4
+
+# delta sync, LIST times may be in the server's time zone
+SYNC_MTIME_TOLERANCE = 2
+SYNC_LIST_TIME_SLACK = 86400
+
+# pipelined control commands, bulk SIZE/MDTM/DELE/rename
+PIPELINE_ENABLED = True
+PIPELINE_WINDOW = 32
+PIPELINE_TIMEOUT = 10
+PIPELINE_REPLY_TIMEOUT = 60
+
+# metrics of commands and transfers, off by default; the files are rewritten every interval
+METRICS_ENABLED = False
+METRICS_PROMETHEUS_PATH = os.path.join(os.path.expanduser('~'), '.ftp_client', 'metrics.prom')
+METRICS_JSON_PATH = os.path.join(os.path.expanduser('~'), '.ftp_client', 'metrics.json')
+METRICS_EXPORT_INTERVAL = 15
+METRICS_TIMELINE_INTERVAL = 0.5
+METRICS_KEEP_TIMELINES = 64
+
+# control connection keepalive and reconnect, the delay doubles after every failed attempt
+KEEPALIVE_INTERVAL = 30
+RECONNECT_ENABLED = True
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 0.1
+# sent again when the connection broke before their reply, the rest may already have run
+RECONNECT_REPEAT_COMMANDS = {
+    'NOOP', 'PWD', 'CWD', 'CDUP', 'TYPE', 'MODE', 'OPTS', 'SYST', 'FEAT', 'STAT', 'SIZE', 'MDTM', 'MLST',
+    'HASH', 'XSHA256', 'XSHA1', 'XMD5', 'XCRC',
+}
+
+# interrupted transfers resume by themselves, retries only count attempts that made no progress
+TRANSFER_RESUME_RETRY = 5
+TRANSFER_RESUME_DELAY = 1
+
+# MODE Z compressed data connections: downloads of text types, uploads whose first
+# MODE_Z_PROBE_SIZE bytes deflate to at most MODE_Z_MAX_RATIO; files of the skip types
+# are never probed
+MODE_Z_ENABLED = True
+MODE_Z_LEVEL = 6
+MODE_Z_PROBE_SIZE = 64 * 1024
+MODE_Z_MAX_RATIO = 0.8
+MODE_Z_TEXT_EXTENSIONS = {
+    '.txt', '.text', '.log', '.csv', '.tsv', '.json', '.jsonl', '.ndjson', '.xml', '.html', '.htm', '.css', '.js',
+    '.svg', '.md', '.rst', '.tex', '.ini', '.cfg', '.conf', '.yaml', '.yml', '.toml', '.sql', '.py', '.c', '.h',
+    '.cpp', '.hpp', '.java', '.go', '.rs', '.sh', '.pl', '.rb', '.php', '.ts', '.srt', '.ps', '.eml', '.mbox',
+}
+MODE_Z_SKIP_EXTENSIONS = {
+    '.gz', '.tgz', '.bz2', '.xz', '.txz', '.zst', '.lz4', '.lzma', '.z', '.zip', '.7z', '.rar', '.jar', '.apk',
+    '.deb', '.rpm', '.whl', '.br', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mp3', '.aac', '.ogg',
+    '.flac', '.mp4', '.mkv', '.avi', '.mov', '.webm', '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+}
+
+# checksums of transfers, compared with HASH/XSHA256/XMD5/XCRC or a sidecar file next to a download
+CHECKSUM_ENABLED = True
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5', 'crc32')
+CHECKSUM_SIDECARS = (('.sha256', 'sha256'), ('.md5', 'md5'))
+CHECKSUM_QUEUE_SIZE = 8
+CHECKSUM_READ_SIZE = 1024 * 1024
+
+# write-behind downloads into a preallocated file: up to WRITER_BUFFER_SIZE queued for the
+# writer thread, pwritev() of up to WRITER_COALESCE; WRITER_FSYNC 'never', 'close' or 'interval'
+WRITER_ENABLED = True
+WRITER_BUFFER_SIZE = 32 * 1024 * 1024
+WRITER_COALESCE = 4 * 1024 * 1024
+WRITER_MAX_IOV = 1024
+WRITER_FSYNC = 'never'
+WRITER_FSYNC_BYTES = 64 * 1024 * 1024
+
+# transfer scheduler, a segmented or directory transfer takes one slot
+SCHEDULER_MAX_ACTIVE = 6
+SCHEDULER_MAX_PER_SERVER = 2
+
+# recursive directory transfer
+MIRROR_WORKERS = 4
+MIRROR_LARGE_FILE = 8 * 1024 * 1024
+
+# session pool
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 8
+POOL_IDLE_TIMEOUT = 60
+POOL_HEALTH_CHECK_INTERVAL = 15
+
+# transfer journal, unfinished transfers are resumed on the next start
+JOURNAL_PATH = os.path.join(os.path.expanduser('~'), '.ftp_client', 'journal.db')
+JOURNAL_INTERVAL = 2
+
+# remote listing cache
+LISTING_CACHE_TTL = 60
+LISTING_CACHE_SIZE = 256
 
 CRLF = '\r\n'
 SERVER_HEADER = 'server: '
@@ -22,11 +149,13 @@ class RunningProcessHeader(Enum):
     Direction = 1
     Remote = 2
     Size = 3
-    StartTime = 4
-    EndTime = 5
-    Status = 6
-    # Progress = 7
-    Btn = 7
+    Rate = 4
+    ETA = 5
+    StartTime = 6
+    EndTime = 7
+    Status = 8
+    # Progress = 9
+    Btn = 9
 
 
 class FileHeader(Enum):
@@ -49,6 +178,7 @@ class FileType(Enum):
 
 
 class TransferStatus(Enum):
+    Queued = 'Queued'
     Running = 'Running'
     Paused = 'Paused'
     Finished = 'Finished'
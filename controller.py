@@ -1,25 +1,17 @@
 import os
-from datetime import datetime
+import itertools
 import threading
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QDir, pyqtSignal
-from PyQt5.QtWidgets import *
+from PyQt5.QtWidgets import QApplication, QCheckBox, QComboBox, QDialog, QDialogButtonBox, QHeaderView, \
+    QInputDialog, QLabel, QLineEdit, QVBoxLayout
 
+from async_bridge import AsyncBridge
 from config import *
-
-
-class TransferProcess(object):
-    def __init__(self, local_file='', remote_file='', download=True, total_size=0, trans_size=0,
-                 start_time=None, end_time=None, status=TransferStatus.Running):
-        self.local_file = local_file
-        self.remote_file = remote_file
-        self.download = download
-        self.total_size = total_size
-        self.trans_size = trans_size
-        self.start_time = start_time
-        self.end_time = end_time
-        self.status = status
+from engine import TransferEngine
+from progress import ProgressSampler
+from sync import SYNC_UPLOAD, SYNC_DOWNLOAD, SYNC_BOTH
 
 
 class ClientCtrl(QtCore.QObject):
@@ -27,28 +19,33 @@ class ClientCtrl(QtCore.QObject):
     insert_response_signal = pyqtSignal(str)
     refresh_finished_signal = pyqtSignal()
     refresh_transferring_signal = pyqtSignal()
-    update_single_transfer = pyqtSignal(TransferProcess)
+    refresh_remote_signal = pyqtSignal()
+    remote_entries_signal = pyqtSignal(int, list)
 
     def __init__(self, model, view):
         super(ClientCtrl, self).__init__(view)
-        self.model = model
         self.view = view
 
-        self.mode = ClientMode.PORT
+        # transfers and remote operations live in the engine, its callbacks come back as signals
+        self.engine = TransferEngine(model, on_response=self.push_response,
+                                     on_transfers=self.refresh_transferring_signal.emit,
+                                     on_finished=self.refresh_finished_signal.emit,
+                                     on_remote=self.refresh_remote_signal.emit)
+        self.model = self.engine.model
 
         self.local_cur_path = QDir.rootPath()
         self.remote_cur_path = '/'
-        self.remote_file_size = {}
 
-        # process pool
-        self.running_proc = {}
-        self.finished_proc = []
+        # remote listings in flight, token -> node of the remote model they fill;
+        # they run as coroutines on the bridge's event loop
+        self.async_bridge = None
+        self.listing_nodes = {}
+        self.listing_tokens = itertools.count()
 
         # local path system
         # self.view.localSite.setText(self.local_cur_path)
         self.view.localSite.setText("/Users/liqi17thu/Desktop")
-        self.model.localFileModel.setRootPath(self.local_cur_path)
-        self.view.localFileView.setModel(self.model.localFileModel)
+        self.view.localFileView.setModel(self.view.localFileModel)
         self.view.localFileView.header().setSectionResizeMode(0, QHeaderView.Stretch)
         for col in range(1, 4):
             self.view.localFileView.header().setSectionResizeMode(col, QHeaderView.ResizeToContents)
@@ -65,25 +62,63 @@ class ClientCtrl(QtCore.QObject):
         self.view.localRename.clicked.connect(self.local_rename)
         self.view.localDelete.clicked.connect(self.local_delete)
 
-        self.view.remoteFileWidget.selectionModel().selectionChanged.connect(self.sync_remote_path)
+        self.view.remoteModel.lister = self.list_remote_dir
+        self.view.remoteFileView.selectionModel().selectionChanged.connect(self.sync_remote_path)
         self.view.remoteRename.clicked.connect(self.remote_rename)
         self.view.remoteDelete.clicked.connect(self.remote_delete)
         self.view.remoteSiteBtn.clicked.connect(self.change_remote_site)
         self.view.remoteCreateDir.clicked.connect(self.create_remote_dir)
+        self.view.remoteRefresh.clicked.connect(self.force_refresh_remote_site)
+        self.view.remoteSync.clicked.connect(self.sync)
 
         self.view.upload.clicked.connect(self.upload)
         self.view.download.clicked.connect(self.download)
 
+        self.view.transferTop.triggered.connect(
+            lambda: self.engine.change_transfer_priority(self.view.selected_transfers(), top=True))
+        self.view.transferRaise.triggered.connect(
+            lambda: self.engine.change_transfer_priority(self.view.selected_transfers(), 1))
+        self.view.transferLower.triggered.connect(
+            lambda: self.engine.change_transfer_priority(self.view.selected_transfers(), -1))
+        self.view.transferLimit.triggered.connect(self.limit_transfer_rate)
+        self.view.globalLimit.valueChanged.connect(lambda kib: self.engine.bandwidth.set_global_rate(kib * 1024))
+        self.view.serverLimit.valueChanged.connect(lambda kib: self.engine.bandwidth.set_server_rate(kib * 1024))
+
         self.refresh_transferring_signal.connect(self.refresh_transferring_processing)
         self.refresh_finished_signal.connect(self.refresh_finished_processing)
-        self.update_single_transfer.connect(self.update_single_transfer_process)
+        self.refresh_remote_signal.connect(self.refresh_remote_site)
+        self.remote_entries_signal.connect(self.add_remote_entries)
         self.insert_response_signal.connect(self.view.responses.insertPlainText)
 
+        # transfer threads only bump trans_size, the GUI samples all of them at a fixed rate
+        self.progress_sampler = ProgressSampler()
+        self.progress_timer = QtCore.QTimer(self)
+        self.progress_timer.setInterval(1000 // PROGRESS_RATE_HZ)
+        self.progress_timer.timeout.connect(self.sample_progress)
+        self.progress_timer.start()
+
+        # unfinished transfers of the last run, resumed when their server is logged in again
+        self.engine.restore_journal()
+        if QApplication.instance() is not None:
+            QApplication.instance().aboutToQuit.connect(self.engine.close)
+
+        # setRootPath starts the file system watcher and directory gatherer, the first
+        # paint is already queued when this zero timer fires
+        self.local_populated = False
+        QtCore.QTimer.singleShot(0, self.populate_local_site)
+
+    def populate_local_site(self):
+        if self.local_populated:
+            return
+
+        self.local_populated = True
+        self.view.localFileModel.setRootPath(self.local_cur_path)
+
     def setPort(self):
-        self.mode = ClientMode.PORT
+        self.engine.mode = ClientMode.PORT
 
     def setPasv(self):
-        self.mode = ClientMode.PASV
+        self.engine.mode = ClientMode.PASV
 
     def login(self):
         host = self.view.host.text()
@@ -99,209 +134,130 @@ class ClientCtrl(QtCore.QObject):
             self.push_response(SYSTEM_HEADER + "5 please enter port to connect!")
             return
 
-        response = self.model.connect(host, port)
-        self.push_response(response)
-
-        if self.get_status_code(response)[0] == '5':
-            return
-
         if not username:
             self.push_response(SYSTEM_HEADER + "5 please enter username to login!")
             return
 
-        response = self.model.user(username)
-        self.push_response(response)
-
-        if self.get_status_code(response)[0] == '5':
-            return
-
         if not password:
             self.push_response(SYSTEM_HEADER + "5 please enter password to login!")
             return
 
-        response = self.model.password(password)
-        self.push_response(response)
-
-        if self.get_status_code(response)[0] == '5':
+        path = self.engine.login(host, port, username, password)
+        if path is None:
             return
 
-        response, path = self.model.pwd()
-        self.push_response(response)
         self.remote_cur_path = path
         self.view.remoteSite.setText(self.remote_cur_path)
         self.refresh_remote_site()
+        self.engine.resume_journaled()
         self.refresh_transferring_processing()
         self.refresh_finished_processing()
 
     def exit(self):
-        for proc_name in self.running_proc:
-            self.running_proc[proc_name].status = TransferStatus.Paused
-
-        self.model.quit()
+        self.engine.logout()
         self.refresh_remote_site()
         self.refresh_transferring_processing()
         self.refresh_finished_processing()
 
-    def thread_download(self, local_file, remote_file, size, resume=False):
-        with threading.Lock():
-            proc_hash = self.make_proc_hash(local_file, remote_file, size, download=True)
-            offset = 0
-            if proc_hash in self.running_proc:
-                if self.running_proc[proc_hash].status == TransferStatus.Running:
-                    self.push_response("system: 5 a transfer has been built for this transfer, please pause it first.")
-                    return
-
-                if resume:
-                    if os.path.isfile(local_file):
-                        offset = os.path.getsize(local_file)
-                        self.running_proc[proc_hash].trans_size = offset
-                    self.running_proc[proc_hash].status = TransferStatus.Running
-            else:
-                self.running_proc[proc_hash] = TransferProcess(local_file, remote_file, download=True, total_size=size,
-                                                               start_time=datetime.now())
-
-            self.refresh_transferring_signal.emit()
-
-            self.push_response(self.model.type('I'))
-            if self.mode == ClientMode.PORT:
-                self.push_response(self.model.port())
-            else:
-                self.push_response(self.model.pasv())
-
-            if offset > 0:
-                fp = open(local_file, 'r+b')
-                fp.seek(offset)
-                self.push_response(self.model.rest(offset))
-            else:
-                fp = open(local_file, 'wb')
-
-            def do_download(buf):
-                if self.running_proc[proc_hash].status != TransferStatus.Running:
-                    return False
-
-                fp.write(buf)
-                self.running_proc[proc_hash].trans_size += len(buf)
-                self.update_single_transfer.emit(self.running_proc[proc_hash])
-                return True
-
-            self.push_response(self.model.retr(remote_file, do_download))
-            self.finish_process(proc_hash)
-
-    def download_file(self, local_file, remote_file, size, resume=False):
-        if self.model.status == ClientStatus.DISCONNECT:
-            self.push_response("system: 5 you haven't connected to a server yet.")
-            return
-
-        t = threading.Thread(target=self.thread_download, args=(local_file, remote_file, size, resume,))
-        t.start()
-
     def download(self):
         if self.model.status == ClientStatus.DISCONNECT:
             self.push_response("system: 5 you haven't connected to a server yet.")
             return
 
-        item = self.view.remoteFileWidget.currentItem()
-        if item is None:
+        node = self.view.current_remote_node()
+        if node is None:
             self.push_response("system: 5 no file selected.")
             return
 
-        filename = item.text(FileHeader.Name.value)
-
-        local_file = os.path.join(self.local_cur_path, filename)
-        remote_file = os.path.join(self.remote_cur_path, filename)
-        size = self.remote_file_size[filename] if filename in self.remote_file_size else 0
+        local_file = os.path.join(self.local_cur_path, node.name)
+        remote_file = os.path.join(self.remote_cur_path, node.path())
+        size = node.size
 
-        self.download_file(local_file, remote_file, size)
+        if node.is_dir():
+            self.engine.mirror_dir(local_file, remote_file, download=True)
+        else:
+            self.engine.download_file(local_file, remote_file, size)
 
-    def thread_upload(self, local_file, remote_file, size, resume=False):
-        with threading.Lock():
-            proc_hash = self.make_proc_hash(local_file, remote_file, size, download=False)
-            offset = 0
-            if proc_hash in self.running_proc:
-                if self.running_proc[proc_hash].status == TransferStatus.Running:
-                    self.push_response("system: 5 a transfer has been built for this transfer, please pause it first.")
-                    return
+    def upload(self):
+        if self.model.status == ClientStatus.DISCONNECT:
+            self.push_response("system: 5 you haven't connected to a server yet.")
+            return
 
-                if resume:
-                    response, offset = self.model.size(self.running_proc[proc_hash].remote_file)
-                    self.push_response(response)
-                    self.running_proc[proc_hash].status = TransferStatus.Running
-                    self.running_proc[proc_hash].trans_size = offset
-            else:
-                self.running_proc[proc_hash] = TransferProcess(local_file, remote_file, download=False, total_size=size,
-                                                               start_time=datetime.now())
+        local_file = self.view.localFileModel.filePath(self.view.localFileView.selectedIndexes()[0])
+        remote_file = os.path.join(self.remote_cur_path, local_file.split('/')[-1])
 
-            self.refresh_transferring_signal.emit()
+        if os.path.isdir(local_file):
+            self.engine.mirror_dir(local_file, remote_file, download=False)
+        else:
+            self.engine.upload_file(local_file, remote_file, os.path.getsize(local_file))
 
-            self.push_response(self.model.type('I'))
-            if self.mode == ClientMode.PORT:
-                self.push_response(self.model.port())
-            else:
-                self.push_response(self.model.pasv())
+    def sync(self):
+        if self.model.status == ClientStatus.DISCONNECT:
+            self.push_response("system: 5 you haven't connected to a server yet.")
+            return
 
-            fp = open(local_file, 'rb')
+        class MyDialog(QDialog):
+            def __init__(self, local_dir, remote_dir):
+                super(MyDialog, self).__init__()
 
-            if offset > 0:
-                fp.seek(offset)
+                self.setWindowTitle("Sync Directories")
+                self.setFixedWidth(400)
 
-            def do_upload(n):
-                if self.running_proc[proc_hash].status != TransferStatus.Running:
-                    return ''
+                QBtn = QDialogButtonBox.Ok | QDialogButtonBox.Cancel
 
-                buf = fp.read(n)
-                self.running_proc[proc_hash].trans_size += len(buf)
-                self.update_single_transfer.emit(self.running_proc[proc_hash])
-                return buf
+                self.direction = QComboBox()
+                self.direction.addItems([SYNC_UPLOAD, SYNC_DOWNLOAD, SYNC_BOTH])
+                self.delete = QCheckBox("delete files missing on the source side")
+                self.dryRun = QCheckBox("dry run, only report what would change")
 
-            if offset > 0:
-                self.push_response(self.model.appe(remote_file, do_upload))
-            else:
-                self.push_response(self.model.stor(remote_file, do_upload))
-            self.finish_process(proc_hash)
+                self.buttonBox = QDialogButtonBox(QBtn)
+                self.buttonBox.accepted.connect(self.accept)
+                self.buttonBox.rejected.connect(self.reject)
 
-            # update view
-            self.refresh_remote_site()
+                self.layout = QVBoxLayout()
+                self.layout.addWidget(QLabel(f"{local_dir}\n{remote_dir}"))
+                self.layout.addWidget(self.direction)
+                self.layout.addWidget(self.delete)
+                self.layout.addWidget(self.dryRun)
+                self.layout.addWidget(self.buttonBox)
+                self.setLayout(self.layout)
 
-    def upload_file(self, local_file, remote_file, size, resume=False):
-        if self.model.status == ClientStatus.DISCONNECT:
-            self.push_response("system: 5 you haven't connected to a server yet.")
-            return
+        local_dir = self.local_cur_path
+        selections = self.view.localFileView.selectedIndexes()
+        if selections and self.view.localFileModel.isDir(selections[0]):
+            local_dir = self.view.localFileModel.filePath(selections[0])
 
-        t = threading.Thread(target=self.thread_upload, args=(local_file, remote_file, size, resume,))
-        t.start()
+        remote_dir = self.remote_cur_path
+        node = self.view.current_remote_node()
+        if node is not None and node.is_dir():
+            remote_dir = os.path.join(self.remote_cur_path, node.path())
 
-    def upload(self):
-        if self.model.status == ClientStatus.DISCONNECT:
-            self.push_response("system: 5 you haven't connected to a server yet.")
+        dlg = MyDialog(local_dir, remote_dir)
+        if not dlg.exec_():
             return
 
-        local_file = self.model.localFileModel.filePath(self.view.localFileView.selectedIndexes()[0])
-        remote_file = os.path.join(self.remote_cur_path, local_file.split('/')[-1])
-        size = os.path.getsize(local_file)
+        t = threading.Thread(target=self.engine.sync_dir, args=(local_dir, remote_dir, dlg.direction.currentText(),
+                                                                dlg.delete.isChecked(), dlg.dryRun.isChecked(),))
+        t.start()
 
-        self.upload_file(local_file, remote_file, size)
+    def pause_or_resume_transfer(self, running_proc):
+        self.engine.pause_or_resume_transfer(running_proc)
 
-    def pause_transfer(self, running_proc):
-        running_proc.status = TransferStatus.Paused
+    def cancel_transfer(self, running_proc):
+        self.engine.cancel_transfer(running_proc)
 
-    def resume_transfer(self, running_proc):
-        if running_proc.download:
-            self.download_file(running_proc.local_file, running_proc.remote_file, running_proc.total_size, resume=True)
-        else:
-            self.upload_file(running_proc.local_file, running_proc.remote_file, running_proc.total_size, resume=True)
+    def limit_transfer_rate(self):
+        procs = self.view.selected_transfers()
+        if not procs:
+            self.push_response("system: 5 no transfer selected.")
+            return
 
-    def pause_or_resume_transfer(self, running_proc):
-        if running_proc.status == TransferStatus.Paused:
-            self.resume_transfer(running_proc)
-        elif running_proc.status == TransferStatus.Running:
-            self.pause_transfer(running_proc)
-        else:
-            raise RuntimeError
+        kib, ok = QInputDialog.getInt(self.view, "Limit Rate", "KiB/s (0 for unlimited):",
+                                      procs[0].rate_limit // 1024, 0, 10 ** 7)
+        if not ok:
+            return
 
-    def cancel_transfer(self, running_proc):
-        self.cancel_process(
-            self.make_proc_hash(running_proc.local_file, running_proc.remote_file, running_proc.total_size,
-                                running_proc.download))
+        self.engine.limit_transfer_rate(procs, kib * 1024)
 
     def change_local_site(self):
         new_path = self.view.localSite.text()
@@ -310,50 +266,80 @@ class ClientCtrl(QtCore.QObject):
             return
 
         self.local_cur_path = new_path
-        self.view.localFileView.setRootIndex(self.model.localFileModel.setRootPath(self.local_cur_path))
+        self.local_populated = True
+        self.view.localFileView.setRootIndex(self.view.localFileModel.setRootPath(self.local_cur_path))
 
     def sync_local_path(self):
-        selected_path = self.model.localFileModel.filePath(self.view.localFileView.selectedIndexes()[0])
+        selected_path = self.view.localFileModel.filePath(self.view.localFileView.selectedIndexes()[0])
         self.view.localSite.setText(selected_path)
 
     def sync_remote_path(self):
-        items = self.view.remoteFileWidget.selectedItems()
-        if len(items) > 0:
-            item = items[0]
-            filename = item.text(FileHeader.Name.value)
-            selected_path = os.path.join(self.remote_cur_path, filename)
+        node = self.view.current_remote_node()
+        if node is not None:
+            selected_path = os.path.join(self.remote_cur_path, node.path())
         else:
             selected_path = self.remote_cur_path
         self.view.remoteSite.setText(selected_path)
 
-    def refresh_remote_site(self):
+    def refresh_remote_site(self, force=False):
+        self.listing_nodes = {}
+        self.view.refresh_remote_widget([])
         if self.model.status == ClientStatus.DISCONNECT:
-            self.view.refresh_remote_widget([])
             return
 
-        try:
-            if self.mode == ClientMode.PORT:
-                self.push_response(self.model.port())
-            else:
-                self.push_response(self.model.pasv())
-            response, file_list = self.model.list()
-            self.push_response(response)
+        self.list_remote_dir(self.view.remoteModel.root, force)
 
-            self.remote_file_size = {}
-            files = self.parse_file_list(file_list)
-            self.view.refresh_remote_widget(files)
-        except:
-            self.push_response("server: 5 fail to get remote list.")
-            self.view.refresh_remote_widget([])
+    def force_refresh_remote_site(self):
+        self.refresh_remote_site(force=True)
 
-    def update_single_transfer_process(self, proc):
-        self.view.update_transfer_item(proc)
+    def list_remote_dir(self, node, force=False):
+        path = os.path.join(self.remote_cur_path, node.path()) if node.path() else self.remote_cur_path
+        if not force:
+            entries = self.engine.listing_cache.get(self.engine.server_key(), path)
+            if entries is not None:
+                self.view.remoteModel.add_entries(node, entries)
+                self.view.remoteModel.sort_node(node)
+                return
+
+        # streamed on an async session, rows reach the view in batches while the listing arrives
+        if self.engine.async_pool is None:
+            return
+
+        token = next(self.listing_tokens)
+        self.listing_nodes[token] = node
+        self.run_async(self.engine.list_remote_dir_async(
+            path, force=True, on_entries=lambda batch: self.remote_entries_signal.emit(token, batch)),
+            lambda entries: self.finish_remote_list(token, isinstance(entries, list)))
+
+    def add_remote_entries(self, token, entries):
+        node = self.listing_nodes.get(token)
+        if node is not None:
+            self.view.remoteModel.add_entries(node, entries)
+
+    def finish_remote_list(self, token, complete):
+        node = self.listing_nodes.pop(token, None)
+        if node is not None:
+            self.view.remoteModel.sort_node(node)
+
+    def sample_progress(self):
+        if not self.engine.running_proc:
+            return
+
+        with self.engine.proc_lock:
+            procs = list(self.engine.running_proc.values())
+        updates = self.progress_sampler.sample(procs)
+        if updates:
+            self.view.update_transfer_items(updates)
 
     def refresh_finished_processing(self):
-        self.view.refresh_finished_widget(self.finished_proc)
+        with self.engine.proc_lock:
+            finished_proc = list(self.engine.finished_proc)
+        self.view.refresh_finished_widget(finished_proc)
 
     def refresh_transferring_processing(self):
-        self.view.refresh_transfer_widget(self.running_proc, self.pause_or_resume_transfer, self.cancel_transfer)
+        with self.engine.proc_lock:
+            running_proc = dict(self.engine.running_proc)
+        self.view.refresh_transfer_widget(running_proc, self.pause_or_resume_transfer, self.cancel_transfer)
 
     def change_remote_site(self):
         if self.model.status == ClientStatus.DISCONNECT:
@@ -398,7 +384,7 @@ class ClientCtrl(QtCore.QObject):
             self.push_response("system: 5 no file selected.")
             return
 
-        pathname = self.model.localFileModel.filePath(selections[0])
+        pathname = self.view.localFileModel.filePath(selections[0])
 
         new_dir_name = dlg.lineEdit.text()
         if os.path.isdir(pathname):
@@ -438,7 +424,7 @@ class ClientCtrl(QtCore.QObject):
             self.push_response("system: 5 no file selected.")
             return
 
-        filepath = self.model.localFileModel.filePath(selections[0])
+        filepath = self.view.localFileModel.filePath(selections[0])
         root_path = '/'.join(filepath.split('/')[:-1])
         old_name = filepath.split('/')[-1]
         dlg = MyDialog(old_name)
@@ -453,7 +439,7 @@ class ClientCtrl(QtCore.QObject):
             self.push_response("system: 5 you haven't connected to a server yet.")
             return
 
-        local_path = self.model.localFileModel.filePath(self.view.localFileView.selectedIndexes()[0])
+        local_path = self.view.localFileModel.filePath(self.view.localFileView.selectedIndexes()[0])
         try:
             if os.path.isdir(local_path):
                 os.rmdir(local_path)
@@ -491,24 +477,23 @@ class ClientCtrl(QtCore.QObject):
         if not dlg.exec_():
             return
 
-        new_dir_name = dlg.lineEdit.text()
-        response = self.model.mkd(new_dir_name)
-        self.push_response(response)
-        self.refresh_remote_site()
+        if self.engine.create_remote_dir(os.path.join(self.remote_cur_path, dlg.lineEdit.text())):
+            self.refresh_remote_site()
 
     def remote_delete(self):
         if self.model.status == ClientStatus.DISCONNECT:
             self.push_response("system: 5 you haven't connected to a server yet.")
             return
 
-        item = self.view.remoteFileWidget.currentItem()
-        name = item.text(FileHeader.Name.value)
-        if item.text(FileHeader.Type.value) == FileType.Folder.value:
-            response = self.model.rmd(name)
-        else:
-            response = self.model.dele(name)
-        self.push_response(response)
-        self.refresh_remote_site()
+        nodes = self.view.selected_remote_nodes()
+        if not nodes:
+            self.push_response("system: 5 no file selected.")
+            return
+
+        files = [os.path.join(self.remote_cur_path, node.path()) for node in nodes if not node.is_dir()]
+        dirs = [os.path.join(self.remote_cur_path, node.path()) for node in nodes if node.is_dir()]
+        t = threading.Thread(target=self.engine.remote_delete, args=(files, dirs))
+        t.start()
 
     def remote_rename(self):
         if self.model.status == ClientStatus.DISCONNECT:
@@ -536,18 +521,19 @@ class ClientCtrl(QtCore.QObject):
                 self.layout.addWidget(self.buttonBox)
                 self.setLayout(self.layout)
 
-        item = self.view.remoteFileWidget.currentItem()
-        old_name = item.text(FileHeader.Name.value)
+        node = self.view.current_remote_node()
+        if node is None:
+            self.push_response("system: 5 no file selected.")
+            return
 
-        dlg = MyDialog(old_name)
+        dlg = MyDialog(node.name)
         if not dlg.exec_():
             return
 
-        new_name = dlg.lineEdit.text()
-
-        self.push_response(self.model.rnfr(old_name))
-        self.push_response(self.model.rnto(new_name))
-        self.refresh_remote_site()
+        old_path = os.path.join(self.remote_cur_path, node.path())
+        new_path = os.path.join(os.path.dirname(old_path), dlg.lineEdit.text())
+        if self.engine.remote_rename(old_path, new_path):
+            self.refresh_remote_site()
 
     # help functions
     @staticmethod
@@ -560,66 +546,14 @@ class ClientCtrl(QtCore.QObject):
 
         self.insert_response_signal.emit(response)
 
-    def parse_single_file_list(self, list):
-        lists = list.split()
-        mode = lists[0]
-        # link = lists[1]
-        owner = lists[2]
-        # group = lists[3]
-        size = lists[4]
-        last_modified = ' '.join(lists[5:8])
-        filename = lists[8]
-        file_type = FileType.Folder.value if mode[0] == 'd' else FileType.File.value
-
-        # load file size
-        self.remote_file_size[filename] = int(size)
-
-        return filename, size, file_type, last_modified, mode, owner
-
-    def parse_file_list(self, file_list):
-        lists = []
-        for list in file_list.splitlines(keepends=False)[1:]:
-            lists.append(self.parse_single_file_list(list))
-        return lists
-
-    def make_proc_hash(self, local_file, remote_file, size, download):
-        if download:
-            return local_file + '<-' + remote_file + "_" + str(size)
-        else:
-            return local_file + '->' + remote_file + "_" + str(size)
-
-    def cancel_process(self, proc_hash):
-        self.push_response(f"system: 5 cancel job {proc_hash}")
-        self.running_proc[proc_hash].status = TransferStatus.Canceled
-        self.running_proc[proc_hash].end_time = datetime.now()
-
-        # erase the unfinished file
-        if self.running_proc[proc_hash].download:
-            if os.path.exists(self.running_proc[proc_hash].local_file):
-                os.remove(self.running_proc[proc_hash].local_file)
-        else:
-            self.push_response(self.model.dele(self.running_proc[proc_hash].remote_file))
-        self.finished_proc.append(self.running_proc[proc_hash])
-        del self.running_proc[proc_hash]
-
-        self.refresh_transferring_signal.emit()
-        self.refresh_finished_signal.emit()
-
-    def finish_process(self, proc_hash):
-        if self.running_proc[proc_hash].status == TransferStatus.Paused:
-            return
-
-        if self.running_proc[proc_hash].trans_size != self.running_proc[proc_hash].total_size:
-            self.push_response("system: 5 unmatched size, something might be wrong.")
-            self.running_proc[proc_hash].status = TransferStatus.Failed
-        else:
-            self.running_proc[proc_hash].status = TransferStatus.Finished
-        self.running_proc[proc_hash].end_time = datetime.now()
-        self.finished_proc.append(self.running_proc[proc_hash])
-        del self.running_proc[proc_hash]
-
-        self.refresh_transferring_signal.emit()
-        self.refresh_finished_signal.emit()
+    def run_async(self, coro, callback=None):
+        # drive an engine coroutine without blocking the GUI,
+        # callback is invoked on the GUI thread with the result
+        if self.async_bridge is None:
+            self.async_bridge = AsyncBridge(self)
+            if QApplication.instance() is not None:
+                QApplication.instance().aboutToQuit.connect(self.async_bridge.stop)
+        return self.async_bridge.submit(coro, callback)
 
 
 class Test(object):
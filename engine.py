@@ -0,0 +1,1089 @@
+import io
+import os
+from datetime import datetime
+import itertools
+import json
+import threading
+import time
+
+from async_model import AsyncSessionPool
+from cache import ListingCache
+from checksum import StreamHasher, parse_digest, server_method
+from config import *
+from journal import TransferJournal
+from listing import FileEntry
+from metrics import metrics
+from mirror import MirrorJob, remove_remote_tree
+from model import ClientModel
+from pool import SessionPool
+from ratelimit import BandwidthLimits
+from scheduler import TransferScheduler
+from segment import Segment, SegmentedDownload, split_segments
+from sync import SYNC_DOWNLOAD, build_sync_plan
+from writer import WriteBehindWriter, preallocate
+
+
+class TransferProcess(object):
+    ids = itertools.count()
+
+    def __init__(self, local_file='', remote_file='', download=True, total_size=0, trans_size=0,
+                 start_time=None, end_time=None, status=TransferStatus.Running):
+        self.id = next(TransferProcess.ids)
+        self.local_file = local_file
+        self.remote_file = remote_file
+        self.download = download
+        self.total_size = total_size
+        self.trans_size = trans_size
+        self.start_time = start_time
+        self.end_time = end_time
+        self.status = status
+        self.segments = None
+        self.tuning = None
+        self.mirror = None  # MirrorJob when the process copies a whole directory
+        self.priority = 0
+        self.rate_limit = 0  # bytes per second, 0 is unlimited
+        self.limiter = None
+        self.file_count = 0
+        self.files_done = 0
+        self.server = None
+        self.remote_mtime = None
+        self.auto_resume = False  # resume on the next login to its server
+        self.retries = 0  # automatic resumes since the transfer last made progress
+        self.wire_size = None  # bytes on the data connection of the last run, when it went compressed
+        self.checksum = None  # 'algorithm:digest' once verified
+        self.interrupted_at = 0
+
+
+def ignore(*args):
+    pass
+
+
+class TransferEngine(object):
+    # sessions, transfers and remote operations without any Qt: the GUI controller and
+    # the command line both drive one of these and learn about changes through callbacks
+    # that may be called from any thread
+    def __init__(self, model=None, on_response=ignore, on_transfers=ignore, on_finished=ignore, on_remote=ignore,
+                 journal_path=JOURNAL_PATH):
+        self.model = model if model is not None else ClientModel()
+        self.model.on_reconnect = self.on_reconnect
+        self.on_response = on_response  # (response), one line for the log
+        self.on_transfers = on_transfers  # (), the running transfers changed
+        self.on_finished = on_finished  # (), a transfer moved to the finished ones
+        self.on_remote = on_remote  # (), the remote tree changed
+
+        self.mode = ClientMode.PORT
+        self.login_info = None
+        self.use_mlsd = False
+        self.pool = None
+        self.async_pool = None  # AsyncClientModel sessions, for callers with an event loop
+        self.segment_count = SEGMENT_COUNT
+        self.tuning_profile = TUNING_PROFILE
+        self.compression = MODE_Z_ENABLED
+        self.compression_level = MODE_Z_LEVEL
+        self.checksum = CHECKSUM_ENABLED
+        self.write_behind = WRITER_ENABLED
+        self.fsync = WRITER_FSYNC
+
+        # process pool
+        self.running_proc = {}
+        self.finished_proc = []
+        self.proc_lock = threading.Lock()
+        self.proc_cond = threading.Condition(self.proc_lock)
+        self.scheduler = TransferScheduler()
+        self.bandwidth = BandwidthLimits()
+        self.journal = TransferJournal(journal_path, snapshot=self.journal_snapshot)
+        self.listing_cache = ListingCache()
+        self.keeper = None
+        self.keeper_stopped = threading.Event()
+        self.resume_lock = threading.Lock()
+        metrics.start_export()
+
+    def push_response(self, response):
+        self.on_response(response)
+
+    # connection
+    def login(self, host, port, username, password):
+        # the current remote directory on success, None otherwise
+        response = self.model.connect(host, port)
+        self.push_response(response)
+        if self.get_status_code(response)[0] == '5':
+            return None
+
+        for command, argu in ((self.model.user, username), (self.model.password, password)):
+            response = command(argu)
+            self.push_response(response)
+            if self.get_status_code(response)[0] == '5':
+                return None
+
+        response, features = self.model.feat()
+        self.push_response(response)
+        self.use_mlsd = 'MLSD' in features
+
+        self.login_info = (host, port, username, password)
+        if self.pool is not None:
+            self.pool.close()
+        self.pool = SessionPool(self.open_session, self.close_session)
+        if self.async_pool is not None:
+            self.async_pool.close()
+        self.async_pool = AsyncSessionPool(self.login_info)
+        self.start_keepalive()
+
+        response, path = self.model.pwd()
+        self.push_response(response)
+        return path
+
+    def logout(self):
+        self.scheduler.clear()
+        for proc_name in self.running_proc:
+            proc = self.running_proc[proc_name]
+            if proc.status in (TransferStatus.Running, TransferStatus.Queued):
+                proc.auto_resume = True
+            proc.status = TransferStatus.Paused
+
+        self.keeper_stopped.set()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        if self.async_pool is not None:
+            self.async_pool.close()
+            self.async_pool = None
+        self.model.quit()
+
+    def close(self):
+        self.keeper_stopped.set()
+        self.journal.close()
+        metrics.stop_export()
+
+    def is_connected(self):
+        return self.model.status != ClientStatus.DISCONNECT
+
+    def open_session(self):
+        if self.login_info is None:
+            return None
+
+        host, port, username, password = self.login_info
+        session = ClientModel(self.tuning_profile)
+        response = session.connect(host, port)
+        if self.get_status_code(response)[0] == '5':
+            self.push_response(response)
+            return None
+
+        for command, argu in ((session.user, username), (session.password, password)):
+            response = command(argu)
+            if self.get_status_code(response)[0] == '5':
+                self.push_response(response)
+                self.close_session(session)
+                return None
+        # same server, the features of the main connection hold
+        session.features = self.model.features
+        session.compression = self.compression
+        session.compression_level = self.compression_level
+        return session
+
+    def start_keepalive(self):
+        # NOOPs keep the idle control connection alive, pooled sessions are kept by the pool
+        self.keeper_stopped.set()
+        self.keeper_stopped = threading.Event()
+        self.keeper = threading.Thread(target=self.keep, args=(self.keeper_stopped,), daemon=True)
+        self.keeper.start()
+
+    def keep(self, stopped):
+        while not stopped.wait(KEEPALIVE_INTERVAL / 2):
+            try:
+                response = self.model.keepalive()
+            except (OSError, EOFError) as e:
+                self.push_response(f"system: 5 lost the connection to the server: {e}")
+                continue
+            if response is not None and self.get_status_code(response)[0] != '2':
+                self.push_response(response)
+
+    def on_reconnect(self, response):
+        # the network is back, transfers it interrupted need not wait for their timers
+        self.push_response(response)
+        threading.Thread(target=self.resume_journaled, daemon=True).start()
+
+    def close_session(self, session):
+        try:
+            session.quit()
+        except (OSError, EOFError):
+            session.command_socket.close()
+
+    def acquire_session(self):
+        session = None if self.pool is None else self.pool.acquire()
+        if session is None:
+            self.push_response("system: 5 fail to get a connection to the server.")
+        return session
+
+    # transfers
+    def thread_download(self, local_file, remote_file, size, resume=False):
+        proc_hash = self.make_proc_hash(local_file, remote_file, size, download=True)
+        if not self.start_process(proc_hash):
+            return
+        proc = self.running_proc[proc_hash]
+        offset = 0
+        if resume and os.path.isfile(local_file):
+            # a write-behind download counts what is in the file, but a crash can leave
+            # the preallocated length behind
+            offset = min(os.path.getsize(local_file), proc.trans_size)
+        proc.trans_size = offset
+
+        session = self.acquire_session()
+        if session is None:
+            self.interrupt_process(proc_hash, "no connection to the server")
+            return
+
+        discard = True
+        verified = True
+        hasher = None
+        session.limiter = proc.limiter
+        try:
+            if not self.verify_remote_file(proc, session) or offset > size:
+                self.push_response(f"system: 5 {remote_file} changed since the transfer started, restart it.")
+                offset = proc.trans_size = 0
+
+            self.push_response(session.type('I'))
+            plan = self.plan_checksum(session, remote_file, sidecars=True)
+            if plan is not None:
+                # a resumed download hashes what it already has first
+                hasher = session.hasher = StreamHasher(plan[0])
+                hasher.update_file(local_file, 0, offset)
+            self.push_mode(session, remote_file)
+            if self.mode == ClientMode.PORT:
+                self.push_response(session.port())
+            else:
+                self.push_response(session.pasv())
+
+            if offset > 0:
+                self.push_response(session.rest(offset))
+
+            def is_running():
+                return proc.status == TransferStatus.Running
+
+            def do_progress(n):
+                proc.trans_size += n
+                return is_running()
+
+            if self.write_behind:
+                writer = WriteBehindWriter(local_file, offset, size, on_written=do_progress, fsync=self.fsync)
+                try:
+                    response = session.retr(remote_file, consumer=writer.consumer(is_running))
+                finally:
+                    writer.close()
+            else:
+                with open(local_file, 'r+b' if offset > 0 else 'wb') as fp:
+                    fp.seek(offset)
+                    response = session.retr(remote_file, consumer=session.file_consumer(fp, do_progress))
+            self.push_response(response)
+            session.hasher = None
+            self.push_tuning(proc_hash, session)
+            discard = proc.status != TransferStatus.Running
+            if hasher is not None and not discard and self.is_complete(proc_hash, response):
+                verified = self.verify_checksum(proc_hash, session, remote_file, hasher, plan)
+        except (OSError, EOFError) as e:
+            self.interrupt_process(proc_hash, e)
+            return
+        finally:
+            session.limiter = None
+            session.hasher = None
+            if hasher is not None:
+                hasher.close()
+            self.pool.release(session, discard)
+        if not verified:
+            self.fail_process(proc_hash)
+            return
+        self.finish_process(proc_hash)
+
+    def thread_segmented_download(self, local_file, remote_file, size, resume=False):
+        proc_hash = self.make_proc_hash(local_file, remote_file, size, download=True)
+        if not self.start_process(proc_hash):
+            return
+        proc = self.running_proc[proc_hash]
+        if proc.segments is not None and not self.check_remote_file(proc):
+            self.push_response(f"system: 5 {remote_file} changed since the transfer started, restart it.")
+            proc.segments = None
+        if proc.segments is None or not os.path.isfile(local_file):
+            proc.segments = split_segments(size, self.segment_count)
+            proc.trans_size = 0
+            # preallocate so that every segment can write at its own offset
+            with open(local_file, 'wb') as fp:
+                if not preallocate(fp.fileno(), 0, size):
+                    fp.truncate(size)
+
+        progress_lock = threading.Lock()
+
+        def on_progress(n):
+            with progress_lock:
+                proc.trans_size += n
+
+        job = SegmentedDownload(self.pool.acquire, self.pool.release, local_file, remote_file, proc.segments,
+                                self.mode, is_running=lambda: proc.status == TransferStatus.Running,
+                                on_progress=on_progress, on_response=self.push_response, limiter=proc.limiter)
+        if not job.run() and proc.status == TransferStatus.Running:
+            self.interrupt_process(proc_hash, "segments failed")
+            return
+        if proc.status == TransferStatus.Running and proc.trans_size == size and \
+                not self.verify_segmented(proc_hash, local_file, remote_file, size):
+            self.fail_process(proc_hash)
+            return
+        self.finish_process(proc_hash)
+
+    def download_file(self, local_file, remote_file, size, resume=False):
+        if not self.is_connected():
+            self.push_response("system: 5 you haven't connected to a server yet.")
+            return
+
+        if self.segment_count > 1 and size >= SEGMENT_MIN_SIZE:
+            target = self.thread_segmented_download
+        else:
+            target = self.thread_download
+        self.queue_transfer(self.make_proc_hash(local_file, remote_file, size, download=True),
+                            TransferProcess(local_file, remote_file, download=True, total_size=size),
+                            target, (local_file, remote_file, size, resume,))
+
+    def thread_upload(self, local_file, remote_file, size, resume=False):
+        proc_hash = self.make_proc_hash(local_file, remote_file, size, download=False)
+        if not self.start_process(proc_hash):
+            return
+        proc = self.running_proc[proc_hash]
+        proc.trans_size = 0
+
+        session = self.acquire_session()
+        if session is None:
+            self.interrupt_process(proc_hash, "no connection to the server")
+            return
+
+        discard = True
+        verified = True
+        hasher = None
+        session.limiter = proc.limiter
+        try:
+            offset = 0
+            if resume:
+                response, offset = session.size(proc.remote_file)
+                self.push_response(response)
+                proc.trans_size = offset
+
+            self.push_response(session.type('I'))
+            plan = self.plan_checksum(session, remote_file, sidecars=False)
+            if plan is not None:
+                hasher = session.hasher = StreamHasher(plan[0])
+                hasher.update_file(local_file, 0, offset)
+            self.push_mode(session, remote_file, local_file)
+            if self.mode == ClientMode.PORT:
+                self.push_response(session.port())
+            else:
+                self.push_response(session.pasv())
+
+            fp = open(local_file, 'rb')
+
+            if offset > 0:
+                fp.seek(offset)
+
+            def do_upload(n):
+                if proc.status != TransferStatus.Running:
+                    return ''
+
+                buf = fp.read(n)
+                proc.trans_size += len(buf)
+                return buf
+
+            # used instead of do_upload when the model can sendfile() straight from fp
+            def do_progress(n):
+                if proc.status != TransferStatus.Running:
+                    return False
+
+                proc.trans_size += n
+                return True
+
+            with fp:
+                if offset > 0:
+                    response = session.appe(remote_file, do_upload, fp, do_progress)
+                else:
+                    response = session.stor(remote_file, do_upload, fp, do_progress)
+            self.push_response(response)
+            session.hasher = None
+            self.push_tuning(proc_hash, session)
+            discard = proc.status != TransferStatus.Running
+            if hasher is not None and not discard and self.is_complete(proc_hash, response):
+                verified = self.verify_checksum(proc_hash, session, remote_file, hasher, plan)
+        except (OSError, EOFError) as e:
+            self.interrupt_process(proc_hash, e)
+            return
+        finally:
+            session.limiter = None
+            session.hasher = None
+            if hasher is not None:
+                hasher.close()
+            self.pool.release(session, discard)
+        if verified:
+            self.finish_process(proc_hash)
+        else:
+            self.fail_process(proc_hash)
+
+        # the remote listing now holds a new or grown file
+        if proc.status == TransferStatus.Finished:
+            self.cache_add(remote_file, FileType.File.value, size)
+        else:
+            self.listing_cache.invalidate(self.server_key(), os.path.dirname(remote_file))
+        self.on_remote()
+
+    def upload_file(self, local_file, remote_file, size, resume=False):
+        if not self.is_connected():
+            self.push_response("system: 5 you haven't connected to a server yet.")
+            return
+
+        self.queue_transfer(self.make_proc_hash(local_file, remote_file, size, download=False),
+                            TransferProcess(local_file, remote_file, download=False, total_size=size),
+                            self.thread_upload, (local_file, remote_file, size, resume,))
+
+    def thread_mirror(self, local_dir, remote_dir, download):
+        proc_hash = self.make_proc_hash(local_dir, remote_dir, 0, download)
+        if not self.start_process(proc_hash):
+            return
+        proc = self.running_proc[proc_hash]
+        proc.mirror.acquire, proc.mirror.release = self.pool.acquire, self.pool.release
+        proc.mirror.mode, proc.mirror.mlsd = self.mode, self.use_mlsd
+        proc.mirror.checksum = server_method(self.model.features) if self.checksum else None
+
+        # the job walks the tree again on every run, files it already copied count as done at once
+        proc.total_size = proc.trans_size = proc.file_count = proc.files_done = 0
+        counter_lock = threading.Lock()
+
+        def on_found(size):
+            with counter_lock:
+                proc.total_size += size
+                proc.file_count += 1
+
+        def on_progress(n):
+            with counter_lock:
+                proc.trans_size += n
+
+        def on_done():
+            with counter_lock:
+                proc.files_done += 1
+
+        proc.mirror.on_found, proc.mirror.on_progress, proc.mirror.on_done = on_found, on_progress, on_done
+        proc.mirror.limiter = proc.limiter
+        ok = proc.mirror.run()
+        if proc.mirror.synced:
+            self.journal.record_synced(json.dumps(self.server_key()), proc.mirror.synced)
+        if not ok and proc.status == TransferStatus.Running:
+            self.push_response(f"system: 5 {proc.mirror.failed} items of {remote_dir} failed.")
+            self.fail_process(proc_hash)
+        else:
+            self.finish_process(proc_hash)
+
+        if not download or proc.mirror.plan is not None:
+            self.listing_cache.invalidate(self.server_key(), os.path.dirname(remote_dir))
+            self.listing_cache.invalidate(self.server_key(), remote_dir, recursive=True)
+            self.on_remote()
+
+    def mirror_dir(self, local_dir, remote_dir, download):
+        if not self.is_connected():
+            self.push_response("system: 5 you haven't connected to a server yet.")
+            return
+
+        proc = TransferProcess(local_dir, remote_dir, download=download)
+        proc.mirror = self.make_mirror_job(proc)
+        self.queue_transfer(self.make_proc_hash(local_dir, remote_dir, 0, download), proc,
+                            self.thread_mirror, (local_dir, remote_dir, download,))
+
+    def plan_sync(self, local_dir, remote_dir, direction, delete=False):
+        # planning lists both trees once, None when that fails
+        if direction == SYNC_DOWNLOAD:
+            os.makedirs(local_dir, exist_ok=True)
+        session = self.acquire_session()
+        if session is None:
+            return None
+
+        discard = True
+        try:
+            plan = build_sync_plan(session, local_dir, remote_dir, direction, delete, self.mode, self.use_mlsd,
+                                   'MDTM' in (self.model.features or ()), self.push_response,
+                                   self.journal.load_synced(json.dumps(self.server_key()), remote_dir))
+            discard = False
+        except (OSError, EOFError, RuntimeError) as e:
+            self.push_response(f"system: 5 fail to compare {local_dir} and {remote_dir}: {e}")
+            return None
+        finally:
+            self.pool.release(session, discard)
+
+        self.push_response(SYSTEM_HEADER + "2 " + plan.report())
+        for path in plan.conflicts:
+            self.push_response(f"system: 5 {path} differs on both sides with the same time, skipped.")
+        return plan
+
+    def sync_dir(self, local_dir, remote_dir, direction, delete=False, dry_run=False):
+        # only the files that differ are queued
+        plan = self.plan_sync(local_dir, remote_dir, direction, delete)
+        if plan is None or dry_run or not plan.actions:
+            return plan
+
+        proc = TransferProcess(local_dir, remote_dir, download=direction == SYNC_DOWNLOAD)
+        proc.mirror = self.make_mirror_job(proc)
+        proc.mirror.plan = plan
+        self.queue_transfer(self.make_proc_hash(local_dir, remote_dir, 0, proc.download), proc,
+                            self.thread_mirror, (local_dir, remote_dir, proc.download,))
+        return plan
+
+    def make_mirror_job(self, proc):
+        # sessions, mode and callbacks are bound on every run by thread_mirror
+        return MirrorJob(None, None, proc.local_file, proc.remote_file, proc.download, self.mode, self.use_mlsd,
+                         is_running=lambda: proc.status == TransferStatus.Running,
+                         on_found=None, on_progress=None, on_done=None, on_response=self.push_response)
+
+    def wait(self):
+        # block until nothing is running, queued, being canceled or about to resume
+        # after a dropped connection; paused transfers are left alone
+        with self.proc_cond:
+            while any(proc.status in (TransferStatus.Running, TransferStatus.Queued, TransferStatus.Canceled) or
+                      (proc.status == TransferStatus.Paused and proc.auto_resume and self.is_connected())
+                      for proc in self.running_proc.values()):
+                self.proc_cond.wait(1)
+
+    # transfer controls
+    def pause_transfer(self, running_proc):
+        if running_proc.status == TransferStatus.Queued:
+            self.scheduler.remove(self.proc_hash_of(running_proc))
+        running_proc.status = TransferStatus.Paused
+        running_proc.auto_resume = False
+        self.journal.record(self.journal_row(self.proc_hash_of(running_proc), running_proc))
+        self.notify_transfers()
+
+    def resume_transfer(self, running_proc):
+        if running_proc.mirror is not None:
+            self.mirror_dir(running_proc.local_file, running_proc.remote_file, running_proc.download)
+        elif running_proc.download:
+            self.download_file(running_proc.local_file, running_proc.remote_file, running_proc.total_size, resume=True)
+        else:
+            self.upload_file(running_proc.local_file, running_proc.remote_file, running_proc.total_size, resume=True)
+
+    def pause_or_resume_transfer(self, running_proc):
+        if running_proc.status == TransferStatus.Paused:
+            self.resume_transfer(running_proc)
+        elif running_proc.status in (TransferStatus.Running, TransferStatus.Queued):
+            self.pause_transfer(running_proc)
+        else:
+            raise RuntimeError
+
+    def cancel_transfer(self, running_proc):
+        self.cancel_process(self.proc_hash_of(running_proc))
+
+    def change_transfer_priority(self, procs, delta=0, top=False):
+        # reorders queued transfers live, running ones keep going
+        top_priority = self.scheduler.top_priority() + 1
+        for proc in procs:
+            proc.priority = top_priority if top else proc.priority + delta
+            self.scheduler.set_priority(self.proc_hash_of(proc), proc.priority)
+            if proc.limiter is not None:
+                proc.limiter.set_priority(proc.priority)
+
+    def limit_transfer_rate(self, procs, rate):
+        for proc in procs:
+            proc.rate_limit = rate
+            if proc.limiter is not None:
+                proc.limiter.buckets[0].set_rate(proc.rate_limit)
+
+    # remote operations, blocking
+    def list_remote_dir(self, path, force=False, on_entries=None):
+        # the entries of path, from the cache unless forced; streamed listings hand
+        # batches to on_entries as they arrive. None when the listing fails
+        if not force:
+            entries = self.listing_cache.get(self.server_key(), path)
+            if entries is not None:
+                if on_entries is not None:
+                    on_entries(entries)
+                return entries
+
+        session = self.acquire_session()
+        if session is None:
+            return None
+
+        discard = True
+        entries = []
+        try:
+            if self.mode == ClientMode.PORT:
+                self.push_response(session.port())
+            else:
+                self.push_response(session.pasv())
+
+            batch = []
+            flushed = time.monotonic()
+            for entry in session.iter_listing(path, self.use_mlsd):
+                batch.append(entry)
+                if len(batch) >= REMOTE_STREAM_BATCH or time.monotonic() - flushed > REMOTE_STREAM_INTERVAL:
+                    entries.extend(batch)
+                    if on_entries is not None:
+                        on_entries(batch)
+                    batch = []
+                    flushed = time.monotonic()
+            entries.extend(batch)
+            if batch and on_entries is not None:
+                on_entries(batch)
+            self.push_response(session.last_response)
+            discard = False
+        except (OSError, EOFError, RuntimeError):
+            self.push_response("server: 5 fail to get remote list.")
+        finally:
+            self.pool.release(session, discard)
+
+        if discard:
+            return None
+        self.listing_cache.put(self.server_key(), path, entries)
+        return entries
+
+    async def list_remote_dir_async(self, path, force=False, on_entries=None):
+        # list_remote_dir as a coroutine on an AsyncClientModel session: listings in
+        # flight share the caller's event loop instead of taking a thread each
+        if not force:
+            entries = self.listing_cache.get(self.server_key(), path)
+            if entries is not None:
+                if on_entries is not None:
+                    on_entries(entries)
+                return entries
+
+        pool = self.async_pool
+        session = None if pool is None else await pool.acquire()
+        if session is None:
+            self.push_response("system: 5 fail to get a connection to the server.")
+            return None
+
+        discard = True
+        entries = []
+        try:
+            if self.mode == ClientMode.PORT:
+                self.push_response(await session.port())
+            else:
+                self.push_response(await session.pasv())
+
+            batch = []
+            flushed = time.monotonic()
+            async for entry in session.iter_listing(path, self.use_mlsd):
+                batch.append(entry)
+                if len(batch) >= REMOTE_STREAM_BATCH or time.monotonic() - flushed > REMOTE_STREAM_INTERVAL:
+                    entries.extend(batch)
+                    if on_entries is not None:
+                        on_entries(batch)
+                    batch = []
+                    flushed = time.monotonic()
+            entries.extend(batch)
+            if batch and on_entries is not None:
+                on_entries(batch)
+            self.push_response(session.last_response)
+            discard = False
+        except (OSError, EOFError, RuntimeError):
+            self.push_response("server: 5 fail to get remote list.")
+        finally:
+            pool.release(session, discard)
+
+        if discard:
+            return None
+        self.listing_cache.put(self.server_key(), path, entries)
+        return entries
+
+    def create_remote_dir(self, remote_dir):
+        response = self.model.mkd(remote_dir)
+        self.push_response(response)
+        if self.get_status_code(response)[0] != '2':
+            return False
+
+        self.cache_add(remote_dir, FileType.Folder.value)
+        return True
+
+    def remote_delete(self, files, dirs):
+        session = self.acquire_session()
+        if session is None:
+            return False
+
+        ok = True
+        discard = True
+        try:
+            # the files go out as one pipelined batch of DELE
+            for name, response in zip(files, session.dele_many(files)):
+                self.push_response(response)
+                if self.get_status_code(response)[0] == '2':
+                    self.listing_cache.remove_entry(self.server_key(), name)
+                else:
+                    ok = False
+            for name in dirs:
+                if not remove_remote_tree(session, name, self.mode, self.use_mlsd, self.push_response):
+                    self.push_response(f"system: 5 {name} is not removed completely.")
+                    ok = False
+                self.listing_cache.invalidate(self.server_key(), name, recursive=True)
+                self.listing_cache.invalidate(self.server_key(), os.path.dirname(name))
+            discard = False
+        except (OSError, EOFError, RuntimeError):
+            self.push_response("system: 5 fail to remove the selected files.")
+            for name in files + dirs:
+                self.listing_cache.invalidate(self.server_key(), os.path.dirname(name))
+            ok = False
+        finally:
+            self.pool.release(session, discard)
+
+        self.on_remote()
+        return ok
+
+    def remote_rename(self, old_path, new_path):
+        try:
+            response = self.model.rename_many([(old_path, new_path)])[0]
+        except (OSError, EOFError, RuntimeError):
+            self.push_response(f"system: 5 fail to rename {old_path}.")
+            self.listing_cache.invalidate(self.server_key(), os.path.dirname(old_path))
+            return False
+        self.push_response(response)
+        if self.get_status_code(response)[0] != '2':
+            return False
+
+        self.listing_cache.rename_entry(self.server_key(), old_path, new_path)
+        return True
+
+    # help functions
+    @staticmethod
+    def get_status_code(msg):
+        return msg.split(' ')[1]
+
+    def server_key(self):
+        # listings are cached per (host, port, user)
+        return None if self.login_info is None else self.login_info[:3]
+
+    def cache_add(self, remote_path, file_type, size=0):
+        now = time.time()
+        entry = FileEntry(os.path.basename(remote_path), size, file_type, time.strftime('%b %d %H:%M'), mtime=now)
+        self.listing_cache.add_entry(self.server_key(), os.path.dirname(remote_path), entry)
+
+    def push_tuning(self, proc_hash, session):
+        # tell why a transfer runs at the speed it does
+        self.running_proc[proc_hash].tuning = session.tuner.stats()
+        self.push_response(SYSTEM_HEADER + "2 " + session.tuner.describe())
+        compression = session.describe_compression()
+        if compression is not None:
+            self.running_proc[proc_hash].wire_size = session.wire_bytes
+            self.push_response(SYSTEM_HEADER + "2 " + compression)
+
+    # checksums
+    def plan_checksum(self, session, remote_file, sidecars):
+        # (algorithm, command, sidecar) to check remote_file with: the server's hash
+        # command, else a remote_file.sha256/.md5 next to a download; None when neither
+        if not self.checksum:
+            return None
+        method = server_method(session.features)
+        if method is not None:
+            return method[0], method[1], None
+        if not sidecars or not CHECKSUM_SIDECARS:
+            return None
+
+        names = [remote_file + extension for extension, _ in CHECKSUM_SIDECARS]
+        for (response, size), name, (_, algorithm) in zip(session.size_many(names), names, CHECKSUM_SIDECARS):
+            if self.get_status_code(response)[0] == '2' and size > 0:
+                return algorithm, None, name
+        return None
+
+    def remote_checksum(self, session, remote_file, plan):
+        algorithm, command, sidecar = plan
+        if command is not None:
+            response, digest = session.checksum(remote_file, algorithm, command)
+            self.push_response(response)
+            return digest
+
+        buf = io.BytesIO()
+        if self.mode == ClientMode.PORT:
+            self.push_response(session.port())
+        else:
+            self.push_response(session.pasv())
+        response = session.retr(sidecar, callback=lambda data: buf.write(data) or True)
+        self.push_response(response)
+        if self.get_status_code(response.splitlines()[-1])[0] != '2':
+            return None
+
+        # a sidecar may list several files, "digest  name" or "digest *name" per line
+        text = buf.getvalue().decode(errors='replace')
+        for line in text.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[-1].lstrip('*') == os.path.basename(remote_file):
+                return parse_digest(line, algorithm)
+        return parse_digest(text, algorithm)
+
+    def verify_checksum(self, proc_hash, session, remote_file, hasher, plan):
+        # False only when the digests differ, a transfer with nothing to compare with passes
+        local = hasher.hexdigest()
+        remote = self.remote_checksum(session, remote_file, plan)
+        if local is None or remote is None:
+            self.push_response(f"system: 4 {remote_file} not verified, no {plan[0]} digest to compare with.")
+            return True
+
+        if local != remote:
+            self.push_response(f"system: 5 {remote_file} {plan[0]} mismatch, local {local}, remote {remote}.")
+            metrics.inc('ftp_transfer_errors_total', reason='checksum')
+            return False
+        self.running_proc[proc_hash].checksum = f"{plan[0]}:{local}"
+        self.push_response(f"system: 2 {remote_file} {plan[0]} verified: {local}.")
+        return True
+
+    def verify_segmented(self, proc_hash, local_file, remote_file, size):
+        # segments arrive out of order, so the finished file is read back once
+        session = self.pool.acquire() if self.checksum else None
+        if session is None:
+            return True
+
+        discard = True
+        hasher = None
+        try:
+            plan = self.plan_checksum(session, remote_file, sidecars=True)
+            if plan is None:
+                discard = False
+                return True
+            hasher = StreamHasher(plan[0])
+            hasher.update_file(local_file, 0, size)
+            verified = self.verify_checksum(proc_hash, session, remote_file, hasher, plan)
+            discard = False
+            return verified
+        except (OSError, EOFError) as e:
+            self.push_response(f"system: 4 {remote_file} not verified: {e}")
+            return True
+        finally:
+            if hasher is not None:
+                hasher.close()
+            self.pool.release(session, discard)
+
+    def is_complete(self, proc_hash, response):
+        return self.running_proc[proc_hash].trans_size == self.running_proc[proc_hash].total_size and \
+            self.get_status_code(response.splitlines()[-1])[0] == '2'
+
+    def push_mode(self, session, remote_file, local_file=None):
+        response = session.select_mode(remote_file, local_file)
+        if response is not None:
+            self.push_response(response)
+
+    def notify_transfers(self):
+        with self.proc_cond:
+            self.proc_cond.notify_all()
+        self.on_transfers()
+
+    def notify_finished(self):
+        self.notify_transfers()
+        self.on_finished()
+
+    def proc_hash_of(self, proc):
+        # a directory transfer grows while it is walked, its hash does not use the size
+        return self.make_proc_hash(proc.local_file, proc.remote_file,
+                                   0 if proc.mirror is not None else proc.total_size, proc.download)
+
+    def make_proc_hash(self, local_file, remote_file, size, download):
+        if download:
+            return local_file + '<-' + remote_file + "_" + str(size)
+        else:
+            return local_file + '->' + remote_file + "_" + str(size)
+
+    # process life cycle
+    def queue_transfer(self, proc_hash, proc, target, args):
+        with self.proc_lock:
+            if proc_hash in self.running_proc:
+                proc = self.running_proc[proc_hash]
+                if proc.status in (TransferStatus.Running, TransferStatus.Queued):
+                    self.push_response("system: 5 a transfer has been built for this transfer, please pause it first.")
+                    return
+            else:
+                proc.server = self.server_key()
+                self.running_proc[proc_hash] = proc
+            proc.status = TransferStatus.Queued
+            proc.auto_resume = False
+
+        self.journal.record(self.journal_row(proc_hash, proc))
+        self.scheduler.submit(proc_hash, self.server_key(), target, args, proc.priority, proc.total_size)
+        self.notify_transfers()
+
+    def start_process(self, proc_hash):
+        # False when the transfer was paused or canceled after the scheduler picked it
+        # and before its thread got here; the thread then returns at once
+        with self.proc_lock:
+            proc = self.running_proc.get(proc_hash)
+            if proc is None or proc.status != TransferStatus.Queued:
+                return False
+            proc.status = TransferStatus.Running
+        if proc.start_time is None:
+            proc.start_time = datetime.now()
+        if proc.limiter is None:
+            proc.limiter = self.bandwidth.limiter(self.server_key(), proc.rate_limit, proc.priority)
+        self.journal.record(self.journal_row(proc_hash, proc))
+        self.notify_transfers()
+        return True
+
+    def finish_process(self, proc_hash):
+        if self.running_proc[proc_hash].limiter is not None:
+            self.running_proc[proc_hash].limiter.release()
+        if self.running_proc[proc_hash].status == TransferStatus.Canceled:
+            self.close_canceled(proc_hash)
+            return
+        if self.running_proc[proc_hash].status == TransferStatus.Paused:
+            self.journal.record(self.journal_row(proc_hash, self.running_proc[proc_hash]))
+            self.notify_transfers()
+            return
+
+        if self.running_proc[proc_hash].trans_size != self.running_proc[proc_hash].total_size:
+            self.push_response("system: 5 unmatched size, something might be wrong.")
+            metrics.inc('ftp_transfer_errors_total', reason='size_mismatch')
+            self.running_proc[proc_hash].status = TransferStatus.Failed
+        else:
+            self.running_proc[proc_hash].status = TransferStatus.Finished
+        self.running_proc[proc_hash].end_time = datetime.now()
+        with self.proc_lock:
+            self.finished_proc.append(self.running_proc.pop(proc_hash))
+        self.journal.remove(proc_hash)
+        self.notify_finished()
+
+    def fail_process(self, proc_hash):
+        if self.running_proc[proc_hash].limiter is not None:
+            self.running_proc[proc_hash].limiter.release()
+        if self.running_proc[proc_hash].status == TransferStatus.Canceled:
+            self.close_canceled(proc_hash)
+            return
+        self.running_proc[proc_hash].status = TransferStatus.Failed
+        self.running_proc[proc_hash].end_time = datetime.now()
+        metrics.inc('ftp_transfer_errors_total', reason='failed')
+        with self.proc_lock:
+            self.finished_proc.append(self.running_proc.pop(proc_hash))
+        self.journal.remove(proc_hash)
+        self.notify_finished()
+
+    def interrupt_process(self, proc_hash, error):
+        # the connection broke under a running transfer: park it and pick it up
+        # again with REST/APPE, giving up after TRANSFER_RESUME_RETRY fruitless tries
+        proc = self.running_proc.get(proc_hash)
+        if proc is None:
+            return
+        if proc.status != TransferStatus.Running:
+            self.finish_process(proc_hash)
+            return
+
+        if proc.trans_size > proc.interrupted_at:
+            proc.retries = 0
+        proc.interrupted_at = proc.trans_size
+        proc.retries += 1
+        if proc.retries > TRANSFER_RESUME_RETRY:
+            self.push_response(f"system: 5 {proc.remote_file} failed: {error}")
+            self.fail_process(proc_hash)
+            return
+
+        delay = TRANSFER_RESUME_DELAY * proc.retries
+        self.push_response(f"system: 4 {proc.remote_file} interrupted ({str(error) or type(error).__name__}), "
+                           f"resume in {delay}s.")
+        metrics.inc('ftp_transfer_errors_total', reason='interrupted')
+        proc.status = TransferStatus.Paused
+        proc.auto_resume = True
+        self.finish_process(proc_hash)
+        timer = threading.Timer(delay, self.resume_journaled)
+        timer.daemon = True
+        timer.start()
+
+    def cancel_process(self, proc_hash):
+        # a running transfer only gets the status, its thread stops and closes it
+        self.push_response(f"system: 5 cancel job {proc_hash}")
+        self.scheduler.remove(proc_hash)
+        with self.proc_lock:
+            proc = self.running_proc.get(proc_hash)
+            if proc is None:
+                return
+            running = proc.status == TransferStatus.Running
+            proc.status = TransferStatus.Canceled
+            proc.end_time = datetime.now()
+        if running:
+            self.notify_transfers()
+            return
+        self.close_canceled(proc_hash)
+
+    def close_canceled(self, proc_hash):
+        # erase the unfinished file, a directory keeps what was already copied
+        if self.running_proc[proc_hash].mirror is not None or self.running_proc[proc_hash].start_time is None:
+            pass
+        elif self.running_proc[proc_hash].download:
+            if os.path.exists(self.running_proc[proc_hash].local_file):
+                os.remove(self.running_proc[proc_hash].local_file)
+        else:
+            self.push_response(self.model.dele(self.running_proc[proc_hash].remote_file))
+            self.listing_cache.remove_entry(self.server_key(), self.running_proc[proc_hash].remote_file)
+        with self.proc_lock:
+            self.finished_proc.append(self.running_proc.pop(proc_hash))
+        self.journal.remove(proc_hash)
+        self.notify_finished()
+
+    # transfer journal
+    def journal_row(self, proc_hash, proc):
+        return {'key': proc_hash,
+                'server': json.dumps(proc.server),
+                'local_file': proc.local_file,
+                'remote_file': proc.remote_file,
+                'download': int(proc.download),
+                'is_dir': int(proc.mirror is not None),
+                'total_size': proc.total_size,
+                'trans_size': proc.trans_size,
+                'remote_mtime': proc.remote_mtime,
+                'segments': None if proc.segments is None else
+                [(segment.start, segment.end, segment.trans_size) for segment in proc.segments],
+                'status': proc.status.value,
+                'auto_resume': int(proc.auto_resume or proc.status in (TransferStatus.Running, TransferStatus.Queued)),
+                'priority': proc.priority,
+                'rate_limit': proc.rate_limit}
+
+    def journal_snapshot(self):
+        with self.proc_lock:
+            procs = list(self.running_proc.items())
+        return [self.journal_row(proc_hash, proc) for proc_hash, proc in procs]
+
+    def restore_journal(self):
+        for row in self.journal.load():
+            proc = TransferProcess(row['local_file'], row['remote_file'], download=bool(row['download']),
+                                   total_size=row['total_size'], trans_size=row['trans_size'],
+                                   status=TransferStatus.Paused)
+            proc.server = tuple(json.loads(row['server'])) if row['server'] != 'null' else None
+            proc.remote_mtime = row['remote_mtime']
+            proc.auto_resume = bool(row['auto_resume'])
+            proc.priority = row['priority']
+            proc.rate_limit = row['rate_limit']
+            if row['segments'] is not None:
+                proc.segments = []
+                for start, end, trans_size in row['segments']:
+                    proc.segments.append(Segment(start, end))
+                    proc.segments[-1].trans_size = trans_size
+            if row['is_dir']:
+                proc.mirror = self.make_mirror_job(proc)
+            self.running_proc[row['key']] = proc
+        self.notify_transfers()
+
+    def resume_journaled(self):
+        # reconnects and resume timers may call this at once, a transfer is queued only once
+        with self.resume_lock:
+            if not self.is_connected():
+                return
+            with self.proc_lock:
+                procs = [proc for proc in self.running_proc.values()
+                         if proc.auto_resume and proc.server == self.server_key() and
+                         proc.status == TransferStatus.Paused]
+            for proc in procs:
+                self.push_response(f"system: 2 resume {proc.remote_file}")
+                self.resume_transfer(proc)
+
+    def verify_remote_file(self, proc, session):
+        # a partial download is only continued while MDTM still reports the time it started with
+        response, mtime = session.mdtm(proc.remote_file)
+        self.push_response(response)
+        if mtime is None:
+            return True
+
+        unchanged = proc.remote_mtime is None or proc.remote_mtime == mtime
+        proc.remote_mtime = mtime
+        return unchanged
+
+    def check_remote_file(self, proc):
+        session = self.pool.acquire()
+        if session is None:
+            return True
+
+        discard = True
+        try:
+            unchanged = self.verify_remote_file(proc, session)
+            discard = False
+        except (OSError, EOFError):
+            unchanged = True
+        finally:
+            self.pool.release(session, discard)
+        return unchanged
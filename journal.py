@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+
+from config import *
+
+JOURNAL_COLUMNS = ('key', 'server', 'local_file', 'remote_file', 'download', 'is_dir', 'total_size', 'trans_size',
+                   'remote_mtime', 'segments', 'status', 'auto_resume', 'priority', 'rate_limit')
+
+
+class TransferJournal(object):
+    # unfinished transfers on disk so that they survive a crash or an exit: status
+    # changes are queued as they happen, progress is sampled every `interval` seconds,
+    # and both reach SQLite (WAL mode) in one transaction from a background thread
+    def __init__(self, path=JOURNAL_PATH, snapshot=None, interval=JOURNAL_INTERVAL):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS transfers ('
+                        'key TEXT PRIMARY KEY, server TEXT, local_file TEXT, remote_file TEXT, download INTEGER, '
+                        'is_dir INTEGER, total_size INTEGER, trans_size INTEGER, remote_mtime REAL, segments TEXT, '
+                        'status TEXT, auto_resume INTEGER, priority INTEGER, rate_limit INTEGER)')
+        # what a sync upload left on both sides, when the server could not take the local time
+        self.db.execute('CREATE TABLE IF NOT EXISTS synced ('
+                        'server TEXT, remote_file TEXT, size INTEGER, local_mtime REAL, remote_mtime REAL, '
+                        'PRIMARY KEY (server, remote_file))')
+        self.db.commit()
+        self.db_lock = threading.Lock()
+
+        self.snapshot = snapshot  # () -> [row], progress of the transfers that are running
+        self.interval = interval
+        self.pending = {}  # key -> row, None to delete
+        self.written = {}  # key -> values last written, unchanged rows are skipped
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.keep, daemon=True)
+        self.thread.start()
+
+    def record(self, row):
+        with self.lock:
+            self.pending[row['key']] = row
+
+    def remove(self, key):
+        with self.lock:
+            self.pending[key] = None
+
+    def load(self):
+        with self.db_lock:
+            cursor = self.db.execute('SELECT ' + ', '.join(JOURNAL_COLUMNS) + ' FROM transfers ORDER BY rowid')
+            rows = [dict(zip(JOURNAL_COLUMNS, values)) for values in cursor.fetchall()]
+        for row in rows:
+            row['segments'] = json.loads(row['segments']) if row['segments'] else None
+        return rows
+
+    def record_synced(self, server, rows):
+        # rows of (remote_file, size, local_mtime, remote_mtime), written at once
+        with self.db_lock:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO synced VALUES (?, ?, ?, ?, ?)',
+                                    [(server,) + tuple(row) for row in rows])
+
+    def load_synced(self, server, remote_dir):
+        # relative path -> (size, local_mtime, remote_mtime) of the files under remote_dir
+        prefix = remote_dir.rstrip('/') + '/'
+        with self.db_lock:
+            cursor = self.db.execute('SELECT remote_file, size, local_mtime, remote_mtime FROM synced '
+                                     'WHERE server = ? AND substr(remote_file, 1, ?) = ?',
+                                     (server, len(prefix), prefix))
+            return dict((remote_file[len(prefix):], tuple(values)) for remote_file, *values in cursor.fetchall())
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if self.snapshot is not None:
+            for row in self.snapshot():
+                pending.setdefault(row['key'], row)
+        if not pending:
+            return
+
+        writes = []
+        deletes = []
+        for key, row in pending.items():
+            if row is None:
+                deletes.append((key,))
+                self.written.pop(key, None)
+                continue
+
+            row = dict(row)
+            row['segments'] = json.dumps(row['segments']) if row['segments'] else None
+            values = tuple(row[column] for column in JOURNAL_COLUMNS)
+            if self.written.get(key) != values:
+                writes.append(values)
+                self.written[key] = values
+        if not writes and not deletes:
+            return
+
+        with self.db_lock:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO transfers VALUES (' +
+                                    ', '.join('?' * len(JOURNAL_COLUMNS)) + ')', writes)
+                self.db.executemany('DELETE FROM transfers WHERE key = ?', deletes)
+
+    def keep(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+        with self.db_lock:
+            self.db.close()
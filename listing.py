@@ -0,0 +1,157 @@
+import calendar
+import codecs
+import re
+import time
+
+from config import *
+
+MONTHS = dict((name, index) for index, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1))
+DOS_LINE = re.compile(r'^(\d\d)-(\d\d)-(\d\d)\s+(\d\d):(\d\d)([AP]M)\s+(<DIR>|\d+)\s+(.+)$', re.IGNORECASE)
+
+
+class FileEntry(object):
+    __slots__ = ('name', 'size', 'type', 'last_modified', 'mode', 'owner', 'mtime')
+
+    def __init__(self, name, size=0, type=FileType.File.value, last_modified='', mode='', owner='', mtime=None):
+        self.name = name
+        self.size = size
+        self.type = type
+        self.last_modified = last_modified
+        self.mode = mode
+        self.owner = owner
+        self.mtime = mtime  # seconds since epoch (UTC) when the listing tells
+
+    def is_dir(self):
+        return self.type == FileType.Folder.value
+
+    # unpacks as a row of the remote file view, in FileHeader order
+    def __iter__(self):
+        return iter((self.name, self.size, self.type, self.last_modified, self.mode, self.owner))
+
+
+class LineSplitter(object):
+    # raw data-socket chunks in, complete text lines out, for callers that are
+    # handed the chunks instead of pulling them
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.rest = ''
+
+    def feed(self, chunk):
+        lines = (self.rest + self.decoder.decode(chunk)).split('\n')
+        self.rest = lines.pop()
+        return [line.rstrip('\r') for line in lines]
+
+    def close(self):
+        rest = (self.rest + self.decoder.decode(b'', final=True)).rstrip('\r')
+        self.rest = ''
+        return [rest] if rest else []
+
+
+def iter_lines(chunks):
+    # split raw data-socket chunks into text lines without joining the whole listing
+    splitter = LineSplitter()
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.close()
+
+
+def parse_lines(lines, mlsd=False):
+    parse = parse_mlsd_line if mlsd else parse_list_line
+    for line in lines:
+        entry = parse(line)
+        if entry is not None:
+            yield entry
+
+
+def parse_listing(chunks, mlsd=False):
+    return parse_lines(iter_lines(chunks), mlsd)
+
+
+def parse_list_line(line):
+    parts = line.split(None, 8)
+    if len(parts) < 9:
+        return parse_dos_line(line)
+
+    mode, _, owner, _, size, month, day, year_or_time, name = parts
+    if not size.isdigit():
+        return None
+
+    file_type = FileType.Folder.value if mode[0] == 'd' else FileType.File.value
+    if mode[0] == 'l' and ' -> ' in name:
+        name = name.split(' -> ', 1)[0]
+    if name in ('.', '..'):
+        return None
+
+    return FileEntry(name, int(size), file_type, ' '.join((month, day, year_or_time)), mode, owner,
+                     list_mtime(month, day, year_or_time))
+
+
+def parse_dos_line(line):
+    match = DOS_LINE.match(line)
+    if match is None:
+        return None
+
+    month, day, year, hour, minute, ampm, size, name = match.groups()
+    hour = int(hour) % 12 + (12 if ampm.upper() == 'PM' else 0)
+    year = int(year) + (2000 if int(year) < 70 else 1900)
+    mtime = calendar.timegm((year, int(month), int(day), hour, int(minute), 0))
+    if size.upper() == '<DIR>':
+        return FileEntry(name, 0, FileType.Folder.value, line[:17], '', '', mtime)
+    return FileEntry(name, int(size), FileType.File.value, line[:17], '', '', mtime)
+
+
+def parse_mlsd_line(line):
+    facts, _, name = line.partition(' ')
+    if not name:
+        return None
+
+    fact = {}
+    for item in facts.split(';'):
+        key, _, value = item.partition('=')
+        if key:
+            fact[key.lower()] = value
+
+    kind = fact.get('type', 'file').lower()
+    if kind in ('cdir', 'pdir'):
+        return None
+
+    mtime = mdtm_to_time(fact['modify']) if 'modify' in fact else None
+    last_modified = time.strftime('%Y-%m-%d %H:%M', time.gmtime(mtime)) if mtime is not None else ''
+    size = fact.get('size', fact.get('sizd', '0'))
+    return FileEntry(name,
+                     int(size) if size.isdigit() else 0,
+                     FileType.Folder.value if kind == 'dir' else FileType.File.value,
+                     last_modified,
+                     fact.get('unix.mode', fact.get('perm', '')),
+                     fact.get('unix.owner', fact.get('unix.uid', '')),
+                     mtime)
+
+
+def mdtm_to_time(value):
+    # YYYYMMDDHHMMSS[.sss] as used by MDTM and the MLSD modify fact
+    try:
+        return calendar.timegm(time.strptime(value[:14], '%Y%m%d%H%M%S'))
+    except ValueError:
+        return None
+
+
+def list_mtime(month, day, year_or_time):
+    # `ls -l` style: "Jan 01 12:00" for the last six months, "Jan 01 2019" otherwise
+    month = MONTHS.get(month[:3].lower())
+    if month is None or not day.isdigit():
+        return None
+
+    if ':' in year_or_time:
+        hour, _, minute = year_or_time.partition(':')
+        if not hour.isdigit() or not minute.isdigit():
+            return None
+        now = time.gmtime()
+        mtime = calendar.timegm((now.tm_year, month, int(day), int(hour), int(minute), 0))
+        if mtime > time.time() + 86400:
+            mtime = calendar.timegm((now.tm_year - 1, month, int(day), int(hour), int(minute), 0))
+        return mtime
+
+    if year_or_time.isdigit():
+        return calendar.timegm((int(year_or_time), month, int(day), 0, 0, 0))
+    return None
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from config import *
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'ftp_command_seconds': ('histogram', "Control command round trip, from sending it to its complete reply."),
+    'ftp_command_errors_total': ('counter', "Commands answered with a 4xx or 5xx reply."),
+    'ftp_data_connect_seconds': ('histogram', "Data connection setup, PORT accept or PASV connect."),
+    'ftp_data_connect_errors_total': ('counter', "Data connections that could not be set up."),
+    'ftp_transfer_bytes_total': ('counter', "Bytes moved over data connections."),
+    'ftp_transfer_raw_bytes_total': ('counter', "Uncompressed size of what MODE Z transfers moved."),
+    'ftp_transfer_seconds': ('histogram', "Data transfer duration, listings included."),
+    'ftp_transfers_total': ('counter', "Data transfers by direction and result."),
+    'ftp_transfer_errors_total': ('counter', "Transfers the client gave up on, by reason."),
+    'ftp_reconnects_total': ('counter', "Control connections restored after they were dropped."),
+}
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for le, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((le, total))
+        return result
+
+
+class TransferTimeline(object):
+    # bytes over time of one data transfer, sampled every `interval` seconds
+    __slots__ = ('registry', 'direction', 'name', 'interval', 'start', 'next_sample', 'bytes', 'samples')
+
+    def __init__(self, registry, direction, name, interval):
+        self.registry = registry
+        self.direction = direction
+        self.name = name
+        self.interval = interval
+        self.start = time.monotonic()
+        self.next_sample = self.start + interval
+        self.bytes = 0
+        self.samples = []  # (seconds since start, bytes so far)
+
+    def add(self, n):
+        self.bytes += n
+        now = time.monotonic()
+        if now >= self.next_sample:
+            self.samples.append((round(now - self.start, 3), self.bytes))
+            self.next_sample = now + self.interval
+
+    def finish(self, ok):
+        self.registry.finish_transfer(self, time.monotonic() - self.start, ok)
+
+
+class Metrics(object):
+    # counters and histograms of the protocol layer. Every hook starts with one
+    # attribute check, so a disabled registry costs next to nothing on hot paths
+    def __init__(self, enabled=METRICS_ENABLED, timeline_interval=METRICS_TIMELINE_INTERVAL,
+                 keep_timelines=METRICS_KEEP_TIMELINES):
+        self.enabled = enabled
+        self.timeline_interval = timeline_interval
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.timelines = deque(maxlen=keep_timelines)
+        self.exporter = None
+        self.export_paths = None
+        self.stopped = threading.Event()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.timelines.clear()
+
+    def inc(self, name, n=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    # protocol hooks
+    def command(self, command, seconds, response):
+        self.observe('ftp_command_seconds', seconds, command=command)
+        code = response.split(' ', 2)[1][:1] if ' ' in response else ''
+        if code in ('4', '5'):
+            self.inc('ftp_command_errors_total', command=command, code=response.split(' ', 2)[1][:3])
+
+    def data_connect(self, mode, seconds=None):
+        # seconds None when the connection failed
+        if seconds is None:
+            self.inc('ftp_data_connect_errors_total', mode=mode)
+        else:
+            self.observe('ftp_data_connect_seconds', seconds, mode=mode)
+
+    def transfer(self, direction, name):
+        # a TransferTimeline to feed, or None when disabled
+        if not self.enabled:
+            return None
+        return TransferTimeline(self, direction, name, self.timeline_interval)
+
+    def finish_transfer(self, timeline, seconds, ok):
+        self.inc('ftp_transfer_bytes_total', timeline.bytes, direction=timeline.direction)
+        self.inc('ftp_transfers_total', direction=timeline.direction, result='ok' if ok else 'error')
+        self.observe('ftp_transfer_seconds', seconds, direction=timeline.direction)
+        timeline.samples.append((round(seconds, 3), timeline.bytes))
+        with self.lock:
+            self.timelines.append({'direction': timeline.direction, 'name': timeline.name, 'ok': ok,
+                                   'bytes': timeline.bytes, 'seconds': round(seconds, 6),
+                                   'bytes_per_s': timeline.bytes / seconds if seconds > 0 else None,
+                                   'samples': timeline.samples})
+
+    # export
+    def to_json(self):
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = [(key, histogram.cumulative(), histogram.sum, histogram.count)
+                          for key, histogram in self.histograms.items()]
+            timelines = list(self.timelines)
+        return {'time': time.time(),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(counters)],
+                'histograms': [{'name': name, 'labels': dict(labels),
+                                'buckets': [['+Inf' if le == float('inf') else le, count] for le, count in buckets],
+                                'sum': total, 'count': count}
+                               for (name, labels), buckets, total, count in sorted(histograms, key=lambda h: h[0])],
+                'transfers': timelines}
+
+    def to_prometheus(self):
+        data = self.to_json()
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = METRIC_HELP.get(name, ('untyped', name))
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        def format_labels(labels, **extra):
+            labels = dict(labels, **extra)
+            if not labels:
+                return ''
+            return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                  for key, value in labels.items()) + '}'
+
+        for counter in data['counters']:
+            describe(counter['name'])
+            lines.append(f"{counter['name']}{format_labels(counter['labels'])} {counter['value']}")
+        for histogram in data['histograms']:
+            name = histogram['name']
+            describe(name)
+            for le, count in histogram['buckets']:
+                lines.append(f"{name}_bucket{format_labels(histogram['labels'], le=le)} {count}")
+            lines.append(f"{name}_sum{format_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(histogram['labels'])} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, prometheus_path=METRICS_PROMETHEUS_PATH, json_path=METRICS_JSON_PATH):
+        # written to a temporary file first so that a scraper never reads half of it
+        for path, text in ((prometheus_path, self.to_prometheus), (json_path, lambda: json.dumps(self.to_json()))):
+            if not path:
+                continue
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path + '.tmp', 'w') as fp:
+                fp.write(text())
+            os.replace(path + '.tmp', path)
+
+    def start_export(self, prometheus_path=METRICS_PROMETHEUS_PATH, json_path=METRICS_JSON_PATH,
+                     interval=METRICS_EXPORT_INTERVAL):
+        if not self.enabled or self.exporter is not None or not (prometheus_path or json_path):
+            return
+
+        def keep():
+            while not self.stopped.wait(interval):
+                try:
+                    self.export(prometheus_path, json_path)
+                except OSError:
+                    pass
+
+        self.stopped.clear()
+        self.export_paths = (prometheus_path, json_path)
+        self.exporter = threading.Thread(target=keep, daemon=True)
+        self.exporter.start()
+
+    def stop_export(self):
+        # ends the exporter with one last export, so the final interval is not lost
+        self.stopped.set()
+        if self.exporter is None:
+            return
+        self.exporter.join()
+        self.exporter = None
+        try:
+            self.export(*self.export_paths)
+        except OSError:
+            pass
+
+
+metrics = Metrics()
@@ -0,0 +1,381 @@
+import os
+import posixpath
+import threading
+from collections import deque
+
+from checksum import StreamHasher
+from config import *
+from sync import SYNC_UPLOAD, MKDIR_REMOTE, DELETE_REMOTE, DELETE_LOCAL
+
+
+class MirrorFile(object):
+    __slots__ = ('local_file', 'remote_file', 'size', 'download', 'mtime')
+
+    def __init__(self, local_file, remote_file, size, download, mtime=None):
+        self.local_file = local_file
+        self.remote_file = remote_file
+        self.size = size
+        self.download = download
+        self.mtime = mtime  # remote modification time, given to the downloaded copy
+
+
+class MirrorJob(object):
+    # copy a whole directory tree over pooled sessions: the walker lists the tree
+    # and creates directories while `workers` threads move the files it finds;
+    # large files never take every worker, so small ones keep flowing next to them
+    def __init__(self, acquire, release, local_dir, remote_dir, download, mode, mlsd,
+                 is_running, on_found, on_progress, on_done, on_response, workers=MIRROR_WORKERS, limiter=None):
+        self.acquire = acquire
+        self.release = release
+        self.local_dir = local_dir
+        self.remote_dir = remote_dir
+        self.download = download
+        self.mode = mode
+        self.mlsd = mlsd
+        self.is_running = is_running
+        self.on_found = on_found
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_response = on_response
+        self.workers = max(1, workers)
+        self.limiter = limiter
+        self.plan = None  # SyncPlan to carry out instead of copying the whole tree
+        self.checksum = None  # (algorithm, command) of the server's hash command, files are checked with it
+
+        self.done = set()  # remote paths already copied, skipped when the job is resumed
+        self.unstamped = []  # (remote_file, size, local_mtime) of sync uploads the server kept its own time for
+        self.synced = []  # (remote_file, size, local_mtime, remote_mtime) of those, for the next plan
+        self.failed = 0
+        self.small = deque()
+        self.large = deque()
+        self.large_active = 0
+        self.walked = False
+        self.cond = threading.Condition()
+
+    def run(self):
+        self.failed = 0
+        self.small.clear()
+        self.large.clear()
+        self.large_active = 0
+        self.walked = False
+        self.unstamped = []
+        self.synced = []
+
+        threads = []
+        for _ in range(self.workers):
+            t = threading.Thread(target=self.work)
+            t.start()
+            threads.append(t)
+
+        try:
+            self.walk()
+        except (OSError, EOFError, RuntimeError) as e:
+            self.on_response(SYSTEM_HEADER + f"5 fail to walk {self.remote_dir}: {e}")
+            self.fail(None, 0)
+        finally:
+            with self.cond:
+                self.walked = True
+                self.cond.notify_all()
+
+        for t in threads:
+            t.join()
+
+        if self.unstamped:
+            try:
+                self.fetch_remote_mtimes()
+            except (OSError, EOFError, RuntimeError) as e:
+                self.on_response(SYSTEM_HEADER + f"5 fail to read the times of the uploaded files: {e}")
+        return self.failed == 0
+
+    # walking
+    def walk(self):
+        session = self.acquire()
+        if session is None:
+            raise RuntimeError("fail to open session")
+
+        discard = True
+        try:
+            if self.plan is not None:
+                self.apply_plan(session)
+            elif self.download:
+                self.walk_remote(session)
+            else:
+                self.walk_local(session)
+            discard = False
+        finally:
+            self.release(session, discard)
+
+    def walk_remote(self, session):
+        dirs = deque([(self.local_dir, self.remote_dir)])
+        while dirs and self.is_running():
+            local_dir, remote_dir = dirs.popleft()
+            os.makedirs(local_dir, exist_ok=True)
+
+            self.open_data(session)
+            entries = list(session.iter_listing(remote_dir, self.mlsd))
+            self.on_response(session.last_response)
+            if session.get_status_code(session.last_response.splitlines()[-1])[0] != '2':
+                self.fail(None, 0)
+                continue
+
+            for entry in entries:
+                local_path = os.path.join(local_dir, entry.name)
+                remote_path = posixpath.join(remote_dir, entry.name)
+                if entry.is_dir():
+                    dirs.append((local_path, remote_path))
+                else:
+                    self.add(MirrorFile(local_path, remote_path, entry.size, True, entry.mtime))
+
+    def walk_local(self, session):
+        dirs = deque([(self.local_dir, self.remote_dir)])
+        while dirs and self.is_running():
+            local_dir, remote_dir = dirs.popleft()
+
+            # an existing directory is fine, anything else shows up when its files fail
+            self.on_response(session.mkd(remote_dir))
+
+            with os.scandir(local_dir) as it:
+                for entry in it:
+                    remote_path = posixpath.join(remote_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append((entry.path, remote_path))
+                    elif entry.is_file():
+                        self.add(MirrorFile(entry.path, remote_path, entry.stat().st_size, False))
+
+    def apply_plan(self, session):
+        # directories and deletes right here, in plan order, the copies go to the workers;
+        # remote deletes touch nothing else in the plan and go out as one pipelined batch
+        deletes = []
+        for action in self.plan.actions:
+            if not self.is_running():
+                return
+
+            local_path = self.plan.local_path(action.path)
+            remote_path = self.plan.remote_path(action.path)
+            if action.kind == MKDIR_REMOTE:
+                self.on_response(session.mkd(remote_path))
+            elif action.kind == DELETE_REMOTE:
+                deletes.append(remote_path)
+            elif action.kind == DELETE_LOCAL:
+                try:
+                    os.remove(local_path)
+                except OSError as e:
+                    self.on_response(SYSTEM_HEADER + f"5 {e}")
+                    self.fail(None, 0)
+            else:
+                self.add(MirrorFile(local_path, remote_path, action.size, action.kind != SYNC_UPLOAD, action.mtime))
+
+        for response in session.dele_many(deletes):
+            self.on_response(response)
+            if session.get_status_code(response)[0] != '2':
+                self.fail(None, 0)
+
+    def add(self, mirror_file):
+        self.on_found(mirror_file.size)
+        if mirror_file.remote_file in self.done:
+            self.on_progress(mirror_file.size)
+            self.on_done()
+            return
+
+        with self.cond:
+            if mirror_file.size >= MIRROR_LARGE_FILE:
+                self.large.append(mirror_file)
+            else:
+                self.small.append(mirror_file)
+            self.cond.notify()
+
+    # transferring
+    def next_file(self):
+        with self.cond:
+            while self.is_running():
+                # keep one worker for small files while there are any
+                if self.large and (self.large_active < self.workers - 1 or not self.small):
+                    self.large_active += 1
+                    return self.large.popleft()
+                if self.small:
+                    return self.small.popleft()
+                if self.walked:
+                    return None
+                self.cond.wait(0.5)
+            return None
+
+    def work(self):
+        session = None
+        try:
+            while True:
+                mirror_file = self.next_file()
+                if mirror_file is None:
+                    return
+
+                if session is None:
+                    session = self.acquire()
+                    if session is None:
+                        self.on_response(SYSTEM_HEADER + "5 fail to get a connection to the server.")
+                        self.fail(mirror_file, 0)
+                        self.put_back_slot(mirror_file)
+                        continue
+                    self.on_response(session.type('I'))
+                    session.limiter = self.limiter
+
+                if not self.transfer(session, mirror_file):
+                    # the data connection may be left half closed, start over with another session
+                    session.limiter = None
+                    self.release(session, True)
+                    session = None
+        finally:
+            if session is not None:
+                session.limiter = None
+                self.release(session, False)
+
+    def transfer(self, session, mirror_file):
+        sent = [0]
+
+        def do_progress(n):
+            if not self.is_running():
+                return False
+
+            sent[0] += n
+            self.on_progress(n)
+            return True
+
+        ok = False
+        hasher = None
+        try:
+            if self.checksum is not None:
+                hasher = session.hasher = StreamHasher(self.checksum[0])
+            response = session.select_mode(mirror_file.remote_file,
+                                           None if mirror_file.download else mirror_file.local_file)
+            if response is not None:
+                self.on_response(response)
+            self.open_data(session)
+            if mirror_file.download:
+                os.makedirs(os.path.dirname(mirror_file.local_file), exist_ok=True)
+                with open(mirror_file.local_file, 'wb') as fp:
+                    response = session.retr(mirror_file.remote_file, consumer=session.file_consumer(fp, do_progress))
+            else:
+                with open(mirror_file.local_file, 'rb') as fp:
+                    local_mtime = os.fstat(fp.fileno()).st_mtime
+
+                    def do_upload(n):
+                        if not self.is_running():
+                            return ''
+
+                        buf = fp.read(n)
+                        do_progress(len(buf))
+                        return buf
+
+                    response = session.stor(mirror_file.remote_file, do_upload, fp, do_progress)
+            self.on_response(response)
+            session.hasher = None
+            ok = self.is_running() and session.get_status_code(response.splitlines()[-1])[0] == '2'
+            if ok and hasher is not None:
+                ok = self.verify(session, mirror_file, hasher)
+            if ok and not mirror_file.download and self.plan is not None:
+                self.stamp(session, mirror_file, local_mtime)
+        except (OSError, EOFError, RuntimeError) as e:
+            self.on_response(SYSTEM_HEADER + f"5 fail to transfer {mirror_file.remote_file}: {e}")
+        finally:
+            session.hasher = None
+            if hasher is not None:
+                hasher.close()
+
+        if ok and mirror_file.download and mirror_file.mtime is not None:
+            # the next sync then sees the same time on both sides
+            os.utime(mirror_file.local_file, (mirror_file.mtime, mirror_file.mtime))
+        if ok:
+            self.done.add(mirror_file.remote_file)
+            self.on_done()
+        elif self.is_running():
+            self.fail(mirror_file, sent[0])
+        else:
+            # paused or canceled, the file starts over when the job is resumed
+            self.on_progress(-sent[0])
+        self.put_back_slot(mirror_file)
+        return ok
+
+    def put_back_slot(self, mirror_file):
+        # the slot next_file() took for a large file
+        if mirror_file.size >= MIRROR_LARGE_FILE:
+            with self.cond:
+                self.large_active -= 1
+                self.cond.notify_all()
+
+    def stamp(self, session, mirror_file, local_mtime):
+        # a sync upload gets the local time on the server with MFMT, so the next sync sees
+        # the same time on both sides; the local file is never touched. Without MFMT the
+        # upload time the server gave it is read once the job is done
+        if 'MFMT' in (session.features or ()):
+            response = session.mfmt(mirror_file.remote_file, local_mtime)
+            self.on_response(response)
+            if session.get_status_code(response)[0] == '2':
+                return
+        with self.cond:
+            self.unstamped.append((mirror_file.remote_file, mirror_file.size, local_mtime))
+
+    def fetch_remote_mtimes(self):
+        # one pipelined MDTM batch for all the uploads that kept the server's time
+        session = self.acquire()
+        if session is None:
+            raise RuntimeError("fail to open session")
+
+        discard = True
+        try:
+            if 'MDTM' in (session.features or ()):
+                replies = session.mdtm_many([remote_file for remote_file, _, _ in self.unstamped])
+                for (remote_file, size, local_mtime), (response, mtime) in zip(self.unstamped, replies):
+                    self.on_response(response)
+                    if mtime is not None:
+                        self.synced.append((remote_file, size, local_mtime, mtime))
+            discard = False
+        finally:
+            self.release(session, discard)
+
+    def verify(self, session, mirror_file, hasher):
+        algorithm, command = self.checksum
+        local = hasher.hexdigest()
+        response, remote = session.checksum(mirror_file.remote_file, algorithm, command)
+        self.on_response(response)
+        if local is None or remote is None or local == remote:
+            return True
+        self.on_response(SYSTEM_HEADER + f"5 {mirror_file.remote_file} {algorithm} mismatch, "
+                                         f"local {local}, remote {remote}.")
+        return False
+
+    def fail(self, mirror_file, sent):
+        if sent:
+            self.on_progress(-sent)
+        with self.cond:
+            self.failed += 1
+
+    def open_data(self, session):
+        if self.mode == ClientMode.PORT:
+            self.on_response(session.port())
+        else:
+            self.on_response(session.pasv())
+
+
+def remove_remote_tree(session, remote_dir, mode, mlsd, on_response):
+    # RMD only removes empty directories, so empty the tree depth first
+    if mode == ClientMode.PORT:
+        on_response(session.port())
+    else:
+        on_response(session.pasv())
+    entries = list(session.iter_listing(remote_dir, mlsd))
+    on_response(session.last_response)
+
+    ok = True
+    files = []
+    for entry in entries:
+        remote_path = posixpath.join(remote_dir, entry.name)
+        if entry.is_dir():
+            ok = remove_remote_tree(session, remote_path, mode, mlsd, on_response) and ok
+        else:
+            files.append(remote_path)
+
+    for response in session.dele_many(files):
+        on_response(response)
+        ok = session.get_status_code(response)[0] == '2' and ok
+
+    response = session.rmd(remote_dir)
+    on_response(response)
+    return session.get_status_code(response)[0] == '2' and ok
@@ -1,36 +1,90 @@
+import io
 import os
+import posixpath
 import re
+import select
 import socket
+import stat
+import threading
+import time
+import zlib
 
-from PyQt5.QtWidgets import QFileSystemModel
-from PyQt5.QtCore import QObject
-
+from checksum import HASH_NAMES, parse_digest
 from config import *
+from listing import parse_listing, mdtm_to_time
+from metrics import metrics
+from tuning import TransferTuner
+
+
+class ReplyReader(object):
+    # control connection lines from raw recv()s; a line cut short by a timeout stays
+    # in the buffer, so the next read picks it up where the timed out one stopped
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def readline(self, limit):
+        while True:
+            end = self.buffer.find(b'\n', 0, limit) + 1 or (limit if len(self.buffer) >= limit else 0)
+            if end:
+                break
+            data = self.sock.recv(BUF_SIZE)
+            if not data:
+                end = len(self.buffer)
+                break
+            self.buffer += data
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return line.decode('utf-8', 'replace')
 
 
-class ClientModel(QObject):
-    def __init__(self):
-        super(ClientModel, self).__init__()
-
+class ClientModel(object):
+    def __init__(self, tuning_profile=TUNING_PROFILE):
         self.command_socket = None
         self.command_recevier = None
+        self.reply_lines = []
 
         self.status = ClientStatus.DISCONNECT
 
         self.file_socket = None
         self.file_ip = None
         self.file_port = None
-
-        # local file system
-        self.localFileModel = QFileSystemModel(self)
+        self.tuner = TransferTuner(tuning_profile)
+        self.limiter = None  # RateLimiter of the transfer currently using this session
+        self.hasher = None  # StreamHasher of the transfer currently using this session
+        self.hash_algorithm = None  # set by OPTS HASH
+        self.features = None
+        self.last_response = ''
+        self.pipelining = PIPELINE_ENABLED  # cleared once the server stalls on a pipelined batch
+
+        # what a reconnect replays: address, USER/PASS, TYPE and the working directory
+        self.auto_reconnect = RECONNECT_ENABLED
+        self.on_reconnect = None  # (response), called after the session was restored
+        self.address = None
+        self.username = None
+        self.credentials = None
+        self.data_type = None
+        self.cwd_path = None
+        self.command_lock = threading.RLock()
+        self.last_activity = time.monotonic()
+
+        # MODE Z, used for the files select_mode() finds worth compressing
+        self.compression = MODE_Z_ENABLED
+        self.compression_level = MODE_Z_LEVEL
+        self.transfer_mode = 'S'
+        self.raw_bytes = 0  # of the last MODE Z transfer, before and after compression
+        self.wire_bytes = 0
 
     # help functions to communicate with server
-    def push_command(self, command, argu):
+    @staticmethod
+    def format_command(command, argu):
         msg = command
         if argu is not None:
             msg += " " + str(argu)
-        msg += CRLF
-        self.command_socket.sendall(msg.encode())
+        return msg + CRLF
+
+    def push_command(self, command, argu):
+        self.command_socket.sendall(self.format_command(command, argu).encode())
 
     def getline(self):
         line = self.command_recevier.readline(BUF_SIZE + 1)
@@ -43,20 +97,202 @@ class ClientModel(QObject):
         return line
 
     def recv_response(self):
-        line = self.getline()
-        if line[3:4] == '-':
-            code = line[:3]
-            while 1:
-                nextline = self.getline()
-                line = line + ('\n' + nextline)
-                if nextline[:3] == code and \
-                        nextline[3:4] != '-':
-                    break
-        return line
+        # the lines of a multi-line reply cut short by a timeout wait for the next call
+        lines = self.reply_lines
+        if not lines:
+            lines.append(self.getline())
+            self.last_activity = time.monotonic()
+        if lines[0][3:4] == '-':
+            code = lines[0][:3]
+            while len(lines) == 1 or lines[-1][:3] != code or lines[-1][3:4] == '-':
+                lines.append(self.getline())
+        self.reply_lines = []
+        return '\n'.join(lines)
 
     def send_command(self, command, argu=None):
+        # a control connection the server dropped while idle is restored before the
+        # command goes out. One that breaks after the command was written is restored as
+        # well, but the command may have run: it is sent again only when running it twice
+        # does no harm, otherwise the reply says that its outcome is unknown. A connection
+        # that breaks between PORT/PASV and the transfer is not restored
+        with self.command_lock:
+            if self.can_reconnect(command) and self.is_dropped():
+                self.reconnect()
+            start = time.perf_counter()
+            try:
+                self.push_command(command, argu)
+            except OSError:
+                if not self.can_reconnect(command):
+                    raise
+                self.reconnect()
+                return self.exchange(command, argu)
+
+            try:
+                response = SERVER_HEADER + self.recv_response()
+            except (OSError, EOFError):
+                if not self.can_reconnect(command):
+                    raise
+                self.reconnect()
+                if command not in RECONNECT_REPEAT_COMMANDS:
+                    return SYSTEM_HEADER + f"4 connection lost after {command} was sent, its outcome is unknown."
+                return self.exchange(command, argu)
+            if metrics.enabled:
+                metrics.command(command, time.perf_counter() - start, response)
+            return response
+
+    def is_dropped(self):
+        # readable while no reply is due: closed or reset, or the 421 a server sends
+        # before it closes an idle connection
+        try:
+            if not select.select([self.command_socket], [], [], 0)[0]:
+                return False
+            data = self.command_socket.recv(4, socket.MSG_PEEK)
+        except (OSError, ValueError):
+            return True
+        return not data or data.startswith(b'421')
+
+    def exchange(self, command, argu=None):
+        if not metrics.enabled:
+            self.push_command(command, argu)
+            return SERVER_HEADER + self.recv_response()
+
+        start = time.perf_counter()
         self.push_command(command, argu)
-        return SERVER_HEADER + self.recv_response()
+        response = SERVER_HEADER + self.recv_response()
+        metrics.command(command, time.perf_counter() - start, response)
+        return response
+
+    def send_commands(self, commands, window=PIPELINE_WINDOW):
+        # commands is a list of (command, argu); up to `window` of them are on the wire
+        # before their replies are read, and the replies come back in command order.
+        # A server that stalls on a batch gets the rest one command at a time
+        responses = []
+        if not self.pipelining or window <= 1:
+            for command, argu in commands:
+                responses.append(self.send_command(command, argu))
+            return responses
+
+        with self.command_lock:
+            # the batch may run in part before a break, so only a connection already
+            # dropped while idle is restored
+            if commands and self.can_reconnect(commands[0][0]) and self.is_dropped():
+                self.reconnect()
+            return self.pipeline_commands(commands, window)
+
+    def pipeline_commands(self, commands, window):
+        responses = []
+        sent = 0
+        sent_at = []  # send time of each command, only kept for the metrics
+        stalled = False
+        self.command_socket.settimeout(PIPELINE_TIMEOUT)
+        try:
+            while len(responses) < len(commands):
+                # refill once half of the window is answered, so that writes stay batched
+                if sent < len(commands) and sent - len(responses) <= window // 2:
+                    batch = commands[sent:len(responses) + window]
+                    self.command_socket.sendall(
+                        ''.join(self.format_command(command, argu) for command, argu in batch).encode())
+                    sent += len(batch)
+                    if metrics.enabled:
+                        sent_at.extend([time.perf_counter()] * len(batch))
+                self.pipeline_reply(commands, responses, sent_at)
+        except socket.timeout:
+            self.pipelining = False
+            stalled = True
+        finally:
+            self.command_socket.settimeout(None)
+
+        if stalled:
+            self.collect_replies(commands, responses, sent, sent_at)
+        for command, argu in commands[sent:]:
+            responses.append(self.send_command(command, argu))
+        return responses
+
+    def pipeline_reply(self, commands, responses, sent_at):
+        responses.append(SERVER_HEADER + self.recv_response())
+        if metrics.enabled:
+            metrics.command(commands[len(responses) - 1][0],
+                            time.perf_counter() - sent_at[len(responses) - 1], responses[-1])
+
+    def collect_replies(self, commands, responses, sent, sent_at):
+        # the commands of a stalled batch are on the wire and run all the same, so their
+        # replies are still owed; sending them again would run them twice. A server that
+        # never answers leaves their outcome unknown, and the connection is dropped
+        self.command_socket.settimeout(PIPELINE_REPLY_TIMEOUT)
+        try:
+            while len(responses) < sent:
+                self.pipeline_reply(commands, responses, sent_at)
+        except (OSError, EOFError) as e:
+            self.command_socket.close()
+            self.status = ClientStatus.DISCONNECT
+            raise ConnectionError(f"{sent - len(responses)} pipelined commands got no reply, "
+                                  f"their outcome is unknown: {str(e) or type(e).__name__}")
+        self.command_socket.settimeout(None)
+
+    def can_reconnect(self, command):
+        return self.auto_reconnect and self.credentials is not None and command != "QUIT" and \
+            self.status not in (ClientStatus.DISCONNECT, ClientStatus.PORT, ClientStatus.PASV)
+
+    def reconnect(self):
+        # a new control connection in the state of the old one; raises ConnectionError
+        # once RECONNECT_ATTEMPTS connects in a row failed
+        try:
+            self.command_socket.close()
+        except OSError:
+            pass
+
+        delay = RECONNECT_DELAY
+        response = SYSTEM_HEADER + "5 fail to connect target computer."
+        for attempt in range(RECONNECT_ATTEMPTS):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            try:
+                response = self.connect(*self.address)
+            except (OSError, EOFError) as e:
+                response = SYSTEM_HEADER + f"5 reconnect failed: {e}"
+                continue
+            if self.get_status_code(response)[0] == '2':
+                break
+        else:
+            self.status = ClientStatus.DISCONNECT
+            raise ConnectionError(response)
+
+        self.status = ClientStatus.USER
+        self.hash_algorithm = None
+        replay = [("USER", self.credentials[0]), ("PASS", self.credentials[1])]
+        if self.data_type is not None:
+            replay.append(("TYPE", self.data_type))
+        if self.cwd_path is not None:
+            replay.append(("CWD", self.cwd_path))
+        if self.transfer_mode == 'Z':
+            replay.append(("OPTS", f"MODE Z LEVEL {self.compression_level}"))
+            replay.append(("MODE", "Z"))
+        for command, argu in replay:
+            response = self.exchange(command, argu)
+            if self.get_status_code(response)[0] == '5' and command != "OPTS":
+                self.status = ClientStatus.DISCONNECT
+                raise ConnectionError(response)
+        self.status = ClientStatus.PASS
+
+        metrics.inc('ftp_reconnects_total')
+        response = SYSTEM_HEADER + f"2 reconnected to {self.address[0]}, session restored."
+        if self.on_reconnect is not None:
+            self.on_reconnect(response)
+        return response
+
+    def keepalive(self, idle=KEEPALIVE_INTERVAL):
+        # NOOP on a control connection that has been quiet for `idle` seconds, so that
+        # NATs and the server keep it; left alone while another thread is using it
+        if self.status in (ClientStatus.DISCONNECT, ClientStatus.PORT, ClientStatus.PASV) or \
+                time.monotonic() - self.last_activity < idle:
+            return None
+        if not self.command_lock.acquire(blocking=False):
+            return None
+        try:
+            return self.noop()
+        finally:
+            self.command_lock.release()
 
     # standard command of FTP
     def connect(self, ip, port):
@@ -68,21 +304,73 @@ class ClientModel(QObject):
             self.command_socket = socket.create_connection((ip, int(port)))
         except ConnectionRefusedError:
             return SYSTEM_HEADER + "5 fail to connect target computer."
-        self.command_recevier = self.command_socket.makefile('r')
+        # commands are small writes, pipelined batches must not wait on Nagle for the last ACK
+        self.command_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.command_recevier = ReplyReader(self.command_socket)
+        self.reply_lines = []
 
         response = self.recv_response()
+        self.address = (ip, port)
         return SERVER_HEADER + response
 
     def user(self, username):
         self.status = ClientStatus.USER
+        self.username = username
+        self.credentials = None
         return self.send_command("USER", username)
 
     def password(self, password):
         self.status = ClientStatus.PASS
-        return self.send_command("PASS", password)
+        response = self.send_command("PASS", password)
+        if self.get_status_code(response)[0] == '2':
+            self.credentials = (self.username, password)
+        return response
 
     def type(self, data_type):
-        return self.send_command("TYPE", data_type)
+        response = self.send_command("TYPE", data_type)
+        if self.get_status_code(response)[0] == '2':
+            self.data_type = data_type
+        return response
+
+    def mode(self, transfer_mode):
+        response = self.send_command("MODE", transfer_mode)
+        if self.get_status_code(response)[0] == '2':
+            self.transfer_mode = transfer_mode
+        return response
+
+    def select_mode(self, filename, local_file=None):
+        # MODE Z for a file worth compressing when the server has it, MODE S otherwise;
+        # None when the session already is in that mode. An upload passes its
+        # local_file to be probed. Call it before PORT/PASV
+        compress = self.compression and 'MODE Z' in (self.features or ()) and \
+            self.worth_compressing(filename, local_file)
+        if compress == (self.transfer_mode == 'Z'):
+            return None
+        if not compress:
+            return self.mode('S')
+
+        # a server that does not take the level compresses at its default one
+        response = self.send_command("OPTS", f"MODE Z LEVEL {self.compression_level}")
+        response += "\n" + self.mode('Z')
+        if self.transfer_mode != 'Z':
+            self.compression = False
+        return response
+
+    @staticmethod
+    def worth_compressing(filename, local_file=None):
+        # a download goes by the name, text types only. An upload deflates its first
+        # block at a fast level: data that hardly shrinks is sent as it is, with sendfile
+        extension = os.path.splitext(filename)[1].lower()
+        if local_file is None:
+            return extension in MODE_Z_TEXT_EXTENSIONS
+        if extension in MODE_Z_SKIP_EXTENSIONS:
+            return False
+        try:
+            with open(local_file, 'rb') as fp:
+                block = fp.read(MODE_Z_PROBE_SIZE)
+        except OSError:
+            return False
+        return len(block) > 0 and len(zlib.compress(block, 1)) <= len(block) * MODE_Z_MAX_RATIO
 
     def mkd(self, dir_name):
         return self.send_command("MKD", dir_name)
@@ -101,11 +389,58 @@ class ClientModel(QObject):
 
     def size(self, file_name):
         response = self.send_command("SIZE", file_name)
-        try:
-            size = int(response.split(' ')[-1])
-        except:
-            size = 0
-        return response, size
+        return response, self.parse_size(response)
+
+    def mdtm(self, file_name):
+        response = self.send_command("MDTM", file_name)
+        return response, self.parse_mdtm(response)
+
+    def mfmt(self, file_name, mtime):
+        return self.send_command("MFMT", time.strftime('%Y%m%d%H%M%S', time.gmtime(mtime)) + ' ' + file_name)
+
+    # bulk variants, pipelined over the control connection
+    def size_many(self, file_names):
+        responses = self.send_commands([("SIZE", name) for name in file_names])
+        return [(response, self.parse_size(response)) for response in responses]
+
+    def mdtm_many(self, file_names):
+        responses = self.send_commands([("MDTM", name) for name in file_names])
+        return [(response, self.parse_mdtm(response)) for response in responses]
+
+    def dele_many(self, file_names):
+        return self.send_commands([("DELE", name) for name in file_names])
+
+    def rename_many(self, renames):
+        # one response per (old, new) pair, RNTO's when RNFR was accepted
+        commands = []
+        for old_name, new_name in renames:
+            commands.append(("RNFR", old_name))
+            commands.append(("RNTO", new_name))
+        responses = self.send_commands(commands)
+        result = []
+        for i in range(0, len(responses), 2):
+            if self.get_status_code(responses[i])[0] != '3':
+                result.append(responses[i])
+            else:
+                result.append(responses[i + 1])
+        return result
+
+    def checksum(self, filename, algorithm, command):
+        # (response, digest or None) of a remote file, command is HASH or one of XSHA256/XMD5/XCRC
+        if command == "HASH":
+            if self.hash_algorithm != algorithm:
+                response = self.send_command("OPTS", "HASH " + HASH_NAMES[algorithm])
+                if self.get_status_code(response)[0] != '2':
+                    return response, None
+                self.hash_algorithm = algorithm
+        response = self.send_command(command, filename)
+        if self.get_status_code(response)[0] != '2':
+            return response, None
+        text = response[len(SERVER_HEADER) + 4:]
+        if command == "HASH":
+            # "213 <algorithm> <start>-<end> <digest> <path>", the range may look like a digest too
+            text = ' '.join(text.split(' ')[2:3])
+        return response, parse_digest(text, algorithm)
 
     def pwd(self):
         response = self.send_command("PWD")
@@ -116,17 +451,38 @@ class ClientModel(QObject):
         return response, path
 
     def cwd(self, dir_name):
-        return self.send_command("CWD", dir_name)
+        response = self.send_command("CWD", dir_name)
+        if self.get_status_code(response)[0] == '2':
+            self.cwd_path = posixpath.normpath(posixpath.join(self.cwd_path or '', dir_name))
+        return response
 
     def syst(self):
         return self.send_command("SYST")
 
+    def feat(self):
+        response = self.send_command("FEAT")
+        features = set()
+        if self.get_status_code(response)[0] == '2':
+            for line in response.splitlines()[1:-1]:
+                if line.strip():
+                    features.add(line.split()[0].upper())
+                    features.add(' '.join(line.split()).upper())
+        self.features = features
+        return response, features
+
+    def noop(self):
+        return self.send_command("NOOP")
+
     def rest(self, offset):
         return self.send_command("REST", offset)
 
     def quit(self):
-        response = self.send_command("QUIT")
+        try:
+            response = self.send_command("QUIT")
+        except (OSError, EOFError):
+            response = SYSTEM_HEADER + "2 the connection was already closed."
         self.status = ClientStatus.DISCONNECT
+        self.credentials = None
         self.command_socket.close()
         return response
 
@@ -147,17 +503,23 @@ class ClientModel(QObject):
         if self.file_socket is None:
             return SERVER_HEADER + "fail to bind socket."
 
+        # accepted sockets inherit the buffer sizes, set them before the window scale is negotiated
+        self.tuner.apply(self.file_socket)
         self.file_socket.listen(1)
         port = self.file_socket.getsockname()[1]  # Get proper port
         ip = self.command_socket.getsockname()[0]  # Get proper ip
 
         addr = self.ip_and_port_to_addr(ip, port)
+        start = time.monotonic()
         response = self.send_command("PORT", addr)
+        self.tuner.measure_rtt(time.monotonic() - start)
         self.status = ClientStatus.PORT
         return response
 
     def pasv(self):
+        start = time.monotonic()
         response = self.send_command("PASV")
+        self.tuner.measure_rtt(time.monotonic() - start)
         if self.get_status_code(response)[0] == '5':
             return response
         addr = re.search(r"\d{1,3},\d{1,3},\d{1,3},\d{1,3},\d{1,3},\d{1,3}", response).group()
@@ -170,19 +532,103 @@ class ClientModel(QObject):
         return response
 
     def build_transfer_sock(self, msg):
+        start = time.perf_counter()
         self.command_socket.send(msg.encode())
         if self.status == ClientStatus.PORT:
-            sock, _ = self.file_socket.accept()
-            self.file_socket.close()
-            self.file_socket = None
+            try:
+                sock, _ = self.file_socket.accept()
+            except OSError:
+                metrics.data_connect('port_accept')
+                raise
+            finally:
+                self.file_socket.close()
+                self.file_socket = None
+            metrics.data_connect('port_accept', time.perf_counter() - start)
         elif self.status == ClientStatus.PASV:
-            sock = socket.create_connection((self.file_ip, self.file_port))
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tuner.apply(sock)
+            connect_start = time.perf_counter()
+            try:
+                sock.connect((self.file_ip, self.file_port))
+            except OSError:
+                sock.close()
+                metrics.data_connect('pasv_connect')
+                raise
+            metrics.data_connect('pasv_connect', time.perf_counter() - connect_start)
         else:
             raise RuntimeError
+        self.tuner.start(sock)
         response = SERVER_HEADER + self.recv_response()
+        if metrics.enabled:
+            metrics.command(msg.split(' ', 1)[0].strip(), time.perf_counter() - start, response)
         return sock, response
 
-    def retr(self, filename, callback):
+    def inflating(self, consumer):
+        # (consumer of the compressed stream, flush) around a consumer of the plain one
+        if consumer is None:
+            raise RuntimeError
+        decompressor = zlib.decompressobj()
+        stopped = [False]
+        self.raw_bytes = self.wire_bytes = 0
+
+        def consume(view):
+            self.wire_bytes += len(view)
+            data = decompressor.decompress(view)
+            self.raw_bytes += len(data)
+            stopped[0] = bool(data) and not consumer(memoryview(data))
+            return not stopped[0]
+
+        def flush():
+            data = decompressor.flush()
+            if data and not stopped[0]:
+                self.raw_bytes += len(data)
+                consumer(memoryview(data))
+
+        return consume, flush
+
+    def deflating(self, callback):
+        # a send_data callback that compresses what `callback` reads, ending the
+        # stream properly when it runs dry or stops
+        if callback is None:
+            raise RuntimeError
+        compressor = zlib.compressobj(self.compression_level)
+        finished = [False]
+        self.raw_bytes = self.wire_bytes = 0
+
+        def produce(size):
+            while not finished[0]:
+                buf = callback(size)
+                if buf:
+                    self.raw_bytes += len(buf)
+                    data = compressor.compress(buf)
+                else:
+                    finished[0] = True
+                    data = compressor.flush()
+                if data:
+                    self.wire_bytes += len(data)
+                    return data
+            return b''
+
+        return produce
+
+    def count_compression(self, direction):
+        if self.transfer_mode == 'Z':
+            metrics.inc('ftp_transfer_raw_bytes_total', self.raw_bytes, direction=direction)
+
+    def describe_compression(self):
+        # None unless the last transfer went compressed
+        if self.transfer_mode != 'Z':
+            return None
+        ratio = self.raw_bytes / self.wire_bytes if self.wire_bytes else 0
+        return f"MODE Z level {self.compression_level}: {self.raw_bytes} bytes as {self.wire_bytes} " \
+               f"on the wire ({ratio:.1f}x)"
+
+    @staticmethod
+    def finish_timeline(timeline, response):
+        if timeline is not None:
+            timeline.finish(ClientModel.get_status_code(response.splitlines()[-1])[0] == '2')
+
+    def retr(self, filename, callback=None, consumer=None):
         if self.status != ClientStatus.PASV and self.status != ClientStatus.PORT:
             return SYSTEM_HEADER + "5 RETR require PORT/PASV mode."
 
@@ -190,35 +636,70 @@ class ClientModel(QObject):
         sock, response = self.build_transfer_sock(msg)
 
         if response[0] != 5:
-            self.recv_data(sock, callback)
+            timeline = metrics.transfer('download', filename)
+            if self.hasher is not None:
+                if consumer is not None:
+                    consumer = self.hasher.consumer(consumer)
+                elif callback is not None:
+                    callback = self.hasher.consumer(callback)
+            if self.transfer_mode == 'Z':
+                consumer, flush = self.inflating(consumer if consumer is not None else callback)
+                self.recv_into(sock, consumer, self.tuner, self.limiter, timeline)
+                flush()
+            elif consumer is not None:
+                self.recv_into(sock, consumer, self.tuner, self.limiter, timeline)
+            else:
+                self.recv_data(sock, callback, timeline)
             sock.close()
             response += "\n" + SERVER_HEADER + self.recv_response()
+            self.finish_timeline(timeline, response)
+            self.count_compression('download')
 
         self.offset = 0
         self.status = ClientStatus.PASS
 
         return response
 
-    def list(self):
+    def list_stream(self, path=None, command="LIST"):
+        # yields the listing as it arrives, the combined response is left in self.last_response
         if self.status != ClientStatus.PASV and self.status != ClientStatus.PORT:
-            return SYSTEM_HEADER + "5 LIST require PORT/PASV mode.", ""
+            self.last_response = SYSTEM_HEADER + f"5 {command} require PORT/PASV mode."
+            return
 
-        list_str = b''
-
-        msg = "LIST" + CRLF
+        msg = command + ("" if path is None else " " + path) + CRLF
         sock, response = self.build_transfer_sock(msg)
-
-        if response[0] != '5':
-            buf = sock.recv(BUF_SIZE)
-            while buf:
-                list_str += buf
-                buf = sock.recv(BUF_SIZE)
+        timeline = None
+        decompressor = zlib.decompressobj() if self.transfer_mode == 'Z' else None
+        try:
+            if self.get_status_code(response)[0] != '5':
+                timeline = metrics.transfer('list', path)
+                buf = sock.recv(RECV_BUF_SIZE)
+                while buf:
+                    if timeline is not None:
+                        timeline.add(len(buf))
+                    if decompressor is not None:
+                        buf = decompressor.decompress(buf)
+                    yield buf
+                    buf = sock.recv(RECV_BUF_SIZE)
+                if decompressor is not None:
+                    yield decompressor.flush()
+        finally:
             sock.close()
-            response += "\n" + SERVER_HEADER + self.recv_response()
+            if self.get_status_code(response)[0] != '5':
+                response += "\n" + SERVER_HEADER + self.recv_response()
+                self.finish_timeline(timeline, response)
+            self.last_response = response
+            self.status = ClientStatus.PASS
+
+    def iter_listing(self, path=None, mlsd=False):
+        # FileEntry records parsed while the listing is still arriving
+        return parse_listing(self.list_stream(path, "MLSD" if mlsd else "LIST"), mlsd)
 
-        return response, list_str.decode()
+    def list(self, path=None):
+        list_str = b''.join(self.list_stream(path))
+        return self.last_response, list_str.decode()
 
-    def stor(self, filename, callback=None):
+    def stor(self, filename, callback=None, fp=None, progress=None):
         if self.status != ClientStatus.PASV and self.status != ClientStatus.PORT:
             return SYSTEM_HEADER + "5 STOR require PORT/PASV mode."
 
@@ -226,15 +707,25 @@ class ClientModel(QObject):
         sock, response = self.build_transfer_sock(msg)
 
         if response[0] != '5':
-            self.send_data(sock, callback)
+            timeline = metrics.transfer('upload', filename)
+            if self.hasher is not None:
+                callback = None if callback is None else self.hasher.callback(callback)
+                progress = None if progress is None or fp is None else self.hasher.progress(progress, fp)
+            if self.transfer_mode == 'Z':
+                # compressed data cannot be sendfile()'d, it goes through the callback
+                self.send_data(sock, self.deflating(callback), None, None, self.tuner, self.limiter, timeline)
+            else:
+                self.send_data(sock, callback, fp, progress, self.tuner, self.limiter, timeline)
             sock.close()
             response += "\n" + SERVER_HEADER + self.recv_response()
+            self.finish_timeline(timeline, response)
+            self.count_compression('upload')
 
         self.offset = 0
         self.status = ClientStatus.PASS
         return response
 
-    def appe(self, filename, callback=None):
+    def appe(self, filename, callback=None, fp=None, progress=None):
         if self.status != ClientStatus.PASV and self.status != ClientStatus.PORT:
             return SYSTEM_HEADER + "5 STOR require PORT/PASV mode."
 
@@ -242,9 +733,19 @@ class ClientModel(QObject):
         sock, response = self.build_transfer_sock(msg)
 
         if response[0] != '5':
-            self.send_data(sock, callback)
+            timeline = metrics.transfer('upload', filename)
+            if self.hasher is not None:
+                callback = None if callback is None else self.hasher.callback(callback)
+                progress = None if progress is None or fp is None else self.hasher.progress(progress, fp)
+            if self.transfer_mode == 'Z':
+                # compressed data cannot be sendfile()'d, it goes through the callback
+                self.send_data(sock, self.deflating(callback), None, None, self.tuner, self.limiter, timeline)
+            else:
+                self.send_data(sock, callback, fp, progress, self.tuner, self.limiter, timeline)
             sock.close()
             response += "\n" + SERVER_HEADER + self.recv_response()
+            self.finish_timeline(timeline, response)
+            self.count_compression('upload')
 
         self.offset = 0
         self.status = ClientStatus.PASS
@@ -255,6 +756,19 @@ class ClientModel(QObject):
         return response.split(' ')[1]
 
     # help functions
+    @staticmethod
+    def parse_size(response):
+        try:
+            return int(response.split(' ')[-1])
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def parse_mdtm(response):
+        if ClientModel.get_status_code(response)[0] != '2':
+            return None
+        return mdtm_to_time(response.split(' ')[-1])
+
     @staticmethod
     def is_valid_ipv4_by_addr(addr):
         addr_num = addr.split(',')
@@ -293,7 +807,7 @@ class ClientModel(QObject):
         return ','.join(addr)
 
     @staticmethod
-    def recv_data(sock, callback):
+    def recv_data(sock, callback, timeline=None):
         # if offset > 0:
         #     fp = open(file_path, "r+b")
         #     fp.seek(offset-1, 0)
@@ -304,22 +818,106 @@ class ClientModel(QObject):
 
         buf = sock.recv(BUF_SIZE)
         while buf:
+            if timeline is not None:
+                timeline.add(len(buf))
             if not callback(buf):
                 break
             buf = sock.recv(BUF_SIZE)
 
     @staticmethod
-    def send_data(sock, callback):
+    def recv_into(sock, consumer, tuner=None, limiter=None, timeline=None):
+        # one preallocated buffer for the whole transfer, consumer(view) gets a memoryview
+        # that is only valid during the call and returns False to stop
+        buf = bytearray(RECV_BUF_SIZE if tuner is None else tuner.max_chunk_size)
+        view = memoryview(buf)
+        size = len(buf) if tuner is None else tuner.chunk_size
+        if limiter is not None:
+            size = limiter.chunk_size(size)
+        n = sock.recv_into(view, size)
+        while n:
+            if timeline is not None:
+                timeline.add(n)
+            if not consumer(view[:n]):
+                break
+            if tuner is not None:
+                tuner.update(n, n == size)
+                size = tuner.chunk_size
+            if limiter is not None:
+                limiter.throttle(n)
+                size = limiter.chunk_size(size if tuner is not None else len(buf))
+            n = sock.recv_into(view, size)
+        if tuner is not None:
+            tuner.finish()
+
+    @staticmethod
+    def file_consumer(fp, progress=None):
+        def consume(view):
+            fp.write(view)
+            return progress is None or progress(len(view))
+
+        return consume
+
+    @staticmethod
+    def send_data(sock, callback, fp=None, progress=None, tuner=None, limiter=None, timeline=None):
         # fp = open(file_path, "rb")
         # if offset > 0:
         #     fp.seek(offset-1, 0)
+        if fp is not None and progress is not None and ClientModel.is_regular_file(fp):
+            ClientModel.send_file(sock, fp, progress, tuner, limiter, timeline)
+            return
+
         if callback is None:
             raise RuntimeError
 
-        buf = callback(BUF_SIZE)
+        size = BUF_SIZE if tuner is None else tuner.chunk_size
+        if limiter is not None:
+            size = limiter.chunk_size(size)
+        buf = callback(size)
         while buf:
             sock.sendall(buf)
-            buf = callback(BUF_SIZE)
+            if timeline is not None:
+                timeline.add(len(buf))
+            if tuner is not None:
+                tuner.update(len(buf), len(buf) == size)
+                size = tuner.chunk_size
+            if limiter is not None:
+                limiter.throttle(len(buf))
+                size = limiter.chunk_size(BUF_SIZE if tuner is None else tuner.chunk_size)
+            buf = callback(size)
+        if tuner is not None:
+            tuner.finish()
+
+    @staticmethod
+    def send_file(sock, fp, progress, tuner=None, limiter=None, timeline=None):
+        # zero-copy upload starting at the current position of fp (the APPE offset),
+        # progress(n) is called between chunks and returns False to pause/cancel
+        offset = fp.tell()
+        if not progress(0):
+            return
+
+        while True:
+            count = SENDFILE_CHUNK if limiter is None else limiter.chunk_size(SENDFILE_CHUNK)
+            sent = sock.sendfile(fp, offset, count)
+            if not sent:
+                break
+            offset += sent
+            if timeline is not None:
+                timeline.add(sent)
+            if tuner is not None:
+                tuner.update(sent, False)
+            if limiter is not None:
+                limiter.throttle(sent)
+            if not progress(sent):
+                break
+        if tuner is not None:
+            tuner.finish()
+
+    @staticmethod
+    def is_regular_file(fp):
+        try:
+            return stat.S_ISREG(os.fstat(fp.fileno()).st_mode)
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
 
 
 def test_login(ftp, client):
@@ -0,0 +1,135 @@
+import threading
+import time
+
+from config import *
+
+
+class SessionPool(object):
+    # keeps logged-in sessions warm so that a transfer can check one out
+    # instead of paying connect + USER/PASS every time
+    def __init__(self, open_session, close_session, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, check_interval=POOL_HEALTH_CHECK_INTERVAL):
+        self.open_session = open_session
+        self.close_session = close_session
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+
+        self.idle = []  # (session, last used time, last checked time)
+        self.size = 0  # idle + checked out
+        self.closed = False
+        self.cond = threading.Condition()
+        self.stopped = threading.Event()
+
+        self.keeper = threading.Thread(target=self.keep, daemon=True)
+        self.keeper.start()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.cond:
+                while not self.idle and self.size >= self.max_size and not self.closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self.cond.wait(remaining)
+
+                if self.closed:
+                    return None
+
+                if self.idle:
+                    session, _, last_checked = self.idle.pop()
+                else:
+                    session, last_checked = None, None
+                    self.size += 1
+
+            if session is None:
+                session = self.open_session()
+                if session is None:
+                    self.forget()
+                    return None
+                return session
+
+            if time.monotonic() - last_checked < self.check_interval or self.is_healthy(session):
+                return session
+            self.discard(session)
+
+    def release(self, session, discard=False, last_used=None):
+        if discard:
+            self.discard(session)
+            return
+
+        now = time.monotonic()
+        with self.cond:
+            if not self.closed:
+                self.idle.append((session, now if last_used is None else last_used, now))
+                self.cond.notify()
+                return
+        self.discard(session)
+
+    def discard(self, session):
+        self.forget()
+        self.close_session(session)
+
+    def forget(self):
+        with self.cond:
+            self.size -= 1
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.cond.notify_all()
+        self.stopped.set()
+
+        for session, _, _ in idle:
+            self.discard(session)
+
+    @staticmethod
+    def is_healthy(session):
+        try:
+            response = session.noop()
+        except (OSError, EOFError):
+            return False
+        return session.get_status_code(response)[0] == '2'
+
+    # background maintenance: reap idle sessions, check the rest, refill to min_size
+    def keep(self):
+        while True:
+            with self.cond:
+                if self.closed:
+                    return
+
+                now = time.monotonic()
+                expired, checks = [], []
+                for item in self.idle:
+                    if now - item[1] > self.idle_timeout and self.size - len(expired) > self.min_size:
+                        expired.append(item)
+                    elif now - item[2] >= self.check_interval:
+                        checks.append(item)
+                self.idle = [item for item in self.idle if item not in expired and item not in checks]
+                missing = max(self.min_size - self.size + len(expired), 0)
+
+            for session, _, _ in expired:
+                self.discard(session)
+
+            for session, last_used, _ in checks:
+                if self.is_healthy(session):
+                    self.release(session, last_used=last_used)
+                else:
+                    self.discard(session)
+
+            for _ in range(missing):
+                with self.cond:
+                    if self.closed or self.size >= self.min_size:
+                        break
+                    self.size += 1
+                session = self.open_session()
+                if session is None:
+                    self.forget()
+                    break
+                self.release(session)
+
+            self.stopped.wait(self.check_interval)
@@ -0,0 +1,52 @@
+import time
+
+from config import *
+
+
+class TransferProgress(object):
+    def __init__(self, proc, trans_size, rate, smoothed_rate, eta):
+        self.proc = proc
+        self.trans_size = trans_size
+        self.rate = rate
+        self.smoothed_rate = smoothed_rate
+        self.eta = eta
+
+
+class ProgressSampler(object):
+    # polls trans_size of every running transfer at a fixed rate instead of
+    # reporting each chunk, and turns the deltas into rate and ETA
+    def __init__(self, smoothing=PROGRESS_SMOOTHING):
+        self.smoothing = smoothing
+        self.last = {}  # proc id -> (time, trans_size, smoothed rate, status)
+
+    def sample(self, procs):
+        now = time.monotonic()
+        updates = []
+        last = {}
+        for proc in procs:
+            trans_size = proc.trans_size
+            prev = self.last.get(proc.id)
+            if prev is None:
+                rate = smoothed_rate = 0.0
+                changed = True
+            else:
+                prev_time, prev_size, smoothed_rate, prev_status = prev
+                # a resumed transfer may restart below the last sample
+                rate = max(trans_size - prev_size, 0) / max(now - prev_time, 1e-6)
+                changed = trans_size != prev_size or smoothed_rate > 0 or proc.status != prev_status
+                smoothed_rate = self.smoothing * rate + (1 - self.smoothing) * smoothed_rate
+                if smoothed_rate < 1:
+                    smoothed_rate = 0.0
+
+            last[proc.id] = (now, trans_size, smoothed_rate, proc.status)
+            if not changed:
+                continue
+
+            if smoothed_rate > 0:
+                eta = max(proc.total_size - trans_size, 0) / smoothed_rate
+            else:
+                eta = None
+            updates.append(TransferProgress(proc, trans_size, rate, smoothed_rate, eta))
+
+        self.last = last
+        return updates
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from config import *
+
+
+class TokenBucket(object):
+    # `rate` bytes per second shared by the consumers that used the bucket during the
+    # last RATE_LIMIT_IDLE seconds, in proportion to their weight; a consumer that goes
+    # idle leaves its share to the others. rate 0 means unlimited
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.consumers = {}  # consumer -> [weight, time its booked bytes are sent by, last seen]
+
+    def set_rate(self, rate):
+        self.rate = max(0, rate)
+
+    def forget(self, consumer):
+        with self.lock:
+            self.consumers.pop(consumer, None)
+
+    def delay(self, consumer, n, weight=1):
+        rate = self.rate
+        if not rate:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            state = self.consumers.get(consumer)
+            if state is None:
+                state = self.consumers[consumer] = [weight, now, now]
+            state[0] = weight
+            state[2] = now
+
+            total = 0
+            for key, (other_weight, _, seen) in list(self.consumers.items()):
+                if now - seen > RATE_LIMIT_IDLE:
+                    del self.consumers[key]
+                else:
+                    total += other_weight
+
+            # unused time up to RATE_LIMIT_BURST ago can still be spent
+            start = max(state[1], now - RATE_LIMIT_BURST)
+            state[1] = start + n * total / (rate * weight)
+            return max(0.0, state[1] - now)
+
+
+class RateLimiter(object):
+    # the buckets one transfer draws from: its own cap, its server's and the global one
+    def __init__(self, buckets, priority=0):
+        self.buckets = buckets
+        self.weight = 1
+        self.set_priority(priority)
+
+    def set_priority(self, priority):
+        self.weight = RATE_LIMIT_PRIORITY_WEIGHT ** priority
+
+    def chunk_size(self, size):
+        # smaller reads and sends keep the pacing smooth under a low limit
+        for bucket in self.buckets:
+            if bucket.rate:
+                size = min(size, max(RATE_LIMIT_MIN_CHUNK, int(bucket.rate / RATE_LIMIT_HZ)))
+        return size
+
+    def release(self):
+        # a stopped transfer hands its share back at once instead of after RATE_LIMIT_IDLE
+        for bucket in self.buckets:
+            bucket.forget(self)
+
+    def throttle(self, n):
+        delay = 0.0
+        for bucket in self.buckets:
+            if bucket.rate:
+                delay = max(delay, bucket.delay(self, n, self.weight))
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BandwidthLimits(object):
+    # global and per-server caps, adjustable while transfers run
+    def __init__(self, global_rate=RATE_LIMIT_GLOBAL, server_rate=RATE_LIMIT_SERVER):
+        self.global_bucket = TokenBucket(global_rate)
+        self.server_rate = server_rate
+        self.servers = {}  # server -> TokenBucket
+        self.lock = threading.Lock()
+
+    def set_global_rate(self, rate):
+        self.global_bucket.set_rate(rate)
+
+    def set_server_rate(self, rate, server=None):
+        # without a server the rate becomes the default of every server
+        with self.lock:
+            if server is None:
+                self.server_rate = rate
+                for bucket in self.servers.values():
+                    bucket.set_rate(rate)
+            else:
+                self.server_bucket(server).set_rate(rate)
+
+    def server_bucket(self, server):
+        bucket = self.servers.get(server)
+        if bucket is None:
+            bucket = self.servers[server] = TokenBucket(self.server_rate)
+        return bucket
+
+    def limiter(self, server, rate=0, priority=0):
+        with self.lock:
+            server_bucket = self.server_bucket(server)
+        return RateLimiter([TokenBucket(rate), server_bucket, self.global_bucket], priority)
@@ -0,0 +1,165 @@
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex
+
+from config import *
+
+REMOTE_HEADER = ['Name', 'Size', 'Type', 'Last Modifed', 'Mode', 'Owner']
+
+
+class RemoteNode(object):
+    __slots__ = ('name', 'size', 'type', 'last_modified', 'mode', 'owner', 'parent', 'row', 'children', 'shown',
+                 'fetched')
+
+    def __init__(self, entry=None, parent=None, row=0):
+        if entry is None:
+            entry = ('', 0, FileType.Folder.value, '', '', '')
+        self.name, self.size, self.type, self.last_modified, self.mode, self.owner = entry
+        self.parent = parent
+        self.row = row
+        self.children = []  # every known entry, only the first `shown` are rows of the model
+        self.shown = 0
+        self.fetched = False
+
+    def is_dir(self):
+        return self.type == FileType.Folder.value
+
+    def path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return '/'.join(reversed(names))
+
+    def column(self, column):
+        return (self.name, self.size, self.type, self.last_modified, self.mode, self.owner)[column]
+
+    def sort_key(self, column):
+        if column == FileHeader.Size.value:
+            return self.size
+        return self.column(column).lower()
+
+
+class RemoteFileModel(QAbstractItemModel):
+    # remote listing as a lazy tree: rows are revealed in batches through fetchMore,
+    # subdirectories are listed only when expanded; lister(node) starts a listing
+    # whose entries arrive later through add_entries
+    def __init__(self, parent=None, lister=None):
+        super(RemoteFileModel, self).__init__(parent)
+        self.lister = lister
+        self.root = RemoteNode()
+        self.root.fetched = True
+        self.sort_column = FileHeader.Name.value
+        self.sort_order = Qt.AscendingOrder
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index_of(self, node, column=0):
+        if node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, column, node)
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if row < 0 or row >= node.shown or column < 0 or column >= len(REMOTE_HEADER):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.index_of(index.internalPointer().parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self.node(parent).shown
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(REMOTE_HEADER)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return REMOTE_HEADER[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return str(index.internalPointer().column(index.column()))
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if node is self.root:
+            return bool(node.children)
+        return node.is_dir() and (not node.fetched or bool(node.children))
+
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        return node.shown < len(node.children) or (node.is_dir() and not node.fetched)
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if not node.fetched:
+            node.fetched = True
+            if self.lister is not None:
+                self.lister(node)
+            return
+
+        self.reveal(node, min(len(node.children) - node.shown, REMOTE_FETCH_BATCH))
+
+    def reveal(self, node, count):
+        if count <= 0:
+            return
+        self.beginInsertRows(self.index_of(node), node.shown, node.shown + count - 1)
+        node.shown += count
+        self.endInsertRows()
+
+    # feeding the model
+    def set_entries(self, entries):
+        self.beginResetModel()
+        self.root = RemoteNode()
+        self.root.fetched = True
+        self.add_entries(self.root, entries, reveal=False)
+        self.sort_children(self.root)
+        self.endResetModel()
+
+    def add_entries(self, node, entries, reveal=True):
+        # entries beyond `shown` stay invisible until the view asks for them
+        row = len(node.children)
+        for entry in entries:
+            node.children.append(RemoteNode(entry, node, row))
+            row += 1
+        if reveal:
+            self.reveal(node, min(len(node.children), max(node.shown, REMOTE_FETCH_BATCH)) - node.shown)
+
+    # model side sorting, no item is created
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.relayout(self.sort_tree, self.root)
+
+    def sort_node(self, node):
+        self.relayout(self.sort_children, node)
+
+    def relayout(self, reorder, node):
+        self.layoutAboutToBeChanged.emit()
+        old = self.persistentIndexList()
+        nodes = [(index.internalPointer(), index.column()) for index in old]
+        reorder(node)
+        new = [self.createIndex(node.row, column, node) if node.row < node.parent.shown else QModelIndex()
+               for node, column in nodes]
+        self.changePersistentIndexList(old, new)
+        self.layoutChanged.emit()
+
+    def sort_tree(self, node):
+        self.sort_children(node)
+        for child in node.children:
+            if child.children:
+                self.sort_tree(child)
+
+    def sort_children(self, node):
+        column = self.sort_column
+        node.children.sort(key=lambda child: child.sort_key(column), reverse=self.sort_order == Qt.DescendingOrder)
+        for row, child in enumerate(node.children):
+            child.row = row
@@ -0,0 +1,132 @@
+import heapq
+import itertools
+import threading
+
+from config import *
+
+
+class ScheduledTask(object):
+    __slots__ = ('key', 'server', 'target', 'args', 'priority', 'size', 'entry')
+
+    def __init__(self, key, server, target, args, priority, size):
+        self.key = key
+        self.server = server
+        self.target = target
+        self.args = args
+        self.priority = priority
+        self.size = size
+        self.entry = None
+
+
+class TransferScheduler(object):
+    # runs at most `max_active` transfers at once and at most `max_per_server` against
+    # one server; queued work starts by priority (higher first), then size (smaller first)
+    def __init__(self, max_active=SCHEDULER_MAX_ACTIVE, max_per_server=SCHEDULER_MAX_PER_SERVER):
+        self.max_active = max_active
+        self.max_per_server = max_per_server
+        self.queues = {}  # server -> heap of [(-priority, size), seq, task], task None once removed
+        self.tasks = {}  # key -> queued task
+        self.active = {}  # server -> running transfers
+        self.active_count = 0
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+
+    def submit(self, key, server, target, args=(), priority=0, size=0):
+        with self.lock:
+            if key in self.tasks:
+                return False
+            task = ScheduledTask(key, server, target, args, priority, size)
+            self.tasks[key] = task
+            self.push(task)
+            started = self.dispatch()
+        self.start(started)
+        return True
+
+    def remove(self, key):
+        # only queued work can be removed, a running transfer is stopped through its status
+        with self.lock:
+            task = self.tasks.pop(key, None)
+            if task is None:
+                return False
+            task.entry[2] = None
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.queues = {}
+            self.tasks = {}
+
+    def is_queued(self, key):
+        return key in self.tasks
+
+    def priority(self, key):
+        task = self.tasks.get(key)
+        return None if task is None else task.priority
+
+    def top_priority(self):
+        with self.lock:
+            return max([task.priority for task in self.tasks.values()] + [0])
+
+    def set_priority(self, key, priority):
+        with self.lock:
+            task = self.tasks.get(key)
+            if task is None:
+                return False
+            task.entry[2] = None
+            task.priority = priority
+            self.push(task)
+        return True
+
+    def set_limits(self, max_active=None, max_per_server=None):
+        with self.lock:
+            if max_active is not None:
+                self.max_active = max_active
+            if max_per_server is not None:
+                self.max_per_server = max_per_server
+            started = self.dispatch()
+        self.start(started)
+
+    # internals, push and dispatch expect the lock to be held
+    def push(self, task):
+        task.entry = [(-task.priority, task.size), next(self.seq), task]
+        heapq.heappush(self.queues.setdefault(task.server, []), task.entry)
+
+    def dispatch(self):
+        started = []
+        while self.active_count < self.max_active:
+            best = None
+            for server, heap in self.queues.items():
+                while heap and heap[0][2] is None:
+                    heapq.heappop(heap)
+                if not heap or self.active.get(server, 0) >= self.max_per_server:
+                    continue
+                if best is None or heap[0] < best[0]:
+                    best = heap
+            if best is None:
+                break
+
+            task = heapq.heappop(best)[2]
+            del self.tasks[task.key]
+            self.active[task.server] = self.active.get(task.server, 0) + 1
+            self.active_count += 1
+            started.append(task)
+
+        self.queues = dict((server, heap) for server, heap in self.queues.items() if heap)
+        return started
+
+    def start(self, tasks):
+        for task in tasks:
+            t = threading.Thread(target=self.execute, args=(task,))
+            t.start()
+
+    def execute(self, task):
+        try:
+            task.target(*task.args)
+        finally:
+            with self.lock:
+                self.active[task.server] -= 1
+                if self.active[task.server] == 0:
+                    del self.active[task.server]
+                self.active_count -= 1
+                started = self.dispatch()
+            self.start(started)
@@ -0,0 +1,122 @@
+import threading
+
+from config import *
+
+
+class Segment(object):
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.trans_size = 0
+        self.retries = 0
+
+    def offset(self):
+        return self.start + self.trans_size
+
+    def remaining(self):
+        return self.end - self.offset()
+
+    def finished(self):
+        return self.remaining() <= 0
+
+
+def split_segments(total_size, count):
+    count = max(1, min(count, total_size))
+    seg_size = -(-total_size // count)
+    segments = []
+    for start in range(0, total_size, seg_size):
+        segments.append(Segment(start, min(start + seg_size, total_size)))
+    return segments
+
+
+class SegmentedDownload(object):
+    # fetch byte ranges of one remote file over several sessions at once,
+    # each segment is written at its own offset of the (preallocated) local file
+    def __init__(self, acquire, release, local_file, remote_file, segments, mode,
+                 is_running, on_progress, on_response, limiter=None):
+        self.acquire = acquire
+        self.release = release
+        self.local_file = local_file
+        self.remote_file = remote_file
+        self.segments = segments
+        self.mode = mode
+        self.is_running = is_running
+        self.on_progress = on_progress
+        self.on_response = on_response
+        self.limiter = limiter  # shared by every segment, they count as one transfer
+
+    def run(self):
+        threads = []
+        for segment in self.segments:
+            if segment.finished():
+                continue
+            t = threading.Thread(target=self.download_segment, args=(segment,))
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
+        return all(segment.finished() for segment in self.segments)
+
+    def download_segment(self, segment):
+        while not segment.finished() and self.is_running():
+            try:
+                self.fetch(segment)
+            except (OSError, EOFError, RuntimeError) as e:
+                self.on_response(SYSTEM_HEADER + f"5 segment {segment.start}-{segment.end} failed: {e}")
+
+            if segment.finished() or not self.is_running():
+                return
+
+            # retry only this segment, from where it stopped
+            segment.retries += 1
+            if segment.retries > SEGMENT_RETRY:
+                self.on_response(SYSTEM_HEADER + f"5 segment {segment.start}-{segment.end} gave up.")
+                return
+
+    def fetch(self, segment):
+        session = self.acquire()
+        if session is None:
+            raise RuntimeError("fail to open session")
+
+        discard = True
+        session.limiter = self.limiter
+        try:
+            self.on_response(session.type('I'))
+            response = session.select_mode(self.remote_file)
+            if response is not None:
+                self.on_response(response)
+            if self.mode == ClientMode.PORT:
+                self.on_response(session.port())
+            else:
+                self.on_response(session.pasv())
+
+            offset = segment.offset()
+            response = session.rest(offset)
+            self.on_response(response)
+            if session.get_status_code(response)[0] != '3':
+                raise RuntimeError("server does not support REST")
+
+            with open(self.local_file, 'r+b') as fp:
+                fp.seek(offset)
+
+                def do_segment(view):
+                    if not self.is_running():
+                        return False
+
+                    view = view[:segment.remaining()]
+                    fp.write(view)
+                    segment.trans_size += len(view)
+                    self.on_progress(len(view))
+                    return not segment.finished()
+
+                response = session.retr(self.remote_file, consumer=do_segment)
+                self.on_response(response)
+
+            # a segment that stops early aborts its data connection,
+            # only sessions that got a clean final reply go back to the pool
+            discard = session.get_status_code(response.splitlines()[-1])[0] != '2'
+        finally:
+            session.limiter = None
+            self.release(session, discard)
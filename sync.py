@@ -0,0 +1,208 @@
+import os
+import posixpath
+from collections import Counter
+
+from config import *
+
+SYNC_UPLOAD = 'upload'
+SYNC_DOWNLOAD = 'download'
+SYNC_BOTH = 'both'
+
+MKDIR_REMOTE = 'mkdir'
+DELETE_REMOTE = 'delete remote'
+DELETE_LOCAL = 'delete local'
+
+
+class SyncAction(object):
+    __slots__ = ('kind', 'path', 'size', 'mtime')
+
+    def __init__(self, kind, path, size=0, mtime=None):
+        self.kind = kind
+        self.path = path  # relative to both roots, '/' separated
+        self.size = size
+        self.mtime = mtime
+
+
+class SyncPlan(object):
+    def __init__(self, local_dir, remote_dir, direction):
+        self.local_dir = local_dir
+        self.remote_dir = remote_dir
+        self.direction = direction
+        self.actions = []
+        self.skipped = 0
+        self.skipped_bytes = 0
+        self.conflicts = []
+
+    def local_path(self, path):
+        return os.path.join(self.local_dir, *path.split('/'))
+
+    def remote_path(self, path):
+        return posixpath.join(self.remote_dir, path)
+
+    def report(self):
+        counts = Counter(action.kind for action in self.actions)
+        transfer_bytes = sum(action.size for action in self.actions if action.kind in (SYNC_UPLOAD, SYNC_DOWNLOAD))
+        parts = [f"{counts[kind]} {kind}" for kind in (SYNC_UPLOAD, SYNC_DOWNLOAD, MKDIR_REMOTE, DELETE_REMOTE,
+                                                       DELETE_LOCAL) if counts[kind]]
+        parts.append(f"{self.skipped} unchanged")
+        if self.conflicts:
+            parts.append(f"{len(self.conflicts)} conflicts skipped")
+        return (f"sync {self.local_dir} {self.direction} {self.remote_dir}: " + ', '.join(parts) +
+                f"; {transfer_bytes} bytes to transfer, {self.skipped_bytes} bytes saved.")
+
+
+def scan_local(local_dir):
+    # relative path -> (size, mtime), and the set of relative directories
+    files = {}
+    dirs = set()
+    stack = [('', local_dir)]
+    while stack:
+        prefix, directory = stack.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                path = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.add(path)
+                    stack.append((path + '/', entry.path))
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[path] = (st.st_size, st.st_mtime)
+    return files, dirs
+
+
+def scan_remote(session, remote_dir, mode, mlsd, on_response):
+    # relative path -> (size, mtime, how many seconds mtime may be off), and the set of directories;
+    # MLSD times are exact UTC, LIST times have minute or day precision in the server's time zone
+    files = {}
+    dirs = set()
+    stack = ['']
+    while stack:
+        prefix = stack.pop()
+        if mode == ClientMode.PORT:
+            on_response(session.port())
+        else:
+            on_response(session.pasv())
+        for entry in session.iter_listing(posixpath.join(remote_dir, prefix), mlsd):
+            path = prefix + entry.name
+            if entry.is_dir():
+                dirs.add(path)
+                stack.append(path + '/')
+            elif mlsd:
+                files[path] = (entry.size, entry.mtime, SYNC_MTIME_TOLERANCE)
+            else:
+                precision = 60 if ':' in entry.last_modified else 86400
+                files[path] = (entry.size, entry.mtime, precision + SYNC_LIST_TIME_SLACK)
+        on_response(session.last_response)
+        if session.get_status_code(session.last_response.splitlines()[-1])[0] != '2':
+            raise RuntimeError(f"fail to list {posixpath.join(remote_dir, prefix)}")
+    return files, dirs
+
+
+def refine_mtimes(session, remote_dir, remote_files, paths, on_response):
+    # exact MDTM times for the files a LIST time cannot decide, pipelined
+    replies = session.mdtm_many([posixpath.join(remote_dir, path) for path in paths])
+    for path, (response, mtime) in zip(paths, replies):
+        on_response(response)
+        if mtime is not None:
+            remote_files[path] = (remote_files[path][0], mtime, SYNC_MTIME_TOLERANCE)
+
+
+def compare(local, remote):
+    # > 0 when the local file is newer, < 0 when the remote one is, 0 when they look the same
+    local_size, local_mtime = local
+    remote_size, remote_mtime, tolerance = remote
+    if remote_mtime is None or abs(local_mtime - remote_mtime) <= tolerance:
+        return 0 if local_size == remote_size else None
+    return 1 if local_mtime > remote_mtime else -1
+
+
+def unchanged_since(local, remote, synced):
+    # both sides are as the last sync upload left them, although their times differ:
+    # the server kept its own time for the upload and the journal recorded it
+    if synced is None or remote[1] is None:
+        return False
+    size, local_mtime, remote_mtime = synced
+    return (local[0] == remote[0] == size and abs(local[1] - local_mtime) <= SYNC_MTIME_TOLERANCE and
+            abs(remote[1] - remote_mtime) <= remote[2])
+
+
+def plan_sync(local_dir, remote_dir, local_files, local_dirs, remote_files, remote_dirs, direction, delete=False,
+              synced=None):
+    # one pass over the union of both trees, dict lookups only; synced maps a path to the
+    # (size, local_mtime, remote_mtime) the last sync upload of it left behind
+    plan = SyncPlan(local_dir, remote_dir, direction)
+    synced = synced or {}
+    upload = direction in (SYNC_UPLOAD, SYNC_BOTH)
+    download = direction in (SYNC_DOWNLOAD, SYNC_BOTH)
+
+    if upload:
+        for path in sorted(local_dirs - remote_dirs, key=lambda path: path.count('/')):
+            plan.actions.append(SyncAction(MKDIR_REMOTE, path))
+
+    for path, local in local_files.items():
+        remote = remote_files.get(path)
+        if remote is None:
+            if upload:
+                plan.actions.append(SyncAction(SYNC_UPLOAD, path, local[0]))
+            elif delete:
+                plan.actions.append(SyncAction(DELETE_LOCAL, path))
+            continue
+
+        order = compare(local, remote)
+        if order and unchanged_since(local, remote, synced.get(path)):
+            order = 0
+        if order == 0:
+            plan.skipped += 1
+            plan.skipped_bytes += local[0]
+        elif order is None:
+            # same time, different size: nothing tells which side is right
+            if direction == SYNC_UPLOAD:
+                plan.actions.append(SyncAction(SYNC_UPLOAD, path, local[0]))
+            elif direction == SYNC_DOWNLOAD:
+                plan.actions.append(SyncAction(SYNC_DOWNLOAD, path, remote[0], remote[1]))
+            else:
+                plan.conflicts.append(path)
+        elif order > 0 and upload:
+            plan.actions.append(SyncAction(SYNC_UPLOAD, path, local[0]))
+        elif order < 0 and download:
+            plan.actions.append(SyncAction(SYNC_DOWNLOAD, path, remote[0], remote[1]))
+        else:
+            # the target side is newer, a one way sync leaves it alone
+            plan.skipped += 1
+            plan.skipped_bytes += local[0]
+
+    for path, remote in remote_files.items():
+        if path in local_files:
+            continue
+        if download:
+            plan.actions.append(SyncAction(SYNC_DOWNLOAD, path, remote[0], remote[1]))
+        elif delete:
+            plan.actions.append(SyncAction(DELETE_REMOTE, path))
+
+    return plan
+
+
+def build_sync_plan(session, local_dir, remote_dir, direction, delete, mode, mlsd, has_mdtm, on_response,
+                    synced=None):
+    local_files, local_dirs = scan_local(local_dir)
+    remote_files, remote_dirs = scan_remote(session, remote_dir, mode, mlsd, on_response)
+    synced = synced or {}
+
+    if not mlsd and has_mdtm:
+        undecided = [path for path, local in local_files.items()
+                     if path in remote_files and remote_files[path][2] > SYNC_MTIME_TOLERANCE and
+                     (compare(local, remote_files[path]) == 0 or
+                      unchanged_since(local, remote_files[path], synced.get(path)))]
+        refine_mtimes(session, remote_dir, remote_files, undecided, on_response)
+
+    plan = plan_sync(local_dir, remote_dir, local_files, local_dirs, remote_files, remote_dirs, direction, delete,
+                     synced)
+
+    if not mlsd and has_mdtm:
+        # downloads take the exact time, or the next sync would compare it against a LIST time
+        downloads = [action for action in plan.actions
+                     if action.kind == SYNC_DOWNLOAD and remote_files[action.path][2] > SYNC_MTIME_TOLERANCE]
+        refine_mtimes(session, remote_dir, remote_files, [action.path for action in downloads], on_response)
+        for action in downloads:
+            action.mtime = remote_files[action.path][1]
+    return plan
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from async_model import AsyncSessionPool
+from config import ClientMode
+from engine import TransferEngine
+from ftpserver import LoopbackFTPServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    with LoopbackFTPServer(str(tmp_path)) as server:
+        yield server
+
+
+def test_stor_and_retr(server, tmp_path):
+    async def run():
+        pool = AsyncSessionPool(('127.0.0.1', server.port, 'test', 'test'))
+        session = await pool.acquire()
+        await session.type('I')
+        await session.pasv()
+        response = await session.stor('up.bin', [b'abc', b'def'])
+        await session.port()
+        data = b''.join([buf async for buf in session.retr('up.bin')])
+        pool.release(session)
+        return response, data, len(pool.idle)
+
+    response, data, idle = asyncio.run(run())
+    assert response.splitlines()[-1].split(' ')[1] == '226'
+    assert data == b'abcdef'
+    assert (tmp_path / 'up.bin').read_bytes() == b'abcdef'
+    assert idle == 1
+
+
+@pytest.mark.parametrize('mode', [ClientMode.PASV, ClientMode.PORT])
+def test_concurrent_listings_share_one_loop(server, mode):
+    engine = TransferEngine(on_response=lambda response: None, journal_path=':memory:')
+    engine.mode = mode
+    assert engine.login('127.0.0.1', server.port, 'test', 'test') is not None
+    counts = (10, 2000, 30000)
+
+    async def run():
+        return await asyncio.gather(*[engine.list_remote_dir_async('/synthetic/dir/%d' % count, force=True)
+                                      for count in counts])
+
+    try:
+        listings = asyncio.run(run())
+    finally:
+        engine.logout()
+        engine.close()
+    assert [len(entries) for entries in listings] == list(counts)
+    assert listings[1][0].name == 'f0000000' and listings[1][0].size == 1024
+    assert engine.listing_cache.get(engine.server_key(), '/synthetic/dir/10') is not None
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from config import ClientMode, TransferStatus
+from engine import TransferEngine
+from ftpserver import LoopbackFTPServer
+from ratelimit import RateLimiter
+
+
+@pytest.fixture
+def engine(tmp_path):
+    (tmp_path / 'remote').mkdir()
+    with LoopbackFTPServer(str(tmp_path / 'remote')) as server:
+        responses = []
+        engine = TransferEngine(on_response=responses.append, journal_path=':memory:')
+        engine.mode = ClientMode.PASV
+        engine.segment_count = 1
+        assert engine.login('127.0.0.1', server.port, 'test', 'test') is not None
+        yield engine
+        engine.logout()
+        engine.close()
+
+
+@pytest.fixture
+def thread_errors(monkeypatch):
+    errors = []
+    monkeypatch.setattr(threading, 'excepthook', lambda args: errors.append(args.exc_value))
+    return errors
+
+
+def test_cancel_during_retr(engine, tmp_path, thread_errors, monkeypatch):
+    released = []
+    monkeypatch.setattr(RateLimiter, 'release', lambda limiter: released.append(limiter))
+    size = 64 << 20
+    local_file = str(tmp_path / 'big.bin')
+    engine.bandwidth.set_global_rate(8 << 20)
+    engine.download_file(local_file, '/synthetic/file/%d' % size, size)
+
+    deadline = time.monotonic() + 10
+    proc = None
+    while time.monotonic() < deadline:
+        procs = list(engine.running_proc.values())
+        if procs and procs[0].status == TransferStatus.Running and procs[0].trans_size > 0:
+            proc = procs[0]
+            break
+        time.sleep(0.01)
+    assert proc is not None
+
+    engine.cancel_transfer(proc)
+    engine.wait()
+
+    assert thread_errors == []
+    assert not engine.running_proc
+    assert [p.status for p in engine.finished_proc] == [TransferStatus.Canceled]
+    assert released == [proc.limiter]
+    assert not os.path.exists(local_file)
+
+
+def test_sync_upload_without_mfmt(tmp_path):
+    # the server keeps its own time for the upload: the source file stays as it was and
+    # the next sync still finds nothing to do, until the remote file really changes
+    (tmp_path / 'remote' / 'r').mkdir(parents=True)
+    (tmp_path / 'local').mkdir()
+    local_file = tmp_path / 'local' / 'a.txt'
+    local_file.write_text('hello')
+    old = time.time() - 3600
+    os.utime(str(local_file), (old, old))
+
+    with LoopbackFTPServer(str(tmp_path / 'remote'), features=('SIZE', 'MDTM', 'REST STREAM')) as server:
+        engine = TransferEngine(on_response=lambda response: None, journal_path=':memory:')
+        engine.mode = ClientMode.PASV
+        assert engine.login('127.0.0.1', server.port, 'test', 'test') is not None
+        try:
+            plans = []
+            for _ in range(2):
+                plans.append(engine.sync_dir(str(tmp_path / 'local'), '/r', 'both'))
+                engine.wait()
+            source_mtime = os.path.getmtime(str(local_file))
+            remote_file = tmp_path / 'remote' / 'r' / 'a.txt'
+            remote_file.write_text('howdy')
+            os.utime(str(remote_file), (time.time() + 60, time.time() + 60))
+            plans.append(engine.sync_dir(str(tmp_path / 'local'), '/r', 'both'))
+            engine.wait()
+        finally:
+            engine.logout()
+            engine.close()
+
+    assert source_mtime == old
+    assert [action.kind for action in plans[0].actions] == ['upload']
+    assert plans[1].actions == [] and plans[1].skipped == 1
+    assert [action.kind for action in plans[2].actions] == ['download']
+    assert local_file.read_text() == 'howdy'
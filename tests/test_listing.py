@@ -0,0 +1,91 @@
+import calendar
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from listing import parse_list_line, parse_listing, parse_mlsd_line, mdtm_to_time
+
+FILE = 'File'
+FOLDER = 'Folder'
+
+
+@pytest.mark.parametrize('line, name, size, kind, mtime', [
+    ('-rw-r--r--   1 ftp  ftp       1024 Jan 02  2019 notes.txt', 'notes.txt', 1024, FILE,
+     calendar.timegm((2019, 1, 2, 0, 0, 0))),
+    ('drwxr-xr-x   2 ftp  ftp       4096 Mar 10  2020 pub', 'pub', 4096, FOLDER,
+     calendar.timegm((2020, 3, 10, 0, 0, 0))),
+    ('-rw-r--r--   1 ftp  ftp         12 Jun 30  2021 my  file name.txt', 'my  file name.txt', 12, FILE,
+     calendar.timegm((2021, 6, 30, 0, 0, 0))),
+    ('lrwxrwxrwx   1 ftp  ftp          7 Feb 01  2018 latest -> v1.2.3', 'latest', 7, FILE,
+     calendar.timegm((2018, 2, 1, 0, 0, 0))),
+    ('lrwxrwxrwx   1 ftp  ftp          7 Feb 01  2018 a -> b -> c', 'a', 7, FILE,
+     calendar.timegm((2018, 2, 1, 0, 0, 0))),
+    ('01-02-19  03:04PM       <DIR>          Program Files', 'Program Files', 0, FOLDER,
+     calendar.timegm((2019, 1, 2, 15, 4, 0))),
+    ('12-31-99  12:00AM                 2048 old report.doc', 'old report.doc', 2048, FILE,
+     calendar.timegm((1999, 12, 31, 0, 0, 0))),
+])
+def test_list_line(line, name, size, kind, mtime):
+    entry = parse_list_line(line)
+    assert (entry.name, entry.size, entry.type, entry.mtime) == (name, size, kind, mtime)
+
+
+@pytest.mark.parametrize('line', [
+    'total 12',
+    'drwxr-xr-x   2 ftp  ftp       4096 Mar 10  2020 .',
+    'drwxr-xr-x   2 ftp  ftp       4096 Mar 10  2020 ..',
+    '-rw-r--r--   1 ftp  ftp       huge Jan 02  2019 notes.txt',
+    '',
+])
+def test_list_line_skipped(line):
+    assert parse_list_line(line) is None
+
+
+def test_list_line_recent_time_is_this_year_or_last():
+    entry = parse_list_line('-rw-r--r--   1 ftp  ftp         10 Jan 01 12:30 new.txt')
+    year = calendar.timegm((2000, 1, 1, 0, 0, 0))
+    assert entry.mtime > year and entry.mtime % 86400 == 12 * 3600 + 30 * 60
+    assert entry.last_modified == 'Jan 01 12:30'
+
+
+@pytest.mark.parametrize('line, name, size, kind, mtime', [
+    ('type=file;size=1024;modify=20190102030405; notes.txt', 'notes.txt', 1024, FILE,
+     calendar.timegm((2019, 1, 2, 3, 4, 5))),
+    ('type=dir;modify=20200310000000; pub', 'pub', 0, FOLDER, calendar.timegm((2020, 3, 10, 0, 0, 0))),
+    ('Type=File;Size=7;Modify=20210630120000.123; my file.txt', 'my file.txt', 7, FILE,
+     calendar.timegm((2021, 6, 30, 12, 0, 0))),
+    ('type=file;sizd=9; no time', 'no time', 9, FILE, None),
+    ('type=file;size=3;modify=garbage; bad time', 'bad time', 3, FILE, None),
+])
+def test_mlsd_line(line, name, size, kind, mtime):
+    entry = parse_mlsd_line(line)
+    assert (entry.name, entry.size, entry.type, entry.mtime) == (name, size, kind, mtime)
+
+
+@pytest.mark.parametrize('line', [
+    'type=cdir;modify=20200310000000; .',
+    'type=pdir;modify=20200310000000; ..',
+    'type=file;size=1',
+])
+def test_mlsd_line_skipped(line):
+    assert parse_mlsd_line(line) is None
+
+
+def test_listing_split_across_chunks():
+    data = ('-rw-r--r--   1 ftp  ftp          5 Jan 02  2019 café menu.txt\r\n'
+            'drwxr-xr-x   2 ftp  ftp       4096 Mar 10  2020 pub\r\n'
+            '-rw-r--r--   1 ftp  ftp          1 Mar 10  2020 last').encode()
+    # every split point, including inside the CRLF and the two bytes of the e acute
+    for cut in range(1, len(data)):
+        entries = list(parse_listing([data[:cut], data[cut:]]))
+        assert [entry.name for entry in entries] == ['café menu.txt', 'pub', 'last']
+
+
+def test_mdtm_to_time():
+    assert mdtm_to_time('20190102030405') == calendar.timegm((2019, 1, 2, 3, 4, 5))
+    assert mdtm_to_time('20190102030405.999') == calendar.timegm((2019, 1, 2, 3, 4, 5))
+    assert mdtm_to_time('not a time') is None
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import model
+from config import ClientStatus
+from ftpserver import FTPHandler, LoopbackFTPServer
+
+
+class SlowDeleteHandler(FTPHandler):
+    # DELE of `slow` answers after `delay` seconds; every DELE is counted
+    def ftp_DELE(self, argu):
+        self.server.deleted.append(argu)
+        if argu == self.server.slow:
+            time.sleep(self.server.delay)
+        super(SlowDeleteHandler, self).ftp_DELE(argu)
+
+
+@pytest.fixture
+def server(tmp_path):
+    with LoopbackFTPServer(str(tmp_path)) as server:
+        server.RequestHandlerClass = SlowDeleteHandler
+        server.deleted = []
+        server.slow = 'b'
+        server.delay = 0.5
+        yield server
+
+
+def login(server):
+    session = model.ClientModel()
+    session.connect('127.0.0.1', server.port)
+    session.user('test')
+    session.password('test')
+    return session
+
+
+def test_stalled_batch_is_not_sent_again(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(model, 'PIPELINE_TIMEOUT', 0.2)
+    names = ['a', 'b', 'c', 'd']
+    for name in names:
+        (tmp_path / name).write_bytes(b'x')
+
+    session = login(server)
+    responses = session.dele_many(names)
+
+    assert [session.get_status_code(response) for response in responses] == ['250'] * 4
+    assert server.deleted == names
+    assert not session.pipelining
+    assert not any((tmp_path / name).exists() for name in names)
+    # the connection is still in step
+    assert session.get_status_code(session.noop()) == '200'
+
+
+def test_missing_replies_drop_the_connection(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(model, 'PIPELINE_TIMEOUT', 0.2)
+    monkeypatch.setattr(model, 'PIPELINE_REPLY_TIMEOUT', 0.2)
+    for name in 'ab':
+        (tmp_path / name).write_bytes(b'x')
+
+    session = login(server)
+    with pytest.raises(ConnectionError):
+        session.dele_many(['a', 'b'])
+    assert session.status == ClientStatus.DISCONNECT
+    assert server.deleted == ['a', 'b']
+
+
+class SplitReplyHandler(FTPHandler):
+    # the reply to DELE of `slow` stops at server.split and its rest follows `delay` seconds later
+    def ftp_DELE(self, argu):
+        if argu != self.server.slow:
+            super(SplitReplyHandler, self).ftp_DELE(argu)
+            return
+        os.remove(self.real_path(self.virtual_path(argu)))
+        head, tail = self.server.split
+        self.wfile.write(head.encode())
+        self.wfile.flush()
+        time.sleep(self.server.delay)
+        self.reply(tail)
+
+
+@pytest.mark.parametrize('split', [('250 fi', 'le removed'), ('250-b\r\n250-fi', 'le\r\n250 removed')])
+def test_reply_split_across_the_stall(server, tmp_path, monkeypatch, split):
+    monkeypatch.setattr(model, 'PIPELINE_TIMEOUT', 0.2)
+    server.RequestHandlerClass = SplitReplyHandler
+    server.split = split
+    names = ['a', 'b', 'c']
+    for name in names:
+        (tmp_path / name).write_bytes(b'x')
+
+    session = login(server)
+    responses = session.dele_many(names)
+
+    assert responses[1] == model.SERVER_HEADER + (split[0] + split[1]).replace('\r\n', '\n')
+    assert [session.get_status_code(response)[:3] for response in responses] == ['250'] * 3
+    assert not any((tmp_path / name).exists() for name in names)
+    assert session.get_status_code(session.noop()) == '200'
@@ -0,0 +1,86 @@
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import model
+from ftpserver import FTPHandler, LoopbackFTPServer
+
+
+class DroppingHandler(FTPHandler):
+    # keeps its connection for the test to drop; with `drop_after_dele` set, DELE
+    # removes the file and closes the connection instead of replying
+    def setup(self):
+        super(DroppingHandler, self).setup()
+        self.server.connections.append(self.request)
+
+    def ftp_DELE(self, argu):
+        self.server.deleted.append(argu)
+        if self.server.drop_after_dele:
+            os.remove(self.real_path(self.virtual_path(argu)))
+            return False
+        super(DroppingHandler, self).ftp_DELE(argu)
+
+
+@pytest.fixture
+def server(tmp_path):
+    with LoopbackFTPServer(str(tmp_path)) as server:
+        server.RequestHandlerClass = DroppingHandler
+        server.connections = []
+        server.deleted = []
+        server.drop_after_dele = False
+        yield server
+
+
+def login(server):
+    session = model.ClientModel()
+    session.connect('127.0.0.1', server.port)
+    session.user('test')
+    session.password('test')
+    return session
+
+
+def drop(server):
+    for sock in server.connections:
+        sock.shutdown(socket.SHUT_RDWR)
+    time.sleep(0.1)
+
+
+def test_connection_dropped_while_idle_is_restored(server, tmp_path):
+    (tmp_path / 'x').write_bytes(b'x')
+    session = login(server)
+    drop(server)
+
+    response = session.dele('x')
+    assert session.get_status_code(response) == '250'
+    assert server.deleted == ['x']
+    assert len(server.connections) == 2
+
+
+def test_command_whose_reply_was_lost_is_not_sent_again(server, tmp_path):
+    (tmp_path / 'x').write_bytes(b'x')
+    session = login(server)
+    server.drop_after_dele = True
+
+    response = session.dele('x')
+    assert response.startswith(model.SYSTEM_HEADER + '4')
+    assert server.deleted == ['x']
+    assert not (tmp_path / 'x').exists()
+    # the session was restored all the same
+    assert session.get_status_code(session.pwd()[0]) == '257'
+
+
+def test_pipelined_batch_after_idle_drop(server, tmp_path):
+    (tmp_path / 'x').write_bytes(b'x')
+    session = login(server)
+    drop(server)
+
+    responses = session.rename_many([('/x', '/y')])
+    assert session.get_status_code(responses[0]) == '250'
+    assert (tmp_path / 'y').exists()
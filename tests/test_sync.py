@@ -0,0 +1,83 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sync import plan_sync, compare, SYNC_UPLOAD, SYNC_DOWNLOAD, SYNC_BOTH
+
+T = 1600000000
+EXACT = 2  # SYNC_MTIME_TOLERANCE, MLSD or MDTM times
+LIST_DAY = 86400 + 86400  # a LIST time with day precision, plus the time zone slack
+
+
+@pytest.mark.parametrize('local, remote, order', [
+    ((5, T), (5, T, EXACT), 0),
+    ((5, T), (5, T + 2, EXACT), 0),
+    ((5, T), (6, T, EXACT), None),
+    ((5, T + 10), (5, T, EXACT), 1),
+    ((5, T), (5, T + 10, EXACT), -1),
+    ((5, T + 3600), (5, T, LIST_DAY), 0),
+    ((5, T), (5, None, EXACT), 0),
+    ((5, T), (6, None, EXACT), None),
+])
+def test_compare(local, remote, order):
+    assert compare(local, remote) == order
+
+
+@pytest.mark.parametrize('local, remote, direction, delete, actions, skipped, conflicts', [
+    # same on both sides
+    ({'a': (5, T)}, {'a': (5, T, EXACT)}, SYNC_BOTH, False, [], 1, []),
+    # only on one side
+    ({'a': (5, T)}, {}, SYNC_UPLOAD, False, [('upload', 'a')], 0, []),
+    ({'a': (5, T)}, {}, SYNC_DOWNLOAD, False, [], 0, []),
+    ({'a': (5, T)}, {}, SYNC_DOWNLOAD, True, [('delete local', 'a')], 0, []),
+    ({}, {'a': (5, T, EXACT)}, SYNC_DOWNLOAD, False, [('download', 'a')], 0, []),
+    ({}, {'a': (5, T, EXACT)}, SYNC_UPLOAD, True, [('delete remote', 'a')], 0, []),
+    ({}, {'a': (5, T, EXACT)}, SYNC_BOTH, True, [('download', 'a')], 0, []),
+    # newer side wins, a one way sync leaves a newer target alone
+    ({'a': (5, T + 10)}, {'a': (5, T, EXACT)}, SYNC_BOTH, False, [('upload', 'a')], 0, []),
+    ({'a': (5, T)}, {'a': (5, T + 10, EXACT)}, SYNC_BOTH, False, [('download', 'a')], 0, []),
+    ({'a': (5, T)}, {'a': (5, T + 10, EXACT)}, SYNC_UPLOAD, False, [], 1, []),
+    ({'a': (5, T + 10)}, {'a': (5, T, EXACT)}, SYNC_DOWNLOAD, False, [], 1, []),
+    # same time, different size
+    ({'a': (5, T)}, {'a': (6, T, EXACT)}, SYNC_UPLOAD, False, [('upload', 'a')], 0, []),
+    ({'a': (5, T)}, {'a': (6, T, EXACT)}, SYNC_DOWNLOAD, False, [('download', 'a')], 0, []),
+    ({'a': (5, T)}, {'a': (6, T, EXACT)}, SYNC_BOTH, False, [], 0, ['a']),
+])
+def test_plan(local, remote, direction, delete, actions, skipped, conflicts):
+    plan = plan_sync('/l', '/r', local, set(), remote, set(), direction, delete)
+    assert sorted((action.kind, action.path) for action in plan.actions) == actions
+    assert (plan.skipped, plan.conflicts) == (skipped, conflicts)
+
+
+def test_plan_directories_parents_first():
+    plan = plan_sync('/l', '/r', {}, {'a/b/c', 'a', 'a/b', 'x'}, {}, {'x'}, SYNC_UPLOAD)
+    assert [(action.kind, action.path) for action in plan.actions] == [('mkdir', 'a'), ('mkdir', 'a/b'),
+                                                                       ('mkdir', 'a/b/c')]
+
+
+def test_plan_download_carries_remote_time():
+    plan = plan_sync('/l', '/r', {}, set(), {'d/a': (5, T, EXACT)}, {'d'}, SYNC_DOWNLOAD)
+    assert [(action.path, action.size, action.mtime) for action in plan.actions] == [('d/a', 5, T)]
+    assert plan.local_path('d/a') == os.path.join('/l', 'd', 'a')
+    assert plan.remote_path('d/a') == '/r/d/a'
+
+
+@pytest.mark.parametrize('local, remote, synced, actions', [
+    # the server kept the upload time: both sides as the last upload left them
+    ({'a': (5, T)}, {'a': (5, T + 600, EXACT)}, {'a': (5, T, T + 600)}, []),
+    ({'a': (5, T)}, {'a': (5, T + 600, LIST_DAY)}, {'a': (5, T, T + 600)}, []),
+    # the remote file changed since
+    ({'a': (5, T)}, {'a': (5, T + 900, EXACT)}, {'a': (5, T, T + 600)}, [('download', 'a')]),
+    ({'a': (5, T)}, {'a': (6, T + 600, EXACT)}, {'a': (5, T, T + 600)}, [('download', 'a')]),
+    # the local file changed since
+    ({'a': (5, T + 1200)}, {'a': (5, T + 600, EXACT)}, {'a': (5, T, T + 600)}, [('upload', 'a')]),
+    # no record
+    ({'a': (5, T)}, {'a': (5, T + 600, EXACT)}, {}, [('download', 'a')]),
+])
+def test_plan_after_upload_without_mfmt(local, remote, synced, actions):
+    plan = plan_sync('/l', '/r', local, set(), remote, set(), SYNC_BOTH, synced=synced)
+    assert [(action.kind, action.path) for action in plan.actions] == actions
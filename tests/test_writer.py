@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from writer import WriteBehindWriter
+
+
+@pytest.mark.parametrize('offset, size, chunks', [
+    (0, None, [b'abc', b'def']),
+    (0, 100, [b'x' * 40, b'y' * 20]),  # preallocated, then cut back to what arrived
+    (5, None, [b'tail']),  # a resume appends after what is already there
+    (5, 1 << 20, [b'z' * 1000] * 3),
+])
+def test_writes_land_at_offset(tmp_path, offset, size, chunks):
+    path = tmp_path / 'file'
+    path.write_bytes(b'01234567')
+    written = []
+
+    writer = WriteBehindWriter(str(path), offset=offset, size=size, on_written=written.append, coalesce=1024)
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.close()
+
+    expected = b'01234567'[:offset] + b''.join(chunks)
+    assert path.read_bytes() == expected
+    assert sum(written) == len(expected) - offset
+
+
+class GatedWriter(WriteBehindWriter):
+    # every pwrite waits for the gate
+    def __init__(self, *args, **kwargs):
+        self.gate = threading.Event()
+        super(GatedWriter, self).__init__(*args, **kwargs)
+
+    def pwrite(self, batch):
+        self.gate.wait()
+        super(GatedWriter, self).pwrite(batch)
+
+
+def test_full_buffer_blocks_until_drained(tmp_path):
+    path = tmp_path / 'file'
+    writer = GatedWriter(str(path), buffer_size=8)
+    writer.write(b'a' * 8)
+
+    second = threading.Thread(target=writer.write, args=(b'b' * 8,))
+    second.start()
+    second.join(0.2)
+    assert second.is_alive()
+    assert writer.buffered == 8
+
+    writer.gate.set()
+    second.join(5)
+    assert not second.is_alive()
+    writer.close()
+    assert path.read_bytes() == b'a' * 8 + b'b' * 8
+
+
+def test_write_that_makes_no_progress_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, 'pwritev', lambda fd, views, offset: 0, raising=False)
+    monkeypatch.setattr(os, 'pwrite', lambda fd, data, offset: 0)
+    writer = WriteBehindWriter(str(tmp_path / 'file'))
+    writer.write(b'data')
+    with pytest.raises(OSError):
+        writer.close()
@@ -0,0 +1,268 @@
+from datetime import timedelta
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent, QRect, QSize
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton, QStyleOptionProgressBar
+
+from config import *
+
+TRANSFER_HEADER = ['Server/Local File', 'Direction', 'Remote File', 'Size', 'Rate', 'ETA', 'Start Time', 'End Time',
+                   'Status', 'Operation']
+FINISHED_HEADER = ['Server/Local File', 'Direction', 'Remote File', 'Size', 'Start Time', 'End Time', 'Elapsed time',
+                   'Status']
+
+SORT_ROLE = Qt.UserRole
+PROGRESS_ROLE = Qt.UserRole + 1
+PROC_ROLE = Qt.UserRole + 2
+
+
+class TransferTableModel(QAbstractTableModel):
+    # one row per running transfer, keyed by TransferProcess.id so that
+    # progress only touches the rows that changed
+    def __init__(self, parent=None):
+        super(TransferTableModel, self).__init__(parent)
+        self.procs = []
+        self.rows = {}  # proc id -> row
+        self.stats = {}  # proc id -> last TransferProgress
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.procs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(TRANSFER_HEADER)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return TRANSFER_HEADER[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        proc = self.procs[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return self.display(proc, column)
+        if role == SORT_ROLE:
+            return self.sort_key(proc, column)
+        if role == PROGRESS_ROLE and column == RunningProcessHeader.Size.value:
+            return proc.trans_size / proc.total_size if proc.total_size else 0.0
+        if role == PROC_ROLE:
+            return proc
+        return None
+
+    def display(self, proc, column):
+        stats = self.stats.get(proc.id)
+        if column == RunningProcessHeader.Local.value:
+            return proc.local_file
+        if column == RunningProcessHeader.Direction.value:
+            return '<<--' if proc.download else '-->>'
+        if column == RunningProcessHeader.Remote.value:
+            return proc.remote_file
+        if column == RunningProcessHeader.Size.value:
+            return str(proc.trans_size) + "/" + str(proc.total_size)
+        if column == RunningProcessHeader.Rate.value:
+            if stats is None:
+                return '----'
+            import humanize  # slow to import, not needed before the first transfer
+            return humanize.naturalsize(stats.smoothed_rate) + "/s"
+        if column == RunningProcessHeader.ETA.value:
+            if stats is None or stats.eta is None:
+                return '----'
+            import humanize
+            return humanize.naturaldelta(timedelta(seconds=stats.eta))
+        if column == RunningProcessHeader.StartTime.value:
+            return '----' if proc.start_time is None else str(proc.start_time)
+        if column == RunningProcessHeader.EndTime.value:
+            return '----'
+        if column == RunningProcessHeader.Status.value:
+            if proc.mirror is not None:
+                return f'{proc.status.value} ({proc.files_done}/{proc.file_count} files)'
+            return proc.status.value
+        return None
+
+    def sort_key(self, proc, column):
+        stats = self.stats.get(proc.id)
+        if column == RunningProcessHeader.Size.value:
+            return proc.total_size
+        if column == RunningProcessHeader.Rate.value:
+            return 0.0 if stats is None else stats.smoothed_rate
+        if column == RunningProcessHeader.ETA.value:
+            return float('inf') if stats is None or stats.eta is None else stats.eta
+        if column == RunningProcessHeader.StartTime.value:
+            return proc.id
+        return self.display(proc, column)
+
+    def set_transfers(self, procs):
+        ids = set(proc.id for proc in procs)
+        removed = [row for row, proc in enumerate(self.procs) if proc.id not in ids]
+        if len(removed) > TRANSFER_TABLE_RESET:
+            # cheaper to rebuild than to announce every removed row
+            self.beginResetModel()
+            self.procs = list(procs)
+            self.rows = dict((proc.id, row) for row, proc in enumerate(self.procs))
+            self.stats = dict((i, self.stats[i]) for i in self.rows if i in self.stats)
+            self.endResetModel()
+            return
+
+        for row in reversed(removed):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.stats.pop(self.procs[row].id, None)
+            del self.procs[row]
+            self.endRemoveRows()
+        self.rows = dict((proc.id, row) for row, proc in enumerate(self.procs))
+
+        added = [proc for proc in procs if proc.id not in self.rows]
+        if added:
+            first = len(self.procs)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            for row, proc in enumerate(added, first):
+                self.procs.append(proc)
+                self.rows[proc.id] = row
+            self.endInsertRows()
+
+        # status of the remaining rows may have changed
+        if self.procs:
+            self.dataChanged.emit(self.index(0, RunningProcessHeader.Status.value),
+                                  self.index(len(self.procs) - 1, RunningProcessHeader.Status.value))
+
+    def update(self, updates):
+        rows = []
+        for update in updates:
+            row = self.rows.get(update.proc.id)
+            if row is None:
+                continue
+            self.stats[update.proc.id] = update
+            rows.append(row)
+
+        # one dataChanged per run of adjacent rows
+        rows.sort()
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or rows[i] != rows[i - 1] + 1:
+                self.dataChanged.emit(self.index(rows[start], RunningProcessHeader.Size.value),
+                                      self.index(rows[i - 1], RunningProcessHeader.Status.value))
+                start = i
+
+
+class FinishedTableModel(QAbstractTableModel):
+    # finished transfers only ever get appended, so each refresh inserts the new rows
+    # at the end and leaves the ones already shown alone
+    def __init__(self, parent=None):
+        super(FinishedTableModel, self).__init__(parent)
+        self.procs = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.procs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(FINISHED_HEADER)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return FINISHED_HEADER[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.display(self.procs[index.row()], index.column())
+        if role == PROC_ROLE:
+            return self.procs[index.row()]
+        return None
+
+    @staticmethod
+    def display(proc, column):
+        import humanize  # slow to import, not needed before the first transfer ends
+
+        if column == 0:
+            return proc.local_file
+        if column == 1:
+            return '<<--' if proc.download else '-->>'
+        if column == 2:
+            return proc.remote_file
+        if column == 3:
+            if proc.trans_size < proc.total_size:
+                return humanize.naturalsize(proc.trans_size) + "/" + humanize.naturalsize(proc.total_size)
+            return humanize.naturalsize(proc.total_size)
+        if column == 4:
+            return str(proc.start_time)
+        if column == 5:
+            return str(proc.end_time)
+        if column == 6:
+            return '----' if proc.start_time is None else humanize.naturaldelta(proc.end_time - proc.start_time)
+        if column == 7:
+            return proc.status.value
+        return None
+
+    def set_finished(self, procs):
+        shown = len(self.procs)
+        if len(procs) < shown or (shown and procs[shown - 1] is not self.procs[-1]):
+            # the list was cleared or replaced, not appended to
+            self.beginResetModel()
+            self.procs = list(procs)
+            self.endResetModel()
+            return
+
+        if len(procs) > shown:
+            self.beginInsertRows(QModelIndex(), shown, len(procs) - 1)
+            self.procs.extend(procs[shown:])
+            self.endInsertRows()
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    def paint(self, painter, option, index):
+        fraction = index.data(PROGRESS_ROLE)
+        if fraction is None:
+            super(ProgressDelegate, self).paint(painter, option, index)
+            return
+
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(1, 1, -1, -1)
+        bar.minimum = 0
+        bar.maximum = 1000
+        bar.progress = int(min(fraction, 1.0) * 1000)
+        bar.text = index.data(Qt.DisplayRole)
+        bar.textVisible = True
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
+
+
+class ActionDelegate(QStyledItemDelegate):
+    # draws the pause/resume and cancel buttons instead of creating a widget per row
+    labels = ('pause/resume', 'cancel')
+
+    def __init__(self, parent=None):
+        super(ActionDelegate, self).__init__(parent)
+        self.callbacks = (None, None)
+
+    def set_callbacks(self, pause_resume_callback, cancel_callback):
+        self.callbacks = (pause_resume_callback, cancel_callback)
+
+    @staticmethod
+    def button_rects(rect):
+        half = rect.width() // 2
+        return (QRect(rect.x(), rect.y(), half, rect.height()),
+                QRect(rect.x() + half, rect.y(), rect.width() - half, rect.height()))
+
+    def paint(self, painter, option, index):
+        for label, rect in zip(self.labels, self.button_rects(option.rect)):
+            button = QStyleOptionButton()
+            button.rect = rect.adjusted(1, 1, -1, -1)
+            button.text = label
+            button.state = QStyle.State_Enabled | QStyle.State_Raised
+            QApplication.style().drawControl(QStyle.CE_PushButton, button, painter)
+
+    def sizeHint(self, option, index):
+        return QSize(200, option.fontMetrics.height() + 10)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QEvent.MouseButtonRelease:
+            return False
+
+        proc = index.data(PROC_ROLE)
+        for callback, rect in zip(self.callbacks, self.button_rects(option.rect)):
+            if callback is not None and rect.contains(event.pos()):
+                callback(proc)
+                return True
+        return False
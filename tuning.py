@@ -0,0 +1,102 @@
+import socket
+import time
+
+from config import *
+
+
+class TransferTuner(object):
+    # chooses the read/write chunk size and SO_RCVBUF/SO_SNDBUF of data connections.
+    # A fixed profile sets both; 'auto' grows the chunk size from what reads return and
+    # leaves the buffers to the kernel: setting them pins the TCP window scale at the
+    # handshake and turns off the kernel's own buffer tuning
+    def __init__(self, profile=TUNING_PROFILE):
+        self.set_profile(profile)
+
+        self.rtt = None
+        self.throughput = 0.0
+        self.reason = 'initial'
+
+        self.window_start = 0.0
+        self.window_bytes = 0
+        self.window_reads = 0
+        self.window_full = 0
+
+    def set_profile(self, profile):
+        fixed = TUNING_PROFILES.get(profile)
+        self.profile = profile if profile in TUNING_PROFILES else 'auto'
+        self.adaptive = fixed is None
+        if self.adaptive:
+            self.chunk_size = RECV_BUF_SIZE
+            self.sock_buf = None  # what the kernel gave the last data connection
+        else:
+            self.chunk_size = fixed['chunk_size']
+            self.sock_buf = fixed['sock_buf']
+        self.max_chunk_size = TUNING_MAX_CHUNK if self.adaptive else self.chunk_size
+
+    def measure_rtt(self, seconds):
+        self.rtt = seconds if self.rtt is None else 0.8 * self.rtt + 0.2 * seconds
+
+    def apply(self, sock):
+        # before connect/listen, so that the window scale fits the buffer
+        if self.adaptive:
+            return
+        for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, opt, self.sock_buf)
+            except OSError:
+                pass
+
+    def start(self, sock):
+        if self.adaptive:
+            try:
+                self.sock_buf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            except OSError:
+                pass
+        self.window_start = time.monotonic()
+        self.window_bytes = self.window_reads = self.window_full = 0
+
+    def update(self, n, full):
+        # called once per chunk; cheap unless a measuring window has elapsed
+        self.window_bytes += n
+        self.window_reads += 1
+        self.window_full += full
+
+        if time.monotonic() - self.window_start >= TUNING_INTERVAL:
+            self.measure(adapt=self.adaptive)
+
+    def finish(self):
+        if self.window_bytes:
+            self.measure(adapt=False)
+
+    def measure(self, adapt):
+        now = time.monotonic()
+        elapsed = max(now - self.window_start, 1e-6)
+        rate = self.window_bytes / elapsed
+        self.throughput = rate if not self.throughput else 0.5 * self.throughput + 0.5 * rate
+
+        if adapt:
+            self.adapt()
+        self.window_start = now
+        self.window_bytes = self.window_reads = self.window_full = 0
+
+    def adapt(self):
+        # reads keep filling the whole chunk: data is waiting, read more per call
+        if self.window_full * 2 > self.window_reads and self.chunk_size < TUNING_MAX_CHUNK:
+            self.chunk_size = min(self.chunk_size * 2, TUNING_MAX_CHUNK)
+            self.reason = 'chunk full'
+
+    def stats(self):
+        return {
+            'profile': self.profile,
+            'chunk_size': self.chunk_size,
+            'sock_buf': self.sock_buf,
+            'rtt': self.rtt,
+            'throughput': self.throughput,
+            'reason': self.reason,
+        }
+
+    def describe(self):
+        rtt = 'unknown' if self.rtt is None else f'{self.rtt * 1000:.1f}ms'
+        sock_buf = 'kernel' if self.sock_buf is None else f'{self.sock_buf // 1024}KiB'
+        return f"tuning {self.profile}: chunk {self.chunk_size // 1024}KiB, socket buffer " \
+               f"{sock_buf}, rtt {rtt}, {self.throughput / 1024 / 1024:.1f}MiB/s ({self.reason})"
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# The layout of client.ui written out by hand in the shape pyuic5 gives it, so that
+# the window is built without parsing the .ui file at launch. Keep it in step with
+# client.ui; `pyuic5 client.ui -o ui_client.py` can replace it wholesale.
+
+
+from PyQt5 import QtCore, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(1256, 1023)
+        self.centralwidget = QtWidgets.QWidget(MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.verticalLayout_2 = QtWidgets.QVBoxLayout(self.centralwidget)
+        self.verticalLayout_2.setObjectName("verticalLayout_2")
+        self.horizontalLayout = QtWidgets.QHBoxLayout()
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.label = QtWidgets.QLabel(self.centralwidget)
+        self.label.setObjectName("label")
+        self.horizontalLayout.addWidget(self.label)
+        self.host = QtWidgets.QLineEdit(self.centralwidget)
+        self.host.setObjectName("host")
+        self.horizontalLayout.addWidget(self.host)
+        self.label_2 = QtWidgets.QLabel(self.centralwidget)
+        self.label_2.setObjectName("label_2")
+        self.horizontalLayout.addWidget(self.label_2)
+        self.username = QtWidgets.QLineEdit(self.centralwidget)
+        self.username.setObjectName("username")
+        self.horizontalLayout.addWidget(self.username)
+        self.label_3 = QtWidgets.QLabel(self.centralwidget)
+        self.label_3.setObjectName("label_3")
+        self.horizontalLayout.addWidget(self.label_3)
+        self.password = QtWidgets.QLineEdit(self.centralwidget)
+        self.password.setEchoMode(QtWidgets.QLineEdit.Password)
+        self.password.setObjectName("password")
+        self.horizontalLayout.addWidget(self.password)
+        self.label_4 = QtWidgets.QLabel(self.centralwidget)
+        self.label_4.setObjectName("label_4")
+        self.horizontalLayout.addWidget(self.label_4)
+        self.port = QtWidgets.QLineEdit(self.centralwidget)
+        self.port.setObjectName("port")
+        self.horizontalLayout.addWidget(self.port)
+        self.label_7 = QtWidgets.QLabel(self.centralwidget)
+        self.label_7.setObjectName("label_7")
+        self.horizontalLayout.addWidget(self.label_7)
+        self.PORT = QtWidgets.QRadioButton(self.centralwidget)
+        self.PORT.setChecked(True)
+        self.PORT.setObjectName("PORT")
+        self.horizontalLayout.addWidget(self.PORT)
+        self.PASV = QtWidgets.QRadioButton(self.centralwidget)
+        self.PASV.setChecked(False)
+        self.PASV.setObjectName("PASV")
+        self.horizontalLayout.addWidget(self.PASV)
+        self.connect = QtWidgets.QPushButton(self.centralwidget)
+        self.connect.setObjectName("connect")
+        self.horizontalLayout.addWidget(self.connect)
+        self.exit = QtWidgets.QPushButton(self.centralwidget)
+        self.exit.setObjectName("exit")
+        self.horizontalLayout.addWidget(self.exit)
+        self.verticalLayout_2.addLayout(self.horizontalLayout)
+        self.responses = QtWidgets.QTextBrowser(self.centralwidget)
+        self.responses.setMaximumSize(QtCore.QSize(16777215, 200))
+        self.responses.setObjectName("responses")
+        self.verticalLayout_2.addWidget(self.responses)
+        self.horizontalLayout_4 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_4.setObjectName("horizontalLayout_4")
+        self.verticalLayout = QtWidgets.QVBoxLayout()
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.horizontalLayout_2 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_2.setObjectName("horizontalLayout_2")
+        self.label_5 = QtWidgets.QLabel(self.centralwidget)
+        self.label_5.setObjectName("label_5")
+        self.horizontalLayout_2.addWidget(self.label_5)
+        self.localSite = QtWidgets.QLineEdit(self.centralwidget)
+        self.localSite.setObjectName("localSite")
+        self.horizontalLayout_2.addWidget(self.localSite)
+        self.localSiteBtn = QtWidgets.QPushButton(self.centralwidget)
+        self.localSiteBtn.setObjectName("localSiteBtn")
+        self.horizontalLayout_2.addWidget(self.localSiteBtn)
+        self.verticalLayout.addLayout(self.horizontalLayout_2)
+        self.horizontalLayout_7 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_7.setObjectName("horizontalLayout_7")
+        self.localCreateDir = QtWidgets.QPushButton(self.centralwidget)
+        self.localCreateDir.setObjectName("localCreateDir")
+        self.horizontalLayout_7.addWidget(self.localCreateDir)
+        self.upload = QtWidgets.QPushButton(self.centralwidget)
+        self.upload.setObjectName("upload")
+        self.horizontalLayout_7.addWidget(self.upload)
+        self.localRename = QtWidgets.QPushButton(self.centralwidget)
+        self.localRename.setObjectName("localRename")
+        self.horizontalLayout_7.addWidget(self.localRename)
+        self.localDelete = QtWidgets.QPushButton(self.centralwidget)
+        self.localDelete.setObjectName("localDelete")
+        self.horizontalLayout_7.addWidget(self.localDelete)
+        self.verticalLayout.addLayout(self.horizontalLayout_7)
+        self.localFileView = QtWidgets.QTreeView(self.centralwidget)
+        self.localFileView.setObjectName("localFileView")
+        self.verticalLayout.addWidget(self.localFileView)
+        self.horizontalLayout_4.addLayout(self.verticalLayout)
+        self.verticalLayout_3 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_3.setObjectName("verticalLayout_3")
+        self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        self.label_6 = QtWidgets.QLabel(self.centralwidget)
+        self.label_6.setObjectName("label_6")
+        self.horizontalLayout_3.addWidget(self.label_6)
+        self.remoteSite = QtWidgets.QLineEdit(self.centralwidget)
+        self.remoteSite.setObjectName("remoteSite")
+        self.horizontalLayout_3.addWidget(self.remoteSite)
+        self.remoteSiteBtn = QtWidgets.QPushButton(self.centralwidget)
+        self.remoteSiteBtn.setObjectName("remoteSiteBtn")
+        self.horizontalLayout_3.addWidget(self.remoteSiteBtn)
+        self.verticalLayout_3.addLayout(self.horizontalLayout_3)
+        self.horizontalLayout_6 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_6.setObjectName("horizontalLayout_6")
+        self.remoteCreateDir = QtWidgets.QPushButton(self.centralwidget)
+        self.remoteCreateDir.setObjectName("remoteCreateDir")
+        self.horizontalLayout_6.addWidget(self.remoteCreateDir)
+        self.download = QtWidgets.QPushButton(self.centralwidget)
+        self.download.setObjectName("download")
+        self.horizontalLayout_6.addWidget(self.download)
+        self.remoteRename = QtWidgets.QPushButton(self.centralwidget)
+        self.remoteRename.setObjectName("remoteRename")
+        self.horizontalLayout_6.addWidget(self.remoteRename)
+        self.remoteDelete = QtWidgets.QPushButton(self.centralwidget)
+        self.remoteDelete.setObjectName("remoteDelete")
+        self.horizontalLayout_6.addWidget(self.remoteDelete)
+        self.remoteRefresh = QtWidgets.QPushButton(self.centralwidget)
+        self.remoteRefresh.setObjectName("remoteRefresh")
+        self.horizontalLayout_6.addWidget(self.remoteRefresh)
+        self.remoteSync = QtWidgets.QPushButton(self.centralwidget)
+        self.remoteSync.setObjectName("remoteSync")
+        self.horizontalLayout_6.addWidget(self.remoteSync)
+        self.verticalLayout_3.addLayout(self.horizontalLayout_6)
+        self.remoteFileView = QtWidgets.QTreeView(self.centralwidget)
+        self.remoteFileView.setObjectName("remoteFileView")
+        self.verticalLayout_3.addWidget(self.remoteFileView)
+        self.horizontalLayout_4.addLayout(self.verticalLayout_3)
+        self.verticalLayout_2.addLayout(self.horizontalLayout_4)
+        self.tabWidget = QtWidgets.QTabWidget(self.centralwidget)
+        self.tabWidget.setObjectName("tabWidget")
+        self.tab = QtWidgets.QWidget()
+        self.tab.setObjectName("tab")
+        self.tabWidget.addTab(self.tab, "")
+        self.tab_2 = QtWidgets.QWidget()
+        self.tab_2.setObjectName("tab_2")
+        self.tabWidget.addTab(self.tab_2, "")
+        self.verticalLayout_2.addWidget(self.tabWidget)
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.menubar = QtWidgets.QMenuBar(MainWindow)
+        self.menubar.setGeometry(QtCore.QRect(0, 0, 1256, 22))
+        self.menubar.setObjectName("menubar")
+        MainWindow.setMenuBar(self.menubar)
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+
+        self.retranslateUi(MainWindow)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
+        self.label.setText(_translate("MainWindow", "Host:"))
+        self.label_2.setText(_translate("MainWindow", "Username:"))
+        self.label_3.setText(_translate("MainWindow", "Password:"))
+        self.label_4.setText(_translate("MainWindow", "Port:"))
+        self.label_7.setText(_translate("MainWindow", "Mode:"))
+        self.PORT.setText(_translate("MainWindow", "PORT"))
+        self.PASV.setText(_translate("MainWindow", "PASV"))
+        self.connect.setText(_translate("MainWindow", "Connect"))
+        self.exit.setText(_translate("MainWindow", "Exit"))
+        self.label_5.setText(_translate("MainWindow", "Local site:"))
+        self.localSiteBtn.setText(_translate("MainWindow", "Go"))
+        self.localCreateDir.setText(_translate("MainWindow", "Create directory"))
+        self.upload.setText(_translate("MainWindow", "Upload"))
+        self.localRename.setText(_translate("MainWindow", "Rename"))
+        self.localDelete.setText(_translate("MainWindow", "Delete"))
+        self.label_6.setText(_translate("MainWindow", "Remote site:"))
+        self.remoteSiteBtn.setText(_translate("MainWindow", "Go"))
+        self.remoteCreateDir.setText(_translate("MainWindow", "Create directory"))
+        self.download.setText(_translate("MainWindow", "Download"))
+        self.remoteRename.setText(_translate("MainWindow", "Rename"))
+        self.remoteDelete.setText(_translate("MainWindow", "Delete"))
+        self.remoteRefresh.setText(_translate("MainWindow", "Refresh"))
+        self.remoteSync.setText(_translate("MainWindow", "Sync"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab), _translate("MainWindow", "Tab 1"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_2), _translate("MainWindow", "Tab 2"))
@@ -1,18 +1,19 @@
-import threading
-import humanize
-from functools import partial
-
-from PyQt5.QtWidgets import QMainWindow, QTreeWidget, QTreeWidgetItem, QPushButton, QHeaderView, QHBoxLayout, QWidget
-from PyQt5.uic import loadUi
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QMainWindow, QTreeView, QHeaderView, QWidget, QTableView, QAbstractItemView, QLineEdit, \
+    QVBoxLayout, QHBoxLayout, QAction, QLabel, QSpinBox, QFileSystemModel
+from PyQt5.QtCore import Qt, QSortFilterProxyModel
 
 from config import *
+from remote_model import RemoteFileModel
+from transfer_table import TransferTableModel, FinishedTableModel, ProgressDelegate, ActionDelegate, SORT_ROLE, \
+    PROC_ROLE
+from ui_client import Ui_MainWindow
 
 
-class ClientUI(QMainWindow):
+class ClientUI(QMainWindow, Ui_MainWindow):
     def __init__(self):
         super(ClientUI, self).__init__()
-        loadUi("client.ui", self)
+        # client.ui as Python, parsing the .ui file on every launch is slow
+        self.setupUi(self)
         self.setWindowTitle("Simple Client")
 
         # quick DEBUG
@@ -26,103 +27,132 @@ class ClientUI(QMainWindow):
         self.password.setText("ssast")
         self.port.setText("21")
 
-        remote_header = ['Name', 'Size', 'Type', 'Last Modifed', 'Mode', 'Owner']
-        self.remoteFileWidget.setColumnCount(len(remote_header))
-        self.remoteFileWidget.setHeaderLabels(remote_header)
-        self.remoteFileWidget.header().setSectionResizeMode(0, QHeaderView.Stretch)
-        for col in range(1, len(remote_header)):
-            self.remoteFileWidget.header().setSectionResizeMode(col, QHeaderView.ResizeToContents)
-
-        self.transferWidget = QTreeWidget()
-        transfer_header = ['Server/Local File', 'Direction', 'Remote File', 'Size', 'Start Time', 'End Time', 'Status', 'Operation']
-        self.transferWidget.setColumnCount(len(transfer_header))
-        self.transferWidget.setHeaderLabels(transfer_header)
-        self.transferWidget.header().setSectionResizeMode(0, QHeaderView.Stretch)
-        self.transferWidget.header().setSectionResizeMode(1, QHeaderView.ResizeToContents)
-        self.transferWidget.header().setSectionResizeMode(2, QHeaderView.Stretch)
-        for col in range(3, len(transfer_header) - 1):
-            self.transferWidget.header().setSectionResizeMode(col, QHeaderView.ResizeToContents)
-        self.transferWidget.setColumnWidth(len(transfer_header) - 1, 0)
-
-        self.finishedWidget = QTreeWidget()
-        finished_header = ['Server/Local File', 'Direction', 'Remote File', 'Size', 'Start Time', 'End Time',
-                           'Elapsed time', 'Status']
-        self.finishedWidget.setColumnCount(len(finished_header))
-        self.finishedWidget.setHeaderLabels(finished_header)
+        # local file system, populated once the window is up (see ClientCtrl.populate_local_site)
+        self.localFileModel = QFileSystemModel(self)
+
+        self.remoteModel = RemoteFileModel(self)
+        self.remoteFileView.setModel(self.remoteModel)
+        self.remoteFileView.setUniformRowHeights(True)
+        self.remoteFileView.setSortingEnabled(True)
+        self.remoteFileView.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.remoteFileView.sortByColumn(FileHeader.Name.value, Qt.AscendingOrder)
+        self.remoteFileView.header().setSectionResizeMode(QHeaderView.Interactive)
+        self.remoteFileView.header().setSectionResizeMode(FileHeader.Name.value, QHeaderView.Stretch)
+
+        # running transfers: table model + proxy for sorting/filtering, rows drawn by delegates
+        self.transferModel = TransferTableModel(self)
+        self.transferProxy = QSortFilterProxyModel(self)
+        self.transferProxy.setSourceModel(self.transferModel)
+        self.transferProxy.setSortRole(SORT_ROLE)
+        self.transferProxy.setFilterKeyColumn(-1)
+        self.transferProxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.transferProxy.setDynamicSortFilter(False)
+
+        self.transferView = QTableView()
+        self.transferView.setModel(self.transferProxy)
+        self.transferView.setSortingEnabled(True)
+        self.transferView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.transferView.setWordWrap(False)
+        self.transferView.verticalHeader().hide()
+        self.transferView.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        header = self.transferView.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(RunningProcessHeader.Local.value, QHeaderView.Stretch)
+        header.setSectionResizeMode(RunningProcessHeader.Remote.value, QHeaderView.Stretch)
+        self.transferView.setColumnWidth(RunningProcessHeader.Btn.value, 200)
+
+        # queued transfers can be reordered and any transfer rate limited from the context menu
+        self.transferTop = QAction("Start next", self.transferView)
+        self.transferRaise = QAction("Raise priority", self.transferView)
+        self.transferLower = QAction("Lower priority", self.transferView)
+        self.transferLimit = QAction("Limit rate...", self.transferView)
+        self.transferView.setContextMenuPolicy(Qt.ActionsContextMenu)
+        self.transferView.addActions([self.transferTop, self.transferRaise, self.transferLower, self.transferLimit])
+
+        self.globalLimit = self.make_limit_box(RATE_LIMIT_GLOBAL)
+        self.serverLimit = self.make_limit_box(RATE_LIMIT_SERVER)
+
+        self.progressDelegate = ProgressDelegate(self.transferView)
+        self.actionDelegate = ActionDelegate(self.transferView)
+        self.transferView.setItemDelegateForColumn(RunningProcessHeader.Size.value, self.progressDelegate)
+        self.transferView.setItemDelegateForColumn(RunningProcessHeader.Btn.value, self.actionDelegate)
+
+        self.transferFilter = QLineEdit()
+        self.transferFilter.setPlaceholderText("filter transfers")
+        self.transferFilter.textChanged.connect(self.transferProxy.setFilterFixedString)
+
+        toolbar_layout = QHBoxLayout()
+        toolbar_layout.addWidget(self.transferFilter)
+        toolbar_layout.addWidget(QLabel("Total limit"))
+        toolbar_layout.addWidget(self.globalLimit)
+        toolbar_layout.addWidget(QLabel("Per server"))
+        toolbar_layout.addWidget(self.serverLimit)
+
+        self.transferWidget = QWidget()
+        transfer_layout = QVBoxLayout()
+        transfer_layout.setContentsMargins(0, 0, 0, 0)
+        transfer_layout.addLayout(toolbar_layout)
+        transfer_layout.addWidget(self.transferView)
+        self.transferWidget.setLayout(transfer_layout)
+
+        # finished transfers: rows are appended as transfers end, never rebuilt
+        self.finishedModel = FinishedTableModel(self)
+        self.finishedWidget = QTreeView()
+        self.finishedWidget.setModel(self.finishedModel)
+        self.finishedWidget.setRootIsDecorated(False)
+        self.finishedWidget.setUniformRowHeights(True)
         self.finishedWidget.header().setSectionResizeMode(0, QHeaderView.Stretch)
         self.finishedWidget.header().setSectionResizeMode(1, QHeaderView.ResizeToContents)
         self.finishedWidget.header().setSectionResizeMode(2, QHeaderView.Stretch)
-        for col in range(3, len(finished_header) - 1):
+        for col in range(3, self.finishedModel.columnCount() - 1):
             self.finishedWidget.header().setSectionResizeMode(col, QHeaderView.ResizeToContents)
-        self.finishedWidget.setColumnWidth(len(transfer_header) - 1, 0)
+        self.finishedWidget.setColumnWidth(self.finishedModel.columnCount() - 1, 0)
 
         self.tabWidget.clear()
         self.tabWidget.addTab(self.transferWidget, "Transferring")
         self.tabWidget.addTab(self.finishedWidget, "Finished")
 
+    @staticmethod
+    def make_limit_box(rate):
+        box = QSpinBox()
+        box.setRange(0, 10 ** 7)
+        box.setSingleStep(64)
+        box.setSuffix(" KiB/s")
+        box.setSpecialValueText("unlimited")
+        box.setValue(rate // 1024)
+        return box
+
     def refresh_remote_widget(self, files):
-        self.remoteFileWidget.clear()
-        for file in files:
-            self.remoteFileWidget.addTopLevelItem(QTreeWidgetItem(file))
+        self.remoteModel.set_entries(files)
+
+    def current_remote_node(self):
+        index = self.remoteFileView.currentIndex()
+        if not index.isValid():
+            return None
+        return self.remoteModel.node(index)
+
+    def selected_remote_nodes(self):
+        # top-most selected nodes only, a selected directory covers its selected children
+        nodes = [self.remoteModel.node(index) for index in self.remoteFileView.selectionModel().selectedRows()]
+        selected = set(id(node) for node in nodes)
+        result = []
+        for node in nodes:
+            parent = node.parent
+            while parent is not None and id(parent) not in selected:
+                parent = parent.parent
+            if parent is None:
+                result.append(node)
+        return result
 
     def refresh_transfer_widget(self, running_proc, pause_resume_callback, cancel_callback):
-        self.transferWidget.clear()
-        with threading.Lock():
-            for proc_name in running_proc:
-                proc = running_proc[proc_name]
-                item = QTreeWidgetItem([proc.local_file,
-                                        '<<--' if proc.download else '-->>',
-                                        proc.remote_file,
-                                        str(proc.trans_size) + "/" + str(proc.total_size),
-                                        # proc.start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                                        str(proc.start_time),
-                                        '----',
-                                        proc.status.value,
-                                        ])
-
-                btnWidget = QWidget()
-                layout = QHBoxLayout()
-                prBtn = QPushButton("pause/resume")
-                cancelBtn = QPushButton("cancel")
-                layout.addWidget(prBtn)
-                layout.addWidget(cancelBtn)
-                prBtn.clicked.connect(partial(pause_resume_callback, proc))
-                cancelBtn.clicked.connect(partial(cancel_callback, proc))
-                btnWidget.setLayout(layout)
-
-                # pbar = QProgressBar()
-                # pbar.setValue(100 * proc.trans_size / proc.total_size)
-
-                self.transferWidget.addTopLevelItem(item)
-                # self.transferWidget.setItemWidget(item, RunningProcessHeader.Progress.value, pbar)
-                self.transferWidget.setItemWidget(item, RunningProcessHeader.Btn.value, btnWidget)
-
-    def update_transfer_item(self, proc):
-        items = self.transferWidget.findItems(str(proc.start_time), Qt.MatchExactly,
-                                              RunningProcessHeader.StartTime.value)
-        for item in items:
-            item.setText(RunningProcessHeader.Size.value, str(proc.trans_size) + "/" + str(proc.total_size))
-            item.setText(RunningProcessHeader.Status.value, proc.status.value)
+        self.actionDelegate.set_callbacks(pause_resume_callback, cancel_callback)
+        self.transferModel.set_transfers(list(running_proc.values()))
+
+    def selected_transfers(self):
+        return [index.data(PROC_ROLE) for index in self.transferView.selectionModel().selectedRows()]
+
+    def update_transfer_items(self, updates):
+        self.transferModel.update(updates)
 
     def refresh_finished_widget(self, finished_proc):
-        self.finishedWidget.clear()
-        with threading.Lock():
-            for proc in finished_proc:
-                if proc.trans_size < proc.total_size:
-                    size_str = humanize.naturalsize(proc.trans_size) + "/" + humanize.naturalsize(proc.total_size)
-                else:
-                    size_str = humanize.naturalsize(proc.total_size)
-
-                item = QTreeWidgetItem([proc.local_file,
-                                        '<<--' if proc.download else '-->>',
-                                        proc.remote_file,
-                                        size_str,
-                                        # proc.start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                                        # proc.end_time.strftime("%Y-%m-%d %H:%M:%S"),
-                                        str(proc.start_time),
-                                        str(proc.end_time),
-                                        humanize.naturaldelta(proc.end_time - proc.start_time),
-                                        proc.status.value,
-                                        ])
-
-                self.finishedWidget.addTopLevelItem(item)
+        self.finishedModel.set_finished(finished_proc)
@@ -0,0 +1,145 @@
+import errno
+import os
+import threading
+from collections import deque
+
+from config import *
+
+
+def preallocate(fd, offset, length):
+    # reserve the blocks of the whole file at once, so that it ends up in a few large
+    # extents instead of growing write by write; False where the file system can't
+    if length <= 0 or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(fd, offset, length)
+    except OSError as e:
+        if e.errno in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+            return False
+        raise
+    return True
+
+
+class WriteBehindWriter(object):
+    # download sink: the socket thread copies each chunk into a bounded buffer and goes
+    # back to recv, a writer thread empties the buffer with large pwrite()s. The socket
+    # thread only waits for the disk when `buffer_size` bytes are already waiting.
+    # on_written(n) reports what reached the file, which is what a resume can count on
+    def __init__(self, path, offset=0, size=None, on_written=None, buffer_size=WRITER_BUFFER_SIZE,
+                 coalesce=WRITER_COALESCE, fsync=WRITER_FSYNC):
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if offset == 0 else 0), 0o644)
+        try:
+            self.preallocated = size is not None and preallocate(self.fd, offset, size - offset)
+        except OSError:
+            os.close(self.fd)
+            raise
+        self.position = offset  # end of what has been written
+        self.on_written = on_written
+        self.buffer_size = buffer_size
+        self.coalesce = coalesce
+        self.fsync = fsync
+        self.unsynced = 0
+
+        self.pending = deque()
+        self.buffered = 0
+        self.closing = False
+        self.error = None
+        self.cond = threading.Condition()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def write(self, data):
+        with self.cond:
+            while self.buffered >= self.buffer_size and self.error is None:
+                self.cond.wait()
+            if self.error is not None:
+                raise self.error
+            self.pending.append(bytes(data))
+            self.buffered += len(data)
+            self.cond.notify_all()
+
+    def consumer(self, is_running):
+        # a retr() consumer; progress comes from on_written, not from here
+        def consume(view):
+            self.write(view)
+            return is_running()
+
+        return consume
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                # whatever piled up while the last write ran goes out as one
+                batch = []
+                n = 0
+                while self.pending and n < self.coalesce:
+                    batch.append(self.pending.popleft())
+                    n += len(batch[-1])
+
+            try:
+                self.pwrite(batch)
+                self.sync(n)
+            except OSError as e:
+                with self.cond:
+                    self.error = e
+                    self.pending.clear()
+                    self.buffered = 0
+                    self.cond.notify_all()
+                return
+
+            with self.cond:
+                self.buffered -= n
+                self.cond.notify_all()
+            if self.on_written is not None:
+                self.on_written(n)
+
+    def pwrite(self, batch):
+        views = [memoryview(data) for data in batch]
+        while views:
+            if hasattr(os, 'pwritev'):
+                written = os.pwritev(self.fd, views[:WRITER_MAX_IOV], self.position)
+            else:
+                written = os.pwrite(self.fd, views[0], self.position)
+            if not written:
+                # the disk took nothing, trying again would spin
+                raise OSError(errno.EIO, f"short write at offset {self.position}")
+            self.position += written
+            # drop what went out, a short write leaves part of a buffer behind
+            while views and written >= len(views[0]):
+                written -= len(views[0])
+                views.pop(0)
+            if views and written:
+                views[0] = views[0][written:]
+
+    def sync(self, n):
+        if self.fsync != 'interval':
+            return
+        self.unsynced += n
+        if self.unsynced >= WRITER_FSYNC_BYTES:
+            if hasattr(os, 'fdatasync'):
+                os.fdatasync(self.fd)
+            else:
+                os.fsync(self.fd)
+            self.unsynced = 0
+
+    def close(self):
+        # waits until everything handed over is written; a preallocated file is cut
+        # back to what was received, so a later resume sees its real length
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.worker.join()
+        try:
+            if self.error is None:
+                if self.preallocated and os.fstat(self.fd).st_size > self.position:
+                    os.ftruncate(self.fd, self.position)
+                if self.fsync in ('close', 'interval'):
+                    os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+        if self.error is not None:
+            raise self.error